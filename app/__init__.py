@@ -1,15 +1,21 @@
 # proyojo/app/__init__.py
 
 import os
+import logging
+import threading
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
 from flask_login import LoginManager
-from config import Config
+from config import Config, config_by_name
+from .startup import StartupProfile, startup_mode, cli_command, ROUTE_COMMANDS, MIGRATE_COMMANDS
+
+logger = logging.getLogger(__name__)
+
+_blueprints_lock = threading.Lock()
 
 # 1. Creación de instancias de extensiones (sin inicializar)
+#    Flask-Migrate (y con él Alembic) solo se carga para los comandos CLI
 db = SQLAlchemy()
-migrate = Migrate()
 login_manager = LoginManager()
 
 # 2. Configuración de LoginManager
@@ -19,22 +25,93 @@ login_manager.login_message = 'Por favor, inicia sesión para acceder a esta pá
 login_manager.login_message_category = 'warning'
 
 
-def create_app(config_class=Config):
+def register_blueprints(app):
+    """Importa y registra los Blueprints (una sola vez)."""
+    with _blueprints_lock:
+        if 'auth' in app.blueprints:
+            return
+        with app.app_context():
+            from .blueprints import auth, dashboard, robot, api, admin
+            app.register_blueprint(auth.auth_bp)
+            app.register_blueprint(dashboard.dashboard_bp)
+            app.register_blueprint(robot.robot_bp)
+            app.register_blueprint(api.api_bp)
+            app.register_blueprint(admin.admin_bp)
+
+
+class LazyBlueprints:
+    """
+    Middleware WSGI que registra los Blueprints con la primera petición.
+
+    Se usa en modo CLI: un `flask db upgrade` no necesita importar las
+    vistas, pero si el proceso llega a atender peticiones (p. ej. el
+    cliente de pruebas) las rutas se registran antes de despachar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi_app = app.wsgi_app
+
+    def __call__(self, environ, start_response):
+        register_blueprints(self.app)
+        self.app.wsgi_app = self.wsgi_app
+        return self.wsgi_app(environ, start_response)
+
+
+def create_app(config_class=None):
     """
     Fábrica de la aplicación Flask.
+    
+    Si no se indica config_class, el perfil se elige con la variable de
+    entorno FLASK_CONFIG ('development', 'production'); por defecto Config.
+    
+    En modo CLI (cualquier comando de `flask` salvo `run`) no se conecta
+    MQTT, no se arrancan los hilos en segundo plano y las vistas se
+    importan hasta la primera petición (ver app/startup.py).
     """
-    # 3. Creación y configuración de la instancia de la app
-    app = Flask(__name__, instance_relative_config=True)
-    app.config.from_object(config_class)
+    profile = StartupProfile()
+
+    with profile.phase('config'):
+        if config_class is None:
+            config_name = os.environ.get('FLASK_CONFIG') or 'default'
+            config_class = config_by_name.get(config_name, Config)
+        
+        # 3. Creación y configuración de la instancia de la app
+        app = Flask(__name__, instance_relative_config=True)
+        app.config.from_object(config_class)
+        # Sin base de datos configurada (producción sin DATABASE_URL) no se arranca
+        if not app.config.get('SQLALCHEMY_DATABASE_URI'):
+            raise RuntimeError(f"{config_class.__name__} requiere la variable de entorno DATABASE_URL")
+
+    mode = startup_mode(app)
+    web = mode == 'web'
+    command = cli_command()
+    app.extensions['startup'] = {'mode': mode, 'profile': profile}
 
     # 4. Inicialización de las extensiones con la app
-    db.init_app(app)
-    migrate.init_app(app, db)
-    login_manager.init_app(app)
+    with profile.phase('extensions'):
+        db.init_app(app)
+        login_manager.init_app(app)
+        from .rate_limit import rate_limiter
+        rate_limiter.init_app(app)
+        if not web and (command is None or command in MIGRATE_COMMANDS):
+            from flask_migrate import Migrate
+            Migrate(app, db)
+    
+    # 4a. Modo de concurrencia de SQLite (WAL + PRAGMA) y escritor en segundo plano
+    with profile.phase('database'):
+        from .database import configure_sqlite, db_writer
+        with app.app_context():
+            configure_sqlite(app, db.engine)
+        db_writer.init_app(app)
     
-    # 4b. Inicialización del cliente MQTT
-    from .mqtt_client import mqtt_client
-    mqtt_client.init_app(app)
+    # 4b. Inicialización del cliente MQTT (solo se conecta en modo web;
+    #     en modo CLI se conecta al publicar por primera vez)
+    with profile.phase('mqtt'):
+        from .mqtt_client import mqtt_client
+        from .command_ack import command_acks
+        command_acks.init_app(app)
+        mqtt_client.init_app(app, connect=web and app.config.get('MQTT_ENABLED', True))
 
     # 5. Creación de la carpeta 'instance' si no existe
     try:
@@ -42,24 +119,71 @@ def create_app(config_class=Config):
     except OSError:
         pass
 
+    # 5b. Archivos estáticos con huella y caché inmutable (flask build-assets)
+    with profile.phase('assets'):
+        from .assets import assets
+        assets.init_app(app)
+
     # 6. Registro de los Blueprints (módulos de la aplicación)
-    with app.app_context():
-        from .blueprints import auth, dashboard, robot, api, admin
-        app.register_blueprint(auth.auth_bp)
-        app.register_blueprint(dashboard.dashboard_bp)
-        app.register_blueprint(robot.robot_bp)
-        app.register_blueprint(api.api_bp)
-        app.register_blueprint(admin.admin_bp)
-
-    # 7. Registro de los Comandos CLI
-    from .commands import seed_roles_command, create_admin_command, create_robot_command, seed_emergency_contacts_command
-    app.cli.add_command(seed_roles_command)
-    app.cli.add_command(create_admin_command)
-    app.cli.add_command(create_robot_command)
-    app.cli.add_command(seed_emergency_contacts_command)
-
-    # 8. Importar los modelos para que SQLAlchemy y Flask-Migrate los reconozcan
-    from . import models
+    with profile.phase('blueprints'):
+        if web or command in ROUTE_COMMANDS:
+            register_blueprints(app)
+        else:
+            app.wsgi_app = LazyBlueprints(app)
+
+    # 7. Registro de los Comandos CLI (el servidor web no los usa)
+    with profile.phase('cli'):
+        if not web:
+            from .commands import seed_roles_command, create_admin_command, create_robot_command, seed_emergency_contacts_command, build_assets_command, bench_startup_command, import_command, export_command, extend_reminders_command, prune_audit_log_command
+            app.cli.add_command(seed_roles_command)
+            app.cli.add_command(create_admin_command)
+            app.cli.add_command(create_robot_command)
+            app.cli.add_command(seed_emergency_contacts_command)
+            app.cli.add_command(build_assets_command)
+            app.cli.add_command(bench_startup_command)
+            app.cli.add_command(import_command)
+            app.cli.add_command(export_command)
+            app.cli.add_command(extend_reminders_command)
+            app.cli.add_command(prune_audit_log_command)
+
+    with profile.phase('models'):
+        # 8. Importar los modelos para que SQLAlchemy y Flask-Migrate los reconozcan
+        from . import models
+
+        # 8b. Contadores materializados del panel de administración
+        from .admin_stats import admin_stats
+        admin_stats.init_app(app, db, background=web)
+
+        # 8c. Índice de búsqueda de contactos (sincronizado con la sesión)
+        from .contact_search import contact_search
+        contact_search.init_app(app, db)
+
+        # 8c2. Ventana de ocurrencias de recordatorios repetidos
+        from .reminder_occurrences import reminder_occurrences
+        reminder_occurrences.init_app(app, background=web)
+
+    with profile.phase('caches'):
+        # 8d. Caché HTTP por versiones de datos (ETag / 304)
+        from .response_cache import response_cache
+        response_cache.init_app(app, db)
+
+        # 8e. Caché de fragmentos de plantilla ({% cache %})
+        from .fragment_cache import fragment_cache
+        fragment_cache.init_app(app)
+
+    with profile.phase('audit'):
+        # 8f. Bitácora de auditoría (el hilo de escritura arranca con la primera entrada)
+        from .audit_log import audit_log
+        audit_log.init_app(app)
+
+    with profile.phase('video'):
+        # 8g. Búfer de video, detección de movimiento y transmisión en vivo (solo abren las cámaras en modo web)
+        from .video_buffer import video_recorder
+        video_recorder.init_app(app, background=web)
+        from .motion import motion_detector
+        motion_detector.init_app(app, background=web)
+        from .live_stream import live_streams
+        live_streams.init_app(app)
 
     # 9. Configuración del cargador de usuario para Flask-Login
     @login_manager.user_loader
@@ -71,4 +195,7 @@ def create_app(config_class=Config):
     def test_page():
         return "<h1>¡La fábrica de aplicaciones funciona correctamente!</h1>"
 
+    if app.config.get('STARTUP_PROFILE'):
+        logger.info(f"Modo de arranque: {mode}\n{profile.report()}")
+
     return app
\ No newline at end of file
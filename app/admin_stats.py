@@ -0,0 +1,142 @@
+# proyojo/app/admin_stats.py
+
+import time
+import logging
+import threading
+from datetime import datetime
+from sqlalchemy import event, inspect, update, func
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ('total_users', 'active_users', 'total_robots', 'public_robots')
+
+
+def _user_deltas(user, sign, deltas):
+    deltas['total_users'] += sign
+    if user.is_active is not False:
+        deltas['active_users'] += sign
+
+
+def _robot_deltas(robot, sign, deltas):
+    deltas['total_robots'] += sign
+    if robot.is_public is not False:
+        deltas['public_robots'] += sign
+
+
+def _toggle_delta(obj, attr, counter, deltas):
+    """Suma o resta según el cambio de un booleano (activar/desactivar)."""
+    history = inspect(obj).attrs[attr].history
+    # Sin valor anterior cargado no se puede saber el cambio: lo corrige la reconciliación
+    if not history.added or not history.deleted:
+        return
+    old, new = history.deleted[0], history.added[0]
+    if bool(old) != bool(new):
+        deltas[counter] += 1 if new else -1
+
+
+class AdminStats:
+    """
+    Contadores materializados del panel de administración.
+
+    Los totales de usuarios y robots viven en la tabla admin_counter y se
+    actualizan en la misma transacción que los crea, elimina o activa
+    (evento after_flush de SQLAlchemy). El panel lee una sola tabla
+    pequeña en lugar de hacer count() sobre tablas completas. Un hilo
+    reconcilia periódicamente contra los conteos reales por si hubo
+    cambios fuera del ORM (p. ej. actualizaciones masivas).
+    """
+
+    def __init__(self):
+        self.app = None
+        self.reconcile_interval = 3600
+        self._worker = None
+        self._listening = False
+
+    def init_app(self, app, db, background=True):
+        """background=False (comandos CLI) no arranca el hilo de reconciliación."""
+        self.app = app
+        self.reconcile_interval = app.config.get('ADMIN_STATS_RECONCILE_INTERVAL',
+                                                 self.reconcile_interval)
+        if not self._listening:
+            event.listen(db.session, 'after_flush', self._after_flush)
+            self._listening = True
+        if background and self._worker is None and self.reconcile_interval:
+            self._worker = threading.Thread(target=self._run, name='admin-stats', daemon=True)
+            self._worker.start()
+
+    def get(self):
+        """Devuelve los contadores; si aún no existen, los calcula."""
+        from app.models import AdminCounter
+
+        values = {row.name: row.value for row in AdminCounter.query.all()}
+        if any(name not in values for name in COUNTERS):
+            values = self.reconcile()
+        return values
+
+    def reconcile(self):
+        """Recalcula los contadores con count() reales y los guarda."""
+        from app import db
+        from app.models import User, Robot, AdminCounter
+
+        values = {
+            'total_users': db.session.query(func.count(User.id)).scalar(),
+            'active_users': db.session.query(func.count(User.id))
+                                      .filter(User.is_active.isnot(False)).scalar(),
+            'total_robots': db.session.query(func.count(Robot.id)).scalar(),
+            'public_robots': db.session.query(func.count(Robot.id))
+                                       .filter(Robot.is_public.isnot(False)).scalar(),
+        }
+        now = datetime.utcnow()
+        for name, value in values.items():
+            counter = db.session.get(AdminCounter, name)
+            if counter is None:
+                db.session.add(AdminCounter(name=name, value=value, updated_at=now))
+            elif counter.value != value:
+                logger.info(f"Contador {name} reconciliado: {counter.value} -> {value}")
+                counter.value = value
+                counter.updated_at = now
+        db.session.commit()
+        return values
+
+    def _after_flush(self, session, flush_context):
+        from app.models import User, Robot, AdminCounter
+
+        deltas = dict.fromkeys(COUNTERS, 0)
+        for obj in session.new:
+            if isinstance(obj, User):
+                _user_deltas(obj, 1, deltas)
+            elif isinstance(obj, Robot):
+                _robot_deltas(obj, 1, deltas)
+        for obj in session.deleted:
+            if isinstance(obj, User):
+                _user_deltas(obj, -1, deltas)
+            elif isinstance(obj, Robot):
+                _robot_deltas(obj, -1, deltas)
+        for obj in session.dirty:
+            if isinstance(obj, User):
+                _toggle_delta(obj, 'is_active', 'active_users', deltas)
+            elif isinstance(obj, Robot):
+                _toggle_delta(obj, 'is_public', 'public_robots', deltas)
+
+        table = AdminCounter.__table__
+        connection = session.connection()
+        for name, delta in deltas.items():
+            if delta:
+                connection.execute(
+                    update(table)
+                    .where(table.c.name == name)
+                    .values(value=table.c.value + delta, updated_at=datetime.utcnow())
+                )
+
+    def _run(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                with self.app.app_context():
+                    self.reconcile()
+            except Exception as e:
+                logger.error(f"Error al reconciliar contadores de administración: {str(e)}")
+
+
+# Instancia global de las estadísticas de administración
+admin_stats = AdminStats()
@@ -0,0 +1,384 @@
+# proyojo/app/assets.py
+
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import mimetypes
+from jinja2.ext import Extension
+from flask import request, send_from_directory, url_for, abort
+
+logger = logging.getLogger(__name__)
+
+# Carpeta (dentro de static) donde se generan los archivos con huella
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+
+# Tipos que vale la pena precomprimir
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+IMAGES = {'.png', '.jpg', '.jpeg'}
+
+# Un año: los nombres con huella nunca cambian de contenido
+IMMUTABLE_MAX_AGE = 31536000
+
+# url(...) dentro de las hojas de estilo
+CSS_URL_RE = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+# Bloques <style>/<script> en línea sin atributos
+INLINE_RE = re.compile(r'<(style|script)>(.*?)</\1>', re.S)
+
+
+def _hashed_name(relative_path, content):
+    """'css/layout.css' -> 'dist/css/layout.3f2a9c01d4.css'"""
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    stem, ext = os.path.splitext(relative_path)
+    return f'{DIST_DIR}/{stem}.{digest}{ext}'
+
+
+def _write(static_folder, name, content):
+    path = os.path.join(static_folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def _precompress(static_folder, name, content):
+    """Genera .gz (y .br si está instalado brotli) solo si reducen el tamaño."""
+    encodings = []
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        _write(static_folder, name + '.gz', compressed)
+        encodings.append('gzip')
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    if brotli is not None:
+        compressed = brotli.compress(content, quality=11)
+        if len(compressed) < len(content):
+            _write(static_folder, name + '.br', compressed)
+            encodings.append('br')
+    return encodings
+
+
+def _image_derivatives(static_folder, relative_path, content, widths, quality):
+    """
+    Genera la versión WebP y copias redimensionadas de una imagen.
+
+    Requiere Pillow; sin él solo se copian los originales con huella.
+
+    Returns:
+        tuple: (webp, sizes) donde webp es el nombre WebP del original (o
+        None) y sizes es una lista de (ancho, nombre, nombre_webp)
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None, []
+
+    import io
+
+    def encode(image, fmt):
+        buffer = io.BytesIO()
+        if fmt == 'WEBP':
+            image.save(buffer, 'WEBP', quality=quality, method=6)
+        elif fmt == 'JPEG':
+            image.convert('RGB').save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(buffer, 'PNG', optimize=True)
+        return buffer.getvalue()
+
+    stem, ext = os.path.splitext(relative_path)
+    fmt = 'JPEG' if ext.lower() in ('.jpg', '.jpeg') else 'PNG'
+
+    with Image.open(io.BytesIO(content)) as original:
+        original.load()
+        webp_data = encode(original, 'WEBP')
+        webp = None
+        if len(webp_data) < len(content):
+            webp = _hashed_name(stem + '.webp', webp_data)
+            _write(static_folder, webp, webp_data)
+
+        sizes = []
+        for width in sorted(widths):
+            if width >= original.width:
+                break
+            height = round(original.height * width / original.width)
+            resized = original.resize((width, height), Image.LANCZOS)
+            data = encode(resized, fmt)
+            name = _hashed_name(f'{stem}-{width}w{ext}', data)
+            _write(static_folder, name, data)
+            data_webp = encode(resized, 'WEBP')
+            name_webp = _hashed_name(f'{stem}-{width}w.webp', data_webp)
+            _write(static_folder, name_webp, data_webp)
+            sizes.append((width, name, name_webp))
+    return webp, sizes
+
+
+def build_assets(static_folder, widths=(240, 480, 960, 1920), quality=80):
+    """
+    Construye los archivos estáticos con huella en static/dist.
+
+    - Cada archivo se copia como nombre.<hash>.ext (el hash es del contenido)
+    - Las referencias url(...) de las hojas de estilo se reescriben a los
+      nombres con huella, así el CSS también cambia de hash si cambia una imagen
+    - CSS/JS se precomprimen en .gz y .br
+    - Las imágenes tienen derivados WebP y redimensionados (con Pillow)
+
+    Returns:
+        dict: El manifiesto generado
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+
+    sources = []
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist]
+        for filename in files:
+            full = os.path.join(root, filename)
+            sources.append(os.path.relpath(full, static_folder).replace(os.sep, '/'))
+
+    manifest = {'files': {}, 'encodings': {}, 'webp': {}, 'sizes': {}}
+
+    # Primero lo que no es CSS, para que las hojas de estilo puedan apuntar
+    # a los nombres con huella de las imágenes
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+    for relative_path in sources:
+        with open(os.path.join(static_folder, relative_path), 'rb') as f:
+            content = f.read()
+        ext = os.path.splitext(relative_path)[1].lower()
+
+        if ext == '.css':
+            content = _rewrite_css_urls(relative_path, content, manifest['files'])
+
+        name = _hashed_name(relative_path, content)
+        _write(static_folder, name, content)
+        manifest['files'][relative_path] = name
+
+        if ext in COMPRESSIBLE:
+            encodings = _precompress(static_folder, name, content)
+            if encodings:
+                manifest['encodings'][name] = encodings
+        elif ext in IMAGES:
+            webp, sizes = _image_derivatives(static_folder, relative_path, content, widths, quality)
+            if webp:
+                manifest['webp'][name] = webp
+            if sizes:
+                manifest['sizes'][relative_path] = {str(width): resized for width, resized, _ in sizes}
+                for _, resized, resized_webp in sizes:
+                    manifest['webp'][resized] = resized_webp
+
+    with open(os.path.join(dist, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def _rewrite_css_urls(css_path, content, files):
+    """Reescribe url(/static/...) y url(../img/...) a la ruta con huella."""
+    css_dir = os.path.dirname(css_path)
+
+    def replace(match):
+        quote, target = match.groups()
+        if target.startswith(('data:', 'http:', 'https:', '//', '#')):
+            return match.group(0)
+        path = target.split('?')[0].split('#')[0]
+        if path.startswith('/static/'):
+            logical = path[len('/static/'):]
+        elif path.startswith('/'):
+            return match.group(0)
+        else:
+            logical = os.path.normpath(os.path.join(css_dir, path)).replace(os.sep, '/')
+        hashed = files.get(logical)
+        if hashed is None:
+            return match.group(0)
+        return f'url({quote}/static/{hashed}{quote})'
+
+    return CSS_URL_RE.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+
+class AssetPipeline:
+    """
+    Sirve los archivos estáticos con huella generados por `flask build-assets`.
+
+    Con el manifiesto presente, url_for('static', filename='css/layout.css')
+    devuelve automáticamente la ruta con huella (dist/css/layout.<hash>.css),
+    que se sirve con Cache-Control inmutable de un año. Según las cabeceras
+    del navegador se entrega la variante .br/.gz o la versión WebP de las
+    imágenes. Sin manifiesto todo funciona como la ruta estática normal.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.manifest = None
+        self.hashed = set()
+
+    def init_app(self, app):
+        self.app = app
+        self.load()
+
+        app.url_defaults(self._fingerprint)
+        app.view_functions['static'] = self.send_static
+        app.jinja_env.globals['asset_url'] = self.asset_url
+
+        if app.config.get('ASSETS_EXTRACT_INLINE', True):
+            app.jinja_env.add_extension(InlineAssetExtension)
+            app.jinja_env.inline_assets_dir = (app.config.get('INLINE_ASSETS_DIR')
+                                               or os.path.join(app.instance_path, 'inline_assets'))
+            app.add_url_rule('/assets/inline/<path:filename>', 'inline_asset', self.send_inline)
+
+    def load(self):
+        """Lee el manifiesto (si se construyeron los assets)."""
+        path = os.path.join(self.app.static_folder, DIST_DIR, MANIFEST_NAME)
+        self.manifest = None
+        self.hashed = set()
+        if not self.app.config.get('ASSETS_FINGERPRINT', True) or not os.path.exists(path):
+            return
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"No se pudo leer el manifiesto de assets: {str(e)}")
+            return
+        self.hashed = set(self.manifest['files'].values())
+        for sizes in self.manifest['sizes'].values():
+            self.hashed.update(sizes.values())
+        self.hashed.update(self.manifest['webp'].values())
+        logger.info(f"Assets con huella cargados: {len(self.manifest['files'])} archivos")
+
+    def _fingerprint(self, endpoint, values):
+        """url_defaults: cambia filename por su versión con huella."""
+        if endpoint != 'static' or not self.manifest:
+            return
+        filename = values.get('filename')
+        hashed = self.manifest['files'].get(filename)
+        if hashed:
+            values['filename'] = hashed
+
+    def asset_url(self, filename, width=None):
+        """
+        url_for('static', ...) con soporte de tamaño para imágenes.
+
+        Con width se elige el derivado más pequeño que cubra ese ancho
+        (p. ej. width=200 para una miniatura de 100px en pantallas 2x).
+        """
+        if width and self.manifest:
+            sizes = self.manifest['sizes'].get(filename, {})
+            candidates = sorted(int(w) for w in sizes if int(w) >= width)
+            if candidates:
+                return url_for('static', filename=sizes[str(candidates[0])])
+        return url_for('static', filename=filename)
+
+    def send_static(self, filename):
+        """Vista de /static: variantes precomprimidas y caché inmutable."""
+        if filename not in self.hashed:
+            return self.app.send_static_file(filename)
+
+        served = filename
+        vary = []
+        mimetype = mimetypes.guess_type(filename)[0]
+
+        webp = self.manifest['webp'].get(filename)
+        if webp:
+            vary.append('Accept')
+            if 'image/webp' in request.headers.get('Accept', ''):
+                served, mimetype = webp, 'image/webp'
+
+        encoding = None
+        encodings = self.manifest['encodings'].get(filename, ())
+        if encodings:
+            vary.append('Accept-Encoding')
+            accepted = request.accept_encodings
+            if 'br' in encodings and accepted['br']:
+                encoding = 'br'
+            elif 'gzip' in encodings and accepted['gzip']:
+                encoding = 'gzip'
+            if encoding:
+                served += '.br' if encoding == 'br' else '.gz'
+
+        return _send_immutable(self.app.static_folder, served, mimetype, encoding, vary)
+
+    def send_inline(self, filename):
+        """Vista de /assets/inline: CSS/JS extraídos de las plantillas."""
+        directory = self.app.jinja_env.inline_assets_dir
+        if not directory or not os.path.exists(os.path.join(directory, filename)):
+            abort(404)
+        served, encoding = filename, None
+        if request.accept_encodings['gzip'] and os.path.exists(os.path.join(directory, filename + '.gz')):
+            served, encoding = filename + '.gz', 'gzip'
+        return _send_immutable(directory, served, mimetypes.guess_type(filename)[0],
+                               encoding, ['Accept-Encoding'])
+
+
+def _send_immutable(directory, filename, mimetype, encoding, vary):
+    response = send_from_directory(directory, filename, mimetype=mimetype,
+                                   max_age=IMMUTABLE_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if vary:
+        response.vary.update(vary)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+class InlineAssetExtension(Extension):
+    """
+    Extrae los <style> y <script> en línea de las plantillas a archivos.
+
+    Al compilar cada plantilla (una vez por proceso), los bloques sin
+    atributos y sin sintaxis de Jinja se guardan en INLINE_ASSETS_DIR con
+    el hash de su contenido como nombre y se sustituyen por un <link> o
+    <script src>. El navegador los guarda en caché de forma permanente y
+    cada página deja de reenviarlos y de renderizarlos. Los bloques que
+    usan variables de la plantilla se quedan en línea.
+    """
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(inline_assets_dir=None)
+
+    def preprocess(self, source, name, filename=None):
+        directory = self.environment.inline_assets_dir
+        if not directory:
+            return source
+
+        def replace(match):
+            tag, body = match.groups()
+            if not body.strip() or '{{' in body or '{%' in body or '{#' in body:
+                return match.group(0)
+            ext = '.css' if tag == 'style' else '.js'
+            content = body.strip().encode('utf-8')
+            asset = hashlib.sha256(content).hexdigest()[:16] + ext
+            try:
+                _store_inline(directory, asset, content)
+            except OSError as e:
+                logger.error(f"No se pudo extraer un bloque en línea de {name}: {str(e)}")
+                return match.group(0)
+            url = "{{ url_for('inline_asset', filename='" + asset + "') }}"
+            if tag == 'style':
+                return f'<link rel="stylesheet" href="{url}">'
+            return f'<script src="{url}"></script>'
+
+        return INLINE_RE.sub(replace, source)
+
+
+def _store_inline(directory, asset, content):
+    """Escribe el archivo (y su .gz) una sola vez; el nombre es su hash."""
+    path = os.path.join(directory, asset)
+    if os.path.exists(path):
+        return
+    os.makedirs(directory, exist_ok=True)
+    for target, data in ((path + '.gz', gzip.compress(content, compresslevel=9, mtime=0)),
+                         (path, content)):
+        temporary = f'{target}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, target)
+
+
+# Instancia global del pipeline de archivos estáticos
+assets = AssetPipeline()
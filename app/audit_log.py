@@ -0,0 +1,349 @@
+# proyojo/app/audit_log.py
+
+import os
+import re
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timedelta
+from flask import has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r'^audit-(\d{6})\.db$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_entry (
+    id INTEGER PRIMARY KEY,
+    created_at REAL NOT NULL,
+    action TEXT NOT NULL,
+    user_id INTEGER,
+    robot_id INTEGER,
+    target TEXT,
+    status TEXT,
+    details TEXT,
+    remote_addr TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_audit_robot ON audit_entry (robot_id, id);
+CREATE INDEX IF NOT EXISTS ix_audit_user ON audit_entry (user_id, id);
+CREATE INDEX IF NOT EXISTS ix_audit_action ON audit_entry (action, id);
+CREATE INDEX IF NOT EXISTS ix_audit_created ON audit_entry (created_at);
+"""
+
+COLUMNS = ('created_at', 'action', 'user_id', 'robot_id', 'target', 'status', 'details', 'remote_addr')
+INSERT = f"INSERT INTO audit_entry ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+def _month_key(timestamp):
+    """Segmento (AAAAMM) al que pertenece un instante UTC."""
+    return datetime.utcfromtimestamp(timestamp).strftime('%Y%m')
+
+
+def _next_month(month):
+    year, month = int(month[:4]), int(month[4:])
+    return datetime(year + month // 12, month % 12 + 1, 1)
+
+
+class AuditEntry:
+    """Entrada leída de la bitácora de auditoría."""
+
+    __slots__ = ('month', 'id') + COLUMNS
+
+    def __init__(self, month, row):
+        self.month = month
+        self.id = row[0]
+        for name, value in zip(COLUMNS, row[1:]):
+            setattr(self, name, value)
+
+    @property
+    def created(self):
+        return datetime.utcfromtimestamp(self.created_at)
+
+    @property
+    def data(self):
+        return json.loads(self.details) if self.details else {}
+
+    @property
+    def position(self):
+        return f"{self.month}-{self.id}"
+
+
+class AuditLog:
+    """
+    Bitácora de auditoría de comandos y acciones de administración.
+
+    record() solo encola la entrada: un hilo propio las escribe en lotes
+    (una transacción por lote), así la petición nunca espera al disco.
+    Las entradas se guardan en segmentos SQLite mensuales, fuera de la base
+    de datos principal para no competir por su bloqueo de escritura:
+
+        <AUDIT_LOG_DIR>/audit-202610.db   (tabla audit_entry)
+
+    Cada segmento tiene índices por robot, usuario, acción y fecha. El id
+    crece con el tiempo dentro del segmento, así que la vista de
+    administración pagina por keyset (segmento, id) recorriendo los
+    segmentos del más nuevo al más viejo. La retención borra segmentos
+    completos en lugar de hacer DELETE fila por fila.
+    """
+
+    def __init__(self):
+        self.base_dir = None
+        self.enabled = True
+        self.retention_days = 180
+        self.batch_size = 500
+        self.flush_interval = 0.5
+        self.dropped = 0
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()        # arranque del hilo
+        self._write_lock = threading.Lock()  # conexiones de escritura / borrado de segmentos
+        self._connections = {}               # mes -> conexión de escritura
+
+    def init_app(self, app):
+        """Configura la bitácora; el hilo de escritura arranca con la primera entrada."""
+        self.base_dir = app.config.get('AUDIT_LOG_DIR') or \
+            os.path.join(app.instance_path, 'audit_log')
+        self.enabled = app.config.get('AUDIT_LOG_ENABLED', True)
+        self.retention_days = app.config.get('AUDIT_LOG_RETENTION_DAYS', self.retention_days)
+        self.batch_size = app.config.get('AUDIT_LOG_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('AUDIT_LOG_FLUSH_INTERVAL', self.flush_interval)
+        self._queue = queue.Queue(maxsize=app.config.get('AUDIT_LOG_QUEUE_SIZE', 10000))
+        os.makedirs(self.base_dir, exist_ok=True)
+
+    # --- Escritura -------------------------------------------------------
+
+    def record(self, action, user_id=None, robot_id=None, target=None, status='ok',
+               details=None, remote_addr=None):
+        """
+        Registra una acción (no bloquea).
+
+        Dentro de una petición se toman por defecto el usuario actual y la IP.
+
+        Args:
+            action (str): Tipo de acción, p. ej. 'robot.command', 'admin.user.delete'
+            user_id (int): Usuario que la realizó
+            robot_id (int): Robot afectado
+            target (str): Objeto afectado, p. ej. 'user:5' o el tópico MQTT
+            status (str): 'ok' o 'error'
+            details (dict): Datos adicionales (se guardan como JSON)
+        """
+        if not self.enabled or self.base_dir is None:
+            return
+        if has_request_context():
+            if user_id is None:
+                from flask_login import current_user
+                if current_user.is_authenticated:
+                    user_id = current_user.id
+            if remote_addr is None:
+                remote_addr = request.remote_addr
+
+        entry = (time.time(), action, user_id, robot_id, target, status,
+                 json.dumps(details, ensure_ascii=False, default=str) if details is not None else None,
+                 remote_addr)
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            # Mejor perder una entrada que frenar el camino de comandos
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Cola de auditoría llena: {self.dropped} entradas descartadas")
+
+    def flush(self):
+        """Espera a que se escriban todas las entradas encoladas."""
+        if self._worker is not None:
+            self._queue.join()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='audit-log', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        self.prune()
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                logger.error(f"Error al escribir {len(batch)} entradas de auditoría: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        by_month = {}
+        for entry in batch:
+            by_month.setdefault(_month_key(entry[0]), []).append(entry)
+
+        rotated = False
+        with self._write_lock:
+            for month, entries in by_month.items():
+                connection = self._connections.get(month)
+                if connection is None:
+                    connection = self._open_segment(month)
+                    self._connections[month] = connection
+                    rotated = True
+                with connection:
+                    connection.executemany(INSERT, entries)
+
+            # Solo se mantiene abierta la conexión del mes más reciente
+            for month in sorted(self._connections)[:-1]:
+                self._connections.pop(month).close()
+
+        if rotated:
+            self.prune()
+
+    def _open_segment(self, month):
+        connection = sqlite3.connect(self._segment_path(month), check_same_thread=False)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute('PRAGMA busy_timeout=5000')
+        connection.executescript(SCHEMA)
+        return connection
+
+    # --- Segmentos y retención -------------------------------------------
+
+    def _segment_path(self, month):
+        return os.path.join(self.base_dir, f'audit-{month}.db')
+
+    def segments(self):
+        """Meses con segmento en disco, del más reciente al más antiguo."""
+        if not self.base_dir or not os.path.isdir(self.base_dir):
+            return []
+        months = [m.group(1) for m in map(SEGMENT_PATTERN.match, os.listdir(self.base_dir)) if m]
+        return sorted(months, reverse=True)
+
+    def prune(self, now=None):
+        """
+        Elimina los segmentos cuyo mes completo quedó fuera de la retención.
+
+        Returns:
+            list[str]: Meses eliminados
+        """
+        if not self.retention_days:
+            return []
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+        removed = []
+        with self._write_lock:
+            for month in self.segments():
+                if _next_month(month) > cutoff:
+                    continue
+                connection = self._connections.pop(month, None)
+                if connection is not None:
+                    connection.close()
+                path = self._segment_path(month)
+                for suffix in ('', '-wal', '-shm'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+                removed.append(month)
+        if removed:
+            logger.info(f"Segmentos de auditoría eliminados por retención: {', '.join(removed)}")
+        return removed
+
+    # --- Lectura ---------------------------------------------------------
+
+    def _read(self, month):
+        connection = sqlite3.connect(f'file:{self._segment_path(month)}?mode=ro', uri=True)
+        connection.execute('PRAGMA busy_timeout=5000')
+        return connection
+
+    @staticmethod
+    def _filters(robot_id=None, user_id=None, action=None, until=None):
+        clauses, params = [], []
+        for column, value in (('robot_id', robot_id), ('user_id', user_id), ('action', action)):
+            if value not in (None, ''):
+                clauses.append(f'{column} = ?')
+                params.append(value)
+        if until is not None:
+            clauses.append('created_at < ?')
+            params.append((until - datetime(1970, 1, 1)).total_seconds())
+        return clauses, params
+
+    def page(self, cursor=None, per_page=50, robot_id=None, user_id=None, action=None, until=None):
+        """
+        Página de entradas, de la más reciente a la más antigua, por keyset.
+
+        El cursor es la posición 'AAAAMM-id' de la última entrada vista; cada
+        página cuesta lo mismo sin importar cuántas entradas haya antes.
+
+        Args:
+            until (datetime): Solo entradas anteriores a esta fecha (UTC)
+
+        Returns:
+            KeysetPage
+        """
+        from app.pagination import KeysetPage
+
+        position = None
+        if cursor:
+            try:
+                month, last_id = cursor.split('-')
+                position = (month, int(last_id))
+            except ValueError:
+                position = None
+
+        clauses, params = self._filters(robot_id, user_id, action, until)
+        until_month = until.strftime('%Y%m') if until is not None else None
+        items = []
+        for month in self.segments():
+            if position and month > position[0]:
+                continue
+            if until_month and month > until_month:
+                continue
+            where, args = list(clauses), list(params)
+            if position and month == position[0]:
+                where.append('id < ?')
+                args.append(position[1])
+            sql = f"SELECT id, {', '.join(COLUMNS)} FROM audit_entry"
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            sql += ' ORDER BY id DESC LIMIT ?'
+            connection = self._read(month)
+            try:
+                rows = connection.execute(sql, args + [per_page + 1 - len(items)]).fetchall()
+            finally:
+                connection.close()
+            items.extend(AuditEntry(month, row) for row in rows)
+            if len(items) > per_page:
+                break
+
+        next_cursor = None
+        if len(items) > per_page:
+            items = items[:per_page]
+            next_cursor = items[-1].position
+        return KeysetPage(items, next_cursor, cursor)
+
+    def count(self, robot_id=None, user_id=None, action=None, until=None):
+        """
+        Número de entradas. Sin filtros es el id máximo de cada segmento
+        (las filas nunca se borran una a una), sin recorrer la tabla.
+        """
+        clauses, params = self._filters(robot_id, user_id, action, until)
+        sql = 'SELECT COUNT(*) FROM audit_entry WHERE ' + ' AND '.join(clauses) if clauses \
+            else 'SELECT COALESCE(MAX(id), 0) FROM audit_entry'
+        total = 0
+        for month in self.segments():
+            connection = self._read(month)
+            try:
+                total += connection.execute(sql, params).fetchone()[0]
+            finally:
+                connection.close()
+        return total
+
+
+# Instancia global de la bitácora de auditoría
+audit_log = AuditLog()
@@ -1,11 +1,19 @@
 # proyojo/app/blueprints/admin.py
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, send_file, jsonify, abort
 from flask_login import login_required, current_user
 from functools import wraps
+from sqlalchemy.orm import selectinload
 from app import db
-from app.models import User, Role, Robot
+from app.models import User, Role, Robot, user_roles
+from app.pagination import keyset_paginate, admin_counts
+from app.admin_stats import admin_stats
+from app.audit_log import audit_log
+from app.response_cache import bump_version
+from app.fleet import resolve_targets, broadcast, fleet_topics, FleetError
+from app.video_buffer import video_recorder
 from datetime import datetime
+import os
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -24,32 +32,61 @@ def admin_required(f):
 @admin_required
 def index():
     """Panel de administración principal."""
-    # Estadísticas generales
-    total_users = User.query.count()
-    active_users = User.query.filter_by(is_active=True).count()
-    total_robots = Robot.query.count()
-    public_robots = Robot.query.filter_by(is_public=True).count()
+    # Estadísticas generales (contadores materializados, sin count())
+    stats = admin_stats.get()
     
-    # Usuarios recientes
-    recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
+    # Usuarios recientes (usa el índice created_at, id)
+    recent_users = User.query.order_by(User.created_at.desc(), User.id.desc()).limit(5).all()
     
     return render_template('admin/index.html',
                          title="Panel de Administración",
-                         total_users=total_users,
-                         active_users=active_users,
-                         total_robots=total_robots,
-                         public_robots=public_robots,
+                         total_users=stats['total_users'],
+                         active_users=stats['active_users'],
+                         total_robots=stats['total_robots'],
+                         public_robots=stats['public_robots'],
                          recent_users=recent_users)
 
 @admin_bp.route('/users')
 @login_required
 @admin_required
 def users():
-    """Listado de usuarios."""
-    all_users = User.query.order_by(User.created_at.desc()).all()
+    """Listado de usuarios paginado con búsqueda y filtros en el servidor."""
+    search = request.args.get('q', '').strip()
+    role = request.args.get('role', '')
+    active = request.args.get('active', '')
+    
+    # Los roles se cargan para toda la página en una sola consulta
+    query = User.query.options(selectinload(User.roles))
+    if search:
+        pattern = f'%{search}%'
+        query = query.filter(db.or_(User.username.ilike(pattern),
+                                    User.email.ilike(pattern),
+                                    User.first_name.ilike(pattern),
+                                    User.last_name.ilike(pattern)))
+    if role:
+        query = query.filter(User.id.in_(
+            db.select(user_roles.c.user_id)
+            .join(Role, Role.id == user_roles.c.role_id)
+            .where(Role.name == role)))
+    if active in ('1', '0'):
+        query = query.filter(User.is_active == (active == '1'))
+    
+    page = keyset_paginate(query, User,
+                           cursor=request.args.get('cursor'),
+                           per_page=current_app.config.get('ADMIN_PAGE_SIZE', 50))
+    if search or role or active:
+        total = admin_counts.get(('users', search, role, active),
+                                 lambda: query.order_by(None).count())
+    else:
+        total = admin_stats.get()['total_users']
+    
     return render_template('admin/users.html', 
                          title="Gestión de Usuarios",
-                         users=all_users)
+                         users=page.items,
+                         page=page,
+                         total=total,
+                         all_roles=Role.query.order_by(Role.id).all(),
+                         filters={'q': search, 'role': role, 'active': active})
 
 @admin_bp.route('/user/<int:user_id>')
 @login_required
@@ -77,6 +114,9 @@ def toggle_user_active(user_id):
     
     user.is_active = not user.is_active
     db.session.commit()
+    admin_counts.clear()
+    audit_log.record('admin.user.toggle_active', target=f'user:{user.id}',
+                     details={'username': user.username, 'is_active': user.is_active})
     
     status = "activado" if user.is_active else "desactivado"
     flash(f'Usuario {user.username} {status} correctamente.', 'success')
@@ -110,6 +150,9 @@ def update_user_role(user_id):
     new_roles = Role.query.filter(Role.id.in_(selected_role_ids)).all()
     user.roles = new_roles
     db.session.commit()
+    admin_counts.clear()
+    audit_log.record('admin.user.update_role', target=f'user:{user.id}',
+                     details={'username': user.username, 'roles': [r.name for r in new_roles]})
     
     flash(f'Roles de {user.username} actualizados correctamente.', 'success')
     return redirect(url_for('admin.user_detail', user_id=user_id))
@@ -134,6 +177,8 @@ def delete_user(user_id):
     username = user.username
     db.session.delete(user)
     db.session.commit()
+    admin_counts.clear()
+    audit_log.record('admin.user.delete', target=f'user:{user_id}', details={'username': username})
     
     flash(f'Usuario {username} eliminado correctamente.', 'success')
     return redirect(url_for('admin.users'))
@@ -142,11 +187,37 @@ def delete_user(user_id):
 @login_required
 @admin_required
 def robots():
-    """Gestión de robots."""
-    all_robots = Robot.query.all()
+    """Gestión de robots paginada con búsqueda y filtros en el servidor."""
+    search = request.args.get('q', '').strip()
+    public = request.args.get('public', '')
+    online = request.args.get('online', '')
+    
+    query = Robot.query
+    if search:
+        pattern = f'%{search}%'
+        query = query.filter(db.or_(Robot.name.ilike(pattern),
+                                    Robot.serial_number.ilike(pattern),
+                                    Robot.camera_ip.ilike(pattern)))
+    if public in ('1', '0'):
+        query = query.filter(Robot.is_public == (public == '1'))
+    if online in ('1', '0'):
+        query = query.filter(Robot.is_online == (online == '1'))
+    
+    page = keyset_paginate(query, Robot,
+                           cursor=request.args.get('cursor'),
+                           per_page=current_app.config.get('ADMIN_PAGE_SIZE', 50))
+    if search or public or online:
+        total = admin_counts.get(('robots', search, public, online),
+                                 lambda: query.order_by(None).count())
+    else:
+        total = admin_stats.get()['total_robots']
+    
     return render_template('admin/robots.html',
                          title="Gestión de Robots",
-                         robots=all_robots)
+                         robots=page.items,
+                         page=page,
+                         total=total,
+                         filters={'q': search, 'public': public, 'online': online})
 
 @admin_bp.route('/robot/<int:robot_id>/toggle_public', methods=['POST'])
 @login_required
@@ -157,11 +228,224 @@ def toggle_robot_public(robot_id):
     
     robot.is_public = not robot.is_public
     db.session.commit()
+    admin_counts.clear()
+    audit_log.record('admin.robot.toggle_public', robot_id=robot.id, target=f'robot:{robot.id}',
+                     details={'name': robot.name, 'is_public': robot.is_public})
     
     status = "público" if robot.is_public else "privado"
     flash(f'Robot {robot.name} ahora es {status}.', 'success')
     return redirect(url_for('admin.robots'))
 
+def _parse_ids(text):
+    """'1, 2 5' -> [1, 2, 5]; None si hay algo que no es un número."""
+    parts = text.replace(',', ' ').split()
+    if not all(part.isdigit() for part in parts):
+        return None
+    return [int(part) for part in parts]
+
+@admin_bp.route('/fleet', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def fleet():
+    """Envío de un mismo comando a varios robots y grupos de flota."""
+    form = {
+        'robot_ids': request.form.get('robot_ids', '').strip(),
+        'visibility': request.form.get('visibility', ''),
+        'group': request.form.get('group', '').strip(),
+        'online_only': bool(request.form.get('online_only')),
+        'topic': request.form.get('topic', 'command'),
+        'action': request.form.get('action', '').strip(),
+        'value': request.form.get('value', '').strip(),
+        'ttl': request.form.get('ttl', '').strip(),
+    }
+    result = None
+    
+    if request.method == 'POST':
+        robot_ids = _parse_ids(form['robot_ids'])
+        if robot_ids is None:
+            flash('Los ids de robots deben ser números separados por comas.', 'danger')
+        elif not form['action']:
+            flash('Indica la acción o el mensaje a enviar.', 'danger')
+        else:
+            payload = {'action': form['action'], 'value': form['value'] or None}
+            try:
+                targets = resolve_targets(robot_ids=robot_ids, visibility=form['visibility'],
+                                          group=form['group'], online_only=form['online_only'])
+                result = broadcast(targets, form['topic'], payload,
+                                   ttl=int(form['ttl']) if form['ttl'].isdigit() else None)
+                flash(f"Comando enviado a {result['total']} robots.", 'success')
+            except FleetError as e:
+                flash(str(e), 'danger')
+    
+    # Grupos existentes con su número de robots en una sola consulta
+    groups = db.session.query(Robot.fleet_group, db.func.count(Robot.id)) \
+        .filter(Robot.fleet_group.isnot(None)) \
+        .group_by(Robot.fleet_group).order_by(Robot.fleet_group).all()
+    
+    return render_template('admin/fleet.html',
+                         title="Envíos a la Flota",
+                         form=form,
+                         result=result,
+                         groups=groups,
+                         topics=fleet_topics())
+
+@admin_bp.route('/fleet/group', methods=['POST'])
+@login_required
+@admin_required
+def set_fleet_group():
+    """Asigna (o quita, con el nombre vacío) el grupo de flota de varios robots."""
+    robot_ids = _parse_ids(request.form.get('robot_ids', ''))
+    group = request.form.get('group', '').strip() or None
+    if not robot_ids:
+        flash('Indica los ids de los robots separados por comas.', 'danger')
+        return redirect(url_for('admin.fleet'))
+    
+    # Un solo UPDATE para toda la selección
+    updated = Robot.query.filter(Robot.id.in_(robot_ids)) \
+        .update({Robot.fleet_group: group}, synchronize_session=False)
+    # El UPDATE masivo no pasa por el flush del ORM: invalidar a mano las páginas cacheadas
+    bump_version(db.session, 'robots')
+    db.session.commit()
+    admin_counts.clear()
+    audit_log.record('admin.robot.fleet_group', target=f'group:{group or ""}',
+                     details={'robot_ids': robot_ids, 'group': group, 'updated': updated})
+    
+    flash(f'{updated} robots {"asignados al grupo " + group if group else "sin grupo"}.', 'success')
+    return redirect(url_for('admin.fleet'))
+
+@admin_bp.route('/video')
+@login_required
+@admin_required
+def video():
+    """Búferes de video de las cámaras y clips guardados."""
+    status = video_recorder.status()
+    robots = Robot.query.filter(Robot.camera_ip.isnot(None), Robot.camera_ip != '') \
+        .order_by(Robot.name).all()
+    clips = video_recorder.clips()
+    robot_names = {robot.id: robot.name for robot in robots}
+    
+    return render_template('admin/video.html',
+                         title="Video de Incidentes",
+                         robots=robots,
+                         status=status,
+                         clips=clips,
+                         robot_names=robot_names,
+                         enabled=video_recorder.enabled,
+                         now=datetime.utcnow().timestamp())
+
+@admin_bp.route('/video/<int:robot_id>/clip', methods=['POST'])
+@login_required
+@admin_required
+def save_video_clip(robot_id):
+    """Guarda un clip con los últimos minutos de la cámara del robot."""
+    robot = Robot.query.get_or_404(robot_id)
+    clip = video_recorder.save_clip(robot.id, 'admin', user_id=current_user.id)
+    if clip is None:
+        flash(f'{robot.name} no tiene búfer de video activo.', 'warning')
+    else:
+        audit_log.record('video.clip', robot_id=robot.id, target=f'clip:{clip}',
+                         details={'reason': 'admin'})
+        flash(f'Clip {clip} programado: estará listo en {video_recorder.clip_after} segundos.', 'success')
+    return redirect(url_for('admin.video'))
+
+@admin_bp.route('/video/clip/<name>')
+@login_required
+@admin_required
+def video_clip(name):
+    """Reproductor de un clip (cuadro a cuadro con peticiones por rango)."""
+    meta = video_recorder.clip_meta(name)
+    if meta is None:
+        abort(404)
+    meta.pop('frames', None)
+    return render_template('admin/video_clip.html',
+                         title=f"Clip {name}",
+                         clip=meta,
+                         robot=db.session.get(Robot, meta['robot_id']))
+
+@admin_bp.route('/video/clip/<name>.mjpeg')
+@login_required
+@admin_required
+def video_clip_file(name):
+    """Archivo MJPEG del clip; admite Range (206) para leer cuadros sueltos."""
+    path = video_recorder.clip_path(name)
+    if path is None or not os.path.exists(path):
+        abort(404)
+    return send_file(path, mimetype='video/x-motion-jpeg', conditional=True,
+                     download_name=f'{name}.mjpeg')
+
+@admin_bp.route('/video/clip/<name>.json')
+@login_required
+@admin_required
+def video_clip_index(name):
+    """Índice del clip: [[marca de tiempo, desplazamiento, longitud], ...]."""
+    meta = video_recorder.clip_meta(name)
+    if meta is None:
+        abort(404)
+    return jsonify(meta)
+
+# Acciones registradas en la bitácora, para el filtro de la vista
+AUDIT_ACTIONS = [
+    ('robot.command', 'Comando a robot'),
+    ('contact.call', 'Llamada a contacto'),
+    ('admin.user.toggle_active', 'Activar/desactivar usuario'),
+    ('admin.user.update_role', 'Cambio de roles'),
+    ('admin.user.delete', 'Eliminación de usuario'),
+    ('admin.robot.toggle_public', 'Visibilidad de robot'),
+    ('fleet.command', 'Envío a la flota'),
+    ('admin.robot.fleet_group', 'Grupo de flota'),
+    ('video.clip', 'Clip de video'),
+    ('camera.sudden', 'Movimiento brusco en cámara'),
+    ('camera.inactivity', 'Inactividad en cámara'),
+]
+
+@admin_bp.route('/audit')
+@login_required
+@admin_required
+def audit():
+    """Bitácora de auditoría paginada por keyset (segmento, id)."""
+    robot_id = request.args.get('robot_id', '', type=str).strip()
+    user_id = request.args.get('user_id', '', type=str).strip()
+    action = request.args.get('action', '')
+    until = request.args.get('until', '')
+    
+    filters = {
+        'robot_id': int(robot_id) if robot_id.isdigit() else None,
+        'user_id': int(user_id) if user_id.isdigit() else None,
+        'action': action or None,
+        'until': None,
+    }
+    if until:
+        try:
+            filters['until'] = datetime.strptime(until, '%Y-%m-%d')
+        except ValueError:
+            flash('Fecha inválida, usa AAAA-MM-DD.', 'warning')
+    
+    page = audit_log.page(cursor=request.args.get('cursor'),
+                          per_page=current_app.config.get('ADMIN_PAGE_SIZE', 50),
+                          **filters)
+    if any(filters.values()):
+        key = ('audit',) + tuple(filters.values())
+        total = admin_counts.get(key, lambda: audit_log.count(**filters))
+    else:
+        total = audit_log.count()
+    
+    # Nombres de usuarios y robots de la página en dos consultas
+    user_ids = {entry.user_id for entry in page.items if entry.user_id}
+    robot_ids = {entry.robot_id for entry in page.items if entry.robot_id}
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids))) if user_ids else {}
+    robot_names = dict(db.session.query(Robot.id, Robot.name).filter(Robot.id.in_(robot_ids))) if robot_ids else {}
+    
+    return render_template('admin/audit.html',
+                         title="Bitácora de Auditoría",
+                         entries=page.items,
+                         page=page,
+                         total=total,
+                         usernames=usernames,
+                         robot_names=robot_names,
+                         actions=AUDIT_ACTIONS,
+                         filters={'robot_id': robot_id, 'user_id': user_id,
+                                  'action': action, 'until': until})
+
 @admin_bp.route('/config')
 @login_required
 @admin_required
@@ -1,12 +1,25 @@
 # proyojo/app/blueprints/api.py
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from app import db
+from app.response_cache import response_cache
 from app.models import Robot
 from app.mqtt_client import mqtt_client
+from app.mqtt_dispatch import mqtt_dispatcher
+from app.payload_codec import payload_codec
+from app.presence import presence
+from app.contact_search import contact_search
+from app.audit_log import audit_log
+from app.command_ack import command_acks
+from app.rate_limit import rate_limiter
+from app.fleet import resolve_targets, broadcast, FleetError
+from app.motion import motion_detector
+from app.live_stream import live_streams
+from datetime import datetime
 import logging
 import json
+import time
+import queue
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -14,12 +27,20 @@ logger = logging.getLogger(__name__)
 
 @api_bp.route('/robot/<int:robot_id>/command', methods=['POST'])
 @login_required
+@rate_limiter.limit('20/second burst 40', by='user')
 def send_command(robot_id):
     """
     Endpoint para enviar comandos al robot.
-    Recibe JSON con: {action: 'forward'|'backward'|'left'|'right'|'stop'|etc, value: optional}
+    Recibe JSON con: {action: 'forward'|'backward'|'left'|'right'|'stop'|etc, value: optional,
+                      sent_at: optional (ms epoch del navegador), wait: optional (ms)}
+    
+    Cada comando lleva un id de correlación que el robot devuelve en
+    jojo/<serial>/ack. Con "wait" la respuesta espera ese ack (acotado por
+    COMMAND_ACK_MAX_WAIT) e incluye las latencias medidas.
     """
     try:
+        received = time.time()
+        
         # Obtener el robot
         robot = Robot.query.get_or_404(robot_id)
         
@@ -27,6 +48,12 @@ def send_command(robot_id):
         if robot.user_id != current_user.id:
             return jsonify({'error': 'No autorizado'}), 403
         
+        # Límite por robot; solo después de autorizar, para que peticiones
+        # ajenas rechazadas no agoten el cupo del propietario
+        limited = rate_limiter.enforce('api.send_command:robot', f'r{robot.id}', '30/second burst 60')
+        if limited is not None:
+            return limited
+        
         # Verificar que el robot esté activo
         if not robot.is_active:
             return jsonify({'error': 'Robot inactivo'}), 400
@@ -35,34 +62,54 @@ def send_command(robot_id):
         data = request.get_json()
         action = data.get('action')
         value = data.get('value', None)
+        sent_at = data.get('sent_at')
+        wait_ms = data.get('wait')
         
         if not action:
             return jsonify({'error': 'Acción no especificada'}), 400
         
+        pending = command_acks.register(
+            robot, action,
+            client_sent=sent_at / 1000 if isinstance(sent_at, (int, float)) else None,
+            received=received
+        )
+        
         # Preparar el mensaje MQTT
         mqtt_payload = {
+            'id': pending.command_id,
             'action': action,
             'value': value,
-            'timestamp': str(db.func.current_timestamp())
+            'timestamp': datetime.utcnow().isoformat() + 'Z'
         }
         
         # Publicar el comando en el tópico MQTT del robot
         topic = f"{robot.mqtt_topic}/command"
         success = mqtt_client.publish(topic, mqtt_payload, qos=1)
+        command_acks.published(pending, success)
+        audit_log.record('robot.command', robot_id=robot.id, target=topic,
+                         status='ok' if success else 'error',
+                         details={'id': pending.command_id, 'action': action, 'value': value})
         
         if success:
-            logger.info(f"Comando enviado - Robot: {robot.name}, Acción: {action}, Valor: {value}")
-            return jsonify({
+            logger.info(f"Comando enviado - Robot: {robot.name}, Acción: {action}, Valor: {value}, Id: {pending.command_id}")
+            response = {
                 'success': True,
                 'message': f'Comando {action} enviado a {robot.name}',
                 'robot_id': robot_id,
+                'command_id': pending.command_id,
                 'action': action,
                 'value': value
-            }), 200
+            }
+            if isinstance(wait_ms, (int, float)) and wait_ms > 0:
+                ack = command_acks.wait(pending, wait_ms / 1000)
+                response['acked'] = ack is not None and ack['status'] == 'ok'
+                response['ack'] = ack
+            return jsonify(response), 200
         else:
             logger.error(f"Error al publicar comando MQTT para robot {robot.name}")
             return jsonify({
                 'success': False,
+                'command_id': pending.command_id,
                 'error': 'Error al comunicarse con el robot'
             }), 500
         
@@ -71,8 +118,153 @@ def send_command(robot_id):
         return jsonify({'error': 'Error interno del servidor'}), 500
 
 
+@api_bp.route('/robot/<int:robot_id>/latency', methods=['GET'])
+@login_required
+def get_robot_latency(robot_id):
+    """
+    Histogramas de latencia de los comandos del robot (desde que arrancó
+    este proceso): navegador -> Flask, Flask -> broker, broker -> robot -> ack
+    y total, más los contadores de acks, errores y timeouts.
+    """
+    robot = Robot.query.get_or_404(robot_id)
+    
+    if robot.user_id != current_user.id and not (current_user.is_admin() or current_user.is_support()):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    return jsonify({'success': True, 'robot_id': robot_id, **command_acks.stats(robot_id)}), 200
+
+
+@api_bp.route('/robot/<int:robot_id>/activity', methods=['GET'])
+@login_required
+def get_robot_activity(robot_id):
+    """
+    Actividad que ve la cámara del robot: puntuación del último cuadro,
+    promedio, horas sin actividad y eventos recientes de movimiento.
+    """
+    robot = Robot.query.get_or_404(robot_id)
+    
+    if robot.user_id != current_user.id and not (current_user.is_admin() or current_user.is_support()):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    status = motion_detector.status(robot_id)
+    return jsonify({'success': True, 'robot_id': robot_id, 'enabled': status['enabled'],
+                    'activity': status['cameras'].get(robot_id), 'events': status['events']}), 200
+
+
+def _live_robot(robot_id):
+    """Robot de la videollamada si el usuario puede verlo (como en /llamadas)."""
+    robot = Robot.query.get_or_404(robot_id)
+    if not (robot.is_public or robot.user_id == current_user.id
+            or current_user.is_admin() or current_user.is_support()):
+        return None
+    return robot
+
+
+@api_bp.route('/robot/<int:robot_id>/live.m3u8', methods=['GET'])
+@login_required
+def live_playlist(robot_id):
+    """
+    Lista de reproducción en vivo de la cámara del robot: los últimos
+    segmentos de una ventana deslizante. Todos los participantes de la
+    llamada comparten la misma lectura de la cámara.
+    """
+    robot = _live_robot(robot_id)
+    if robot is None:
+        return jsonify({'error': 'No autorizado'}), 403
+    if not robot.camera_stream_url:
+        return jsonify({'error': 'El robot no tiene cámara configurada'}), 404
+    
+    segmenter = live_streams.get(robot.id, robot.camera_stream_url)
+    playlist = segmenter.playlist(lambda sequence: f'live/{sequence}.seg')
+    return Response(playlist, mimetype='application/vnd.apple.mpegurl',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@api_bp.route('/robot/<int:robot_id>/live/<int:sequence>.seg', methods=['GET'])
+@login_required
+def live_segment(robot_id, sequence):
+    """
+    Segmento en vivo: los cuadros JPEG concatenados. X-Frame-Lengths da el
+    tamaño de cada cuadro y X-Frame-Offsets su momento (ms desde el inicio
+    del segmento). No cambia una vez creado, así que se puede cachear.
+    """
+    if _live_robot(robot_id) is None:
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    segment = live_streams.segment(robot_id, sequence)
+    if segment is None:
+        return jsonify({'error': 'Segmento fuera de la ventana'}), 404
+    
+    return Response(segment.data, mimetype='application/octet-stream', headers={
+        'Cache-Control': f'private, max-age={int(live_streams.window * live_streams.segment_seconds)}',
+        'X-Frame-Lengths': ','.join(map(str, segment.lengths)),
+        'X-Frame-Offsets': ','.join(map(str, segment.offsets_ms)),
+    })
+
+
+@api_bp.route('/mqtt/handlers', methods=['GET'])
+@login_required
+def get_mqtt_handlers():
+    """
+    Estadísticas de los manejadores de mensajes MQTT de este proceso:
+    patrón, llamadas, errores e histograma de tiempos de cada uno, más las
+    codificaciones acordadas con los robots.
+    """
+    if not (current_user.is_admin() or current_user.is_support()):
+        return jsonify({'error': 'No autorizado'}), 403
+    
+    return jsonify({'success': True, **mqtt_dispatcher.stats(), 'codecs': payload_codec.stats()}), 200
+
+
+@api_bp.route('/fleet/command', methods=['POST'])
+@login_required
+@rate_limiter.limit('10/minute', by='user')
+def fleet_command():
+    """
+    Envía un comando a varios robots en una sola petición (soporte y administradores).
+    Recibe JSON con: {robot_ids: [..], visibility: 'public'|'private'|'all', group: str,
+                      online_only: bool, topic: 'command' (por defecto), payload: {..}
+                      o action/value, ttl: optional (s), wait: optional (ms)}
+
+    Los destinos se resuelven en una consulta y los mensajes se publican en
+    lote; la respuesta trae el resultado de cada robot y un resumen.
+    """
+    if not (current_user.is_admin() or current_user.is_support()):
+        return jsonify({'error': 'No autorizado'}), 403
+
+    data = request.get_json(silent=True) or {}
+    topic = data.get('topic') or 'command'
+    payload = data.get('payload')
+    if payload is None:
+        if not data.get('action'):
+            return jsonify({'error': 'Acción no especificada'}), 400
+        payload = {'action': data['action'], 'value': data.get('value')}
+
+    robot_ids = data.get('robot_ids') or None
+    if robot_ids is not None and not (isinstance(robot_ids, list) and
+                                      all(isinstance(i, int) for i in robot_ids)):
+        return jsonify({'error': 'robot_ids debe ser una lista de enteros'}), 400
+    ttl = data.get('ttl')
+    wait_ms = data.get('wait')
+
+    try:
+        targets = resolve_targets(robot_ids=robot_ids, visibility=data.get('visibility'),
+                                  group=data.get('group'), online_only=bool(data.get('online_only')))
+        result = broadcast(targets, topic, payload,
+                           ttl=ttl if isinstance(ttl, (int, float)) and ttl > 0 else None,
+                           wait=wait_ms / 1000 if isinstance(wait_ms, (int, float)) and wait_ms > 0 else None)
+    except FleetError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error al enviar comando a la flota: {str(e)}")
+        return jsonify({'error': 'Error interno del servidor'}), 500
+
+    return jsonify({'success': True, 'topic': topic, **result}), 200
+
+
 @api_bp.route('/robot/<int:robot_id>/status', methods=['GET'])
 @login_required
+@response_cache.conditional('robots')
 def get_robot_status(robot_id):
     """
     Obtiene el estado actual del robot.
@@ -99,3 +291,143 @@ def get_robot_status(robot_id):
     except Exception as e:
         logger.error(f"Error al obtener estado: {str(e)}")
         return jsonify({'error': 'Error interno del servidor'}), 500
+
+
+@api_bp.route('/contacts/search', methods=['GET'])
+@login_required
+@rate_limiter.limit('10/second burst 20', by='user')
+def search_contacts():
+    """
+    Búsqueda de contactos del usuario por prefijo, sin distinguir acentos.
+    Parámetros: q (texto, p. ej. 'mar' encuentra 'María'), limit (máx. 50)
+    """
+    query = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 10, type=int) or 10, 50)
+    
+    if not query:
+        return jsonify({'success': True, 'contacts': []}), 200
+    
+    results = contact_search.search(current_user.id, query, limit=limit)
+    return jsonify({
+        'success': True,
+        'contacts': [{
+            'id': c['id'],
+            'name': c['name'],
+            'phone': c['phone'],
+            'relationship': c['relationship'],
+            'is_emergency': c['is_emergency'],
+            'is_favorite': c['is_favorite']
+        } for c in results]
+    }), 200
+
+
+@api_bp.route('/contacts/lookup', methods=['GET'])
+@login_required
+def lookup_contact():
+    """
+    Identificación de llamadas: busca el contacto del usuario con ese número.
+    Parámetro: number (en cualquier formato, p. ej. '55 1234 5678' o '+525512345678')
+    """
+    from app.phone_numbers import identify_caller
+    
+    number = request.args.get('number', '').strip()
+    if not number:
+        return jsonify({'error': 'Número no especificado'}), 400
+    
+    contact = identify_caller(current_user.id, number)
+    return jsonify({
+        'success': True,
+        'contact': {
+            'id': contact.id,
+            'name': contact.name,
+            'phone': contact.formatted_phone,
+            'relationship': contact.relationship,
+            'is_emergency': contact.is_emergency
+        } if contact else None
+    }), 200
+
+
+def _visible_presence_keys():
+    """Tópicos de los robots del usuario; None (todos) para admin/soporte."""
+    if current_user.is_admin() or current_user.is_support():
+        return None
+    return {robot.mqtt_topic for robot in
+            Robot.query.filter_by(user_id=current_user.id).with_entities(Robot.mqtt_topic)}
+
+
+@api_bp.route('/presence', methods=['GET'])
+@login_required
+def get_presence():
+    """
+    Estado de presencia conocido de los robots del usuario (de todos para
+    admin/soporte), por tópico MQTT base.
+    """
+    keys = _visible_presence_keys()
+    robots = {key: online for key, online in presence.snapshot().items() if keys is None or key in keys}
+    return jsonify({'success': True, 'robots': robots}), 200
+
+
+@api_bp.route('/presence/stream', methods=['GET'])
+@login_required
+def presence_stream():
+    """
+    Flujo Server-Sent Events con los cambios de presencia de los robots del
+    usuario (de todos para admin/soporte).
+    Cada evento es JSON: {robot: 'jojo/<serial>', online: bool, timestamp}
+    """
+    keys = _visible_presence_keys()
+    listener = presence.subscribe()
+
+    def generate():
+        try:
+            # Estado inicial para que el dashboard no espere al primer cambio
+            for robot_key, online in presence.snapshot().items():
+                if keys is not None and robot_key not in keys:
+                    continue
+                yield f"data: {json.dumps({'robot': robot_key, 'online': online})}\n\n"
+            while True:
+                try:
+                    event = listener.get(timeout=15)
+                    if keys is None or event['robot'] in keys:
+                        yield f"data: {json.dumps(event)}\n\n"
+                except queue.Empty:
+                    # Comentario keep-alive para mantener viva la conexión
+                    yield ": ping\n\n"
+        finally:
+            presence.unsubscribe(listener)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@api_bp.route('/motion/stream', methods=['GET'])
+@login_required
+def motion_stream():
+    """
+    Flujo Server-Sent Events con los eventos de movimiento e inactividad
+    de las cámaras de los robots del usuario (de todos para admin/soporte).
+    Cada evento es JSON: {type, robot_id, timestamp, score[, hours]}
+    """
+    if current_user.is_admin() or current_user.is_support():
+        robot_ids = None
+    else:
+        robot_ids = {robot.id for robot in Robot.query.filter_by(user_id=current_user.id).with_entities(Robot.id)}
+    listener = motion_detector.subscribe()
+
+    def generate():
+        try:
+            while True:
+                try:
+                    event = listener.get(timeout=15)
+                    if robot_ids is None or event['robot_id'] in robot_ids:
+                        yield f"data: {json.dumps(event)}\n\n"
+                except queue.Empty:
+                    # Comentario keep-alive para mantener viva la conexión
+                    yield ": ping\n\n"
+        finally:
+            motion_detector.unsubscribe(listener)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -4,11 +4,13 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from app.models import User, Role
+from app.rate_limit import rate_limiter
 
 # El nombre 'auth_bp' es el que importaremos en __init__.py
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@rate_limiter.limit('10/minute', by='ip', methods=('POST',))
 def login():
     # Si ya está autenticado, redirigir al dashboard
     if current_user.is_authenticated:
@@ -45,6 +47,7 @@ def login():
 
 
 @auth_bp.route('/register', methods=['GET', 'POST'])
+@rate_limiter.limit('5/hour', by='ip', methods=('POST',))
 def register():
     # Si ya está autenticado, redirigir al dashboard
     if current_user.is_authenticated:
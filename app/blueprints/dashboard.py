@@ -1,17 +1,27 @@
 # proyojo/app/blueprints/dashboard.py
 
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
 from flask_login import login_required, current_user
 from app import db
-from app.models import Reminder
+from app.response_cache import response_cache
+from app.audit_log import audit_log
+from app.video_buffer import video_recorder
+from app.rate_limit import rate_limiter
+from app.models import Reminder, ReminderOccurrence
+from app.reminder_occurrences import reminder_occurrences, RECURRING
+from sqlalchemy.orm import contains_eager
 from datetime import datetime
 
+# Ocurrencias completadas que se listan en la página de recordatorios
+COMPLETED_REMINDERS_LIMIT = 50
+
 # El nombre 'dashboard_bp' es el que importaremos
 dashboard_bp = Blueprint('dashboard', __name__)
 
 @dashboard_bp.route('/')
 @dashboard_bp.route('/dashboard')
 @login_required
+@response_cache.conditional('robots', 'reminders', time_bucket=60)
 def index():
     # Obtener estadísticas del usuario
     from app.models import Robot
@@ -30,20 +40,15 @@ def index():
     now = datetime.utcnow()
     tomorrow = now + timedelta(days=1)
     
-    upcoming_reminders = Reminder.query.filter(
-        Reminder.user_id == current_user.id,
-        Reminder.is_active == True,
-        Reminder.is_completed == False,
-        Reminder.reminder_time >= now,
-        Reminder.reminder_time <= tomorrow
-    ).order_by(Reminder.reminder_time).limit(5).all()
+    # (rango sobre las ocurrencias materializadas, incluye las series repetidas)
+    upcoming_reminders = _pending_occurrences().filter(
+        ReminderOccurrence.occurs_at >= now,
+        ReminderOccurrence.occurs_at <= tomorrow
+    ).order_by(ReminderOccurrence.occurs_at).limit(5).all()
     
     # Recordatorios vencidos
-    overdue_reminders = Reminder.query.filter(
-        Reminder.user_id == current_user.id,
-        Reminder.is_active == True,
-        Reminder.is_completed == False,
-        Reminder.reminder_time < now
+    overdue_reminders = _pending_occurrences().filter(
+        ReminderOccurrence.occurs_at < now
     ).count()
     
     return render_template('dashboard/index.html', 
@@ -58,17 +63,45 @@ def index():
 
 @dashboard_bp.route('/recordatorios')
 @login_required
+@response_cache.conditional('reminders', time_bucket=60)
 def recordatorios():
-    """Página de gestión de recordatorios."""
-    # Obtener todos los recordatorios del usuario ordenados por fecha
-    reminders = Reminder.query.filter_by(
-        user_id=current_user.id,
-        is_active=True
-    ).order_by(Reminder.reminder_time).all()
+    """
+    Página de gestión de recordatorios.
+    
+    Pendientes: las ocurrencias vencidas más la siguiente de cada serie.
+    Completados: las últimas ocurrencias marcadas como hechas.
+    """
+    now = datetime.utcnow()
     
-    # Separar recordatorios pendientes y completados
-    pending = [r for r in reminders if not r.is_completed]
-    completed = [r for r in reminders if r.is_completed]
+    overdue = _pending_occurrences().filter(
+        ReminderOccurrence.occurs_at < now
+    ).order_by(ReminderOccurrence.occurs_at).all()
+    
+    # Siguiente ocurrencia pendiente de cada serie
+    next_per_series = db.session.query(
+        ReminderOccurrence.reminder_id,
+        db.func.min(ReminderOccurrence.occurs_at).label('occurs_at')
+    ).filter(
+        ReminderOccurrence.user_id == current_user.id,
+        ReminderOccurrence.is_completed == False,
+        ReminderOccurrence.occurs_at >= now
+    ).group_by(ReminderOccurrence.reminder_id).subquery()
+    
+    upcoming = _pending_occurrences().join(
+        next_per_series,
+        db.and_(next_per_series.c.reminder_id == ReminderOccurrence.reminder_id,
+                next_per_series.c.occurs_at == ReminderOccurrence.occurs_at)
+    ).order_by(ReminderOccurrence.occurs_at).all()
+    
+    completed = ReminderOccurrence.query.join(ReminderOccurrence.reminder).options(
+        contains_eager(ReminderOccurrence.reminder)
+    ).filter(
+        ReminderOccurrence.user_id == current_user.id,
+        ReminderOccurrence.is_completed == True,
+        Reminder.is_active == True
+    ).order_by(ReminderOccurrence.completed_at.desc()).limit(COMPLETED_REMINDERS_LIMIT).all()
+    
+    pending = overdue + upcoming
     
     return render_template('dashboard/recordatorios.html', 
                          title="Mis Recordatorios",
@@ -116,6 +149,9 @@ def nuevo_recordatorio():
             )
             
             db.session.add(new_reminder)
+            db.session.flush()
+            # Sus ocurrencias entran a la ventana sin esperar al hilo en segundo plano
+            reminder_occurrences.extend(db.session, reminder_ids=[new_reminder.id])
             db.session.commit()
             
             flash(f'Recordatorio "{title}" creado exitosamente.', 'success')
@@ -129,10 +165,51 @@ def nuevo_recordatorio():
     return render_template('dashboard/nuevo_recordatorio.html', title="Nuevo Recordatorio")
 
 
+def _pending_occurrences():
+    """Ocurrencias pendientes del usuario actual (con su recordatorio cargado)."""
+    return ReminderOccurrence.query.join(ReminderOccurrence.reminder).options(
+        contains_eager(ReminderOccurrence.reminder)
+    ).filter(
+        ReminderOccurrence.user_id == current_user.id,
+        ReminderOccurrence.is_completed == False,
+        Reminder.is_active == True
+    )
+
+
+def _complete_occurrence(occurrence):
+    """Marca una ocurrencia como hecha; en un recordatorio único, también la serie."""
+    now = datetime.utcnow()
+    occurrence.is_completed = True
+    occurrence.completed_at = now
+    
+    reminder = occurrence.reminder
+    if reminder.repeat not in RECURRING:
+        reminder.is_completed = True
+        reminder.completed_at = now
+    db.session.commit()
+    
+    flash(f'Recordatorio "{reminder.title}" marcado como completado.', 'success')
+
+
+@dashboard_bp.route('/recordatorio/ocurrencia/<int:occurrence_id>/completar', methods=['POST'])
+@login_required
+def completar_ocurrencia(occurrence_id):
+    """Marcar como completada una ocurrencia (la serie sigue activa)."""
+    occurrence = ReminderOccurrence.query.get_or_404(occurrence_id)
+    
+    # Verificar que pertenece al usuario
+    if occurrence.user_id != current_user.id:
+        flash('No tienes permiso para esta acción.', 'danger')
+        return redirect(url_for('dashboard.recordatorios'))
+    
+    _complete_occurrence(occurrence)
+    return redirect(url_for('dashboard.recordatorios'))
+
+
 @dashboard_bp.route('/recordatorio/<int:reminder_id>/completar', methods=['POST'])
 @login_required
 def completar_recordatorio(reminder_id):
-    """Marcar un recordatorio como completado."""
+    """Marcar como completada la ocurrencia pendiente más antigua de un recordatorio."""
     reminder = Reminder.query.get_or_404(reminder_id)
     
     # Verificar que pertenece al usuario
@@ -140,11 +217,13 @@ def completar_recordatorio(reminder_id):
         flash('No tienes permiso para esta acción.', 'danger')
         return redirect(url_for('dashboard.recordatorios'))
     
-    reminder.is_completed = True
-    reminder.completed_at = datetime.utcnow()
-    db.session.commit()
+    occurrence = reminder.occurrences.filter_by(is_completed=False) \
+        .order_by(ReminderOccurrence.occurs_at).first()
+    if occurrence is None:
+        flash(f'"{reminder.title}" no tiene ocurrencias pendientes.', 'info')
+        return redirect(url_for('dashboard.recordatorios'))
     
-    flash(f'Recordatorio "{reminder.title}" marcado como completado.', 'success')
+    _complete_occurrence(occurrence)
     return redirect(url_for('dashboard.recordatorios'))
 
 
@@ -215,30 +294,92 @@ def brazo():
                          title="Control de Brazo",
                          robots=user_robots)
 
+# Secciones de la agenda, en orden de aparición. Cada contacto pertenece a una
+# sola sección: los de emergencia van siempre a 'emergencia'.
+CONTACT_SECTIONS = [
+    {'key': 'emergencia', 'title': 'Contactos de Emergencia', 'icon': 'fa-ambulance', 'color': '#dc3545'},
+    {'key': 'familia', 'title': 'Familia', 'icon': 'fa-users', 'color': '#813772'},
+    {'key': 'medico', 'title': 'Médicos y Salud', 'icon': 'fa-user-md', 'color': '#28a745'},
+    {'key': 'amigo', 'title': 'Amigos', 'icon': 'fa-user-friends', 'color': '#17a2b8'},
+    {'key': 'otro', 'title': 'Otros Contactos', 'icon': 'fa-address-card', 'color': '#6c757d'},
+]
+CONTACT_SECTION_KEYS = [section['key'] for section in CONTACT_SECTIONS]
+
+
+def _contact_group_expr():
+    """Expresión SQL que asigna cada contacto a su sección."""
+    from app.models import Contact
+    
+    return db.case(
+        (Contact.is_emergency == True, 'emergencia'),
+        (Contact.relationship.in_(['familia', 'amigo', 'medico']), Contact.relationship),
+        else_='otro'
+    )
+
+
 @dashboard_bp.route('/contactos')
 @login_required
+@response_cache.conditional('contacts', 'robots')
 def contactos():
-    """Página de gestión de contactos."""
-    from app.models import Contact
+    """
+    Página de gestión de contactos.
+    
+    Solo se consultan los conteos por sección (una consulta agrupada); las
+    tarjetas de cada sección se cargan bajo demanda desde contactos_seccion.
+    """
+    from app.models import Contact, Robot
     
-    # Obtener todos los contactos del usuario
-    all_contacts = Contact.query.filter_by(user_id=current_user.id).order_by(Contact.name).all()
+    group = _contact_group_expr()
+    counts = dict(
+        db.session.query(group, db.func.count(Contact.id))
+        .filter(Contact.user_id == current_user.id)
+        .group_by(group)
+        .all()
+    )
     
-    # Separar por categorías
-    emergency_contacts = [c for c in all_contacts if c.is_emergency]
-    family_contacts = [c for c in all_contacts if c.relationship == 'familia']
-    friends_contacts = [c for c in all_contacts if c.relationship == 'amigo']
-    medical_contacts = [c for c in all_contacts if c.relationship == 'medico']
-    other_contacts = [c for c in all_contacts if c.relationship not in ['familia', 'amigo', 'medico'] and not c.is_emergency]
+    sections = [dict(section, count=counts.get(section['key'], 0))
+                for section in CONTACT_SECTIONS]
+    
+    # Robots disponibles para el diálogo de llamada
+    if current_user.is_admin() or current_user.is_support():
+        user_robots = Robot.query.all()
+    else:
+        user_robots = Robot.query.filter_by(is_public=True).all()
     
     return render_template('dashboard/contactos.html',
                          title="Agenda de Contactos",
-                         all_contacts=all_contacts,
-                         emergency_contacts=emergency_contacts,
-                         family_contacts=family_contacts,
-                         friends_contacts=friends_contacts,
-                         medical_contacts=medical_contacts,
-                         other_contacts=other_contacts)
+                         sections=sections,
+                         counts=counts,
+                         total_contacts=sum(counts.values()),
+                         robots=user_robots)
+
+@dashboard_bp.route('/contactos/seccion/<group>')
+@login_required
+@response_cache.conditional('contacts')
+def contactos_seccion(group):
+    """Fragmento HTML paginado con las tarjetas de una sección de la agenda."""
+    from app.models import Contact
+    
+    if group not in CONTACT_SECTION_KEYS:
+        return '', 404
+    
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = current_app.config.get('CONTACTS_PAGE_SIZE', 20)
+    
+    # Favoritos primero, luego por nombre
+    contacts = Contact.query.filter(
+        Contact.user_id == current_user.id,
+        _contact_group_expr() == group
+    ).order_by(
+        Contact.is_favorite.desc(), Contact.name, Contact.id
+    ).offset((page - 1) * per_page).limit(per_page + 1).all()
+    
+    has_more = len(contacts) > per_page
+    
+    return render_template('dashboard/contact_section.html',
+                         contacts=contacts[:per_page],
+                         section=CONTACT_SECTIONS[CONTACT_SECTION_KEYS.index(group)],
+                         next_page=page + 1 if has_more else None)
 
 @dashboard_bp.route('/contactos/nuevo', methods=['GET', 'POST'])
 @login_required
@@ -348,6 +489,7 @@ def eliminar_contacto(contact_id):
 
 @dashboard_bp.route('/contactos/<int:contact_id>/llamar', methods=['POST'])
 @login_required
+@rate_limiter.limit('6/minute', by='user')
 def llamar_contacto(contact_id):
     """Iniciar llamada a un contacto."""
     from app.models import Contact, Robot
@@ -380,7 +522,19 @@ def llamar_contacto(contact_id):
         'name': contact.name
     }
     
-    mqtt_client.publish(topic, payload)
+    # La llamada no es en tiempo real: si el robot está desconectado queda en la bitácora
+    success = mqtt_client.publish(topic, payload, robot=robot,
+                                  ttl=current_app.config.get('COMMAND_JOURNAL_TTL'))
+    audit_log.record('contact.call', robot_id=robot.id, target=topic,
+                     status='ok' if success else 'error',
+                     details={'contact_id': contact.id, 'name': contact.name, 'phone': contact.phone})
+    
+    # Llamada de emergencia: guardar los minutos previos de la cámara del robot
+    if contact.is_emergency:
+        clip = video_recorder.save_clip(robot.id, 'emergency', user_id=current_user.id)
+        if clip:
+            audit_log.record('video.clip', robot_id=robot.id, target=f'clip:{clip}',
+                             details={'reason': 'emergency', 'contact_id': contact.id})
     
     # Actualizar última llamada
     contact.last_call = datetime.utcnow()
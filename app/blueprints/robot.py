@@ -3,12 +3,14 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, jsonify, request
 from flask_login import login_required, current_user
 from app import db
+from app.response_cache import response_cache
 from app.models import Robot
 
 robot_bp = Blueprint('robot', __name__)
 
 @robot_bp.route('/robots')
 @login_required
+@response_cache.conditional('robots')
 def select():
     """Muestra la lista de robots disponibles para el usuario."""
     # Usuarios comunes ven todos los robots públicos
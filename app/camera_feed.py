@@ -0,0 +1,180 @@
+# proyojo/app/camera_feed.py
+
+import time
+import logging
+import threading
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+SOI = b'\xff\xd8'   # inicio de imagen JPEG
+EOI = b'\xff\xd9'   # fin de imagen JPEG
+
+# Tamaño máximo de un cuadro; si el búfer crece más, el stream está corrupto
+MAX_FRAME_BYTES = 2 * 1024 * 1024
+
+
+def iter_jpeg_frames(stream, chunk_size=16384):
+    """
+    Extrae los cuadros JPEG de un stream MJPEG (multipart/x-mixed-replace).
+
+    No depende del boundary: busca los marcadores de inicio y fin de cada
+    imagen, así funciona con cualquier firmware de la ESP32-CAM.
+    """
+    buffer = bytearray()
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        buffer += chunk
+        while True:
+            start = buffer.find(SOI)
+            if start < 0:
+                del buffer[:-1]   # conservar un posible 0xff del marcador partido
+                break
+            end = buffer.find(EOI, start + 2)
+            if end < 0:
+                if start:
+                    del buffer[:start]
+                if len(buffer) > MAX_FRAME_BYTES:
+                    buffer.clear()
+                break
+            yield bytes(buffer[start:end + 2])
+            del buffer[:end + 2]
+
+
+def active_cameras(app):
+    """{robot_id: URL del stream} de los robots activos con cámara configurada."""
+    from app.models import Robot
+
+    with app.app_context():
+        return {robot.id: robot.camera_stream_url
+                for robot in Robot.query.filter(Robot.camera_ip.isnot(None), Robot.camera_ip != '',
+                                                Robot.is_active == True)}
+
+
+class CameraFeed:
+    """
+    Lectura única del stream de una cámara, compartida por varios consumidores.
+
+    Un hilo mantiene una sola conexión con la ESP32-CAM (que admite pocos
+    clientes a la vez) y entrega cada cuadro a los consumidores registrados
+    (grabador, análisis, empaquetador de video). Se reconecta con espera
+    creciente y se detiene cuando ya no quedan consumidores.
+    """
+
+    def __init__(self, robot_id, url, timeout=10):
+        self.robot_id = robot_id
+        self.url = url
+        self.timeout = timeout
+        self.frames = 0
+        self.connected = False
+        self.last_frame = None     # (timestamp, jpeg)
+        self.last_error = None
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add_listener(self, listener):
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+            # _run pone _thread en None bajo este mismo lock al salir: o el
+            # hilo actual ve al nuevo consumidor, o se arranca otro
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f'camera-{self.robot_id}', daemon=True)
+                self._thread.start()
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    @property
+    def active(self):
+        with self._lock:
+            return bool(self._listeners)
+
+    def _run(self):
+        backoff = 1
+        while True:
+            # La decisión de terminar se toma con el lock de add_listener
+            with self._lock:
+                if not self._listeners:
+                    self._thread = None
+                    return
+            try:
+                with urllib.request.urlopen(self.url, timeout=self.timeout) as stream:
+                    self.connected = True
+                    self.last_error = None
+                    backoff = 1
+                    logger.info(f"Cámara del robot {self.robot_id} conectada: {self.url}")
+                    for jpeg in iter_jpeg_frames(stream):
+                        self._deliver(time.time(), jpeg)
+                        if not self.active:
+                            break
+            except Exception as e:
+                if self.last_error is None:
+                    logger.warning(f"Sin conexión con la cámara del robot {self.robot_id} ({self.url}): {str(e)}")
+                self.last_error = str(e)
+            self.connected = False
+            if self.active:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+    def _deliver(self, timestamp, jpeg):
+        self.frames += 1
+        self.last_frame = (timestamp, jpeg)
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(timestamp, jpeg)
+            except Exception as e:
+                logger.error(f"Error al procesar un cuadro de la cámara {self.robot_id}: {str(e)}")
+
+
+class CameraFeeds:
+    """Registro de las lecturas de cámara activas, una por robot."""
+
+    def __init__(self):
+        self._feeds = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, robot_id, url, listener):
+        """Registra un consumidor de cuadros; abre la conexión si es el primero."""
+        with self._lock:
+            feed = self._feeds.get(robot_id)
+            previous = []
+            if feed is not None and feed.url != url:
+                # Cambió la IP de la cámara: los consumidores pasan a la nueva conexión
+                with feed._lock:
+                    previous, feed._listeners = feed._listeners, []
+                feed = None
+            if feed is None:
+                feed = self._feeds[robot_id] = CameraFeed(robot_id, url)
+        for existing in previous:
+            feed.add_listener(existing)
+        feed.add_listener(listener)
+        return feed
+
+    def unsubscribe(self, robot_id, listener):
+        with self._lock:
+            feed = self._feeds.get(robot_id)
+        if feed is not None:
+            feed.remove_listener(listener)
+
+    def get(self, robot_id):
+        return self._feeds.get(robot_id)
+
+    def status(self):
+        with self._lock:
+            feeds = list(self._feeds.values())
+        return {feed.robot_id: {'url': feed.url, 'connected': feed.connected, 'frames': feed.frames,
+                                'last_frame': feed.last_frame[0] if feed.last_frame else None,
+                                'error': feed.last_error}
+                for feed in feeds}
+
+
+# Instancia global de las lecturas de cámara
+camera_feeds = CameraFeeds()
@@ -0,0 +1,303 @@
+# proyojo/app/command_ack.py
+
+import json
+import math
+import time
+import secrets
+import logging
+import threading
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Límites superiores (ms) de las cubetas de los histogramas de latencia
+LATENCY_BUCKETS = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+# Tramos medidos de cada comando:
+#   browser: navegador -> Flask (reloj del navegador; aproximado)
+#   server:  Flask recibe la petición -> paho acepta el paquete
+#   robot:   publicación -> llega el ack (broker -> ESP32 -> broker -> Flask)
+#   total:   navegador (o Flask) -> ack
+STAGES = ('browser', 'server', 'robot', 'total')
+
+
+def new_command_id():
+    """Identificador de correlación corto para un comando."""
+    return secrets.token_hex(8)
+
+
+class LatencyHistogram:
+    """Histograma de latencias con cubetas fijas (memoria constante)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # la última cubeta es > buckets[-1]
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect_left(self.buckets, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        """Percentil aproximado: límite superior de la cubeta que lo contiene."""
+        if not self.count:
+            return None
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 1) if self.count else None,
+            'max_ms': round(self.max, 1),
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+            'buckets': {f'le_{b}': n for b, n in zip(self.buckets, self.counts)} | {'inf': self.counts[-1]},
+        }
+
+
+class TimerWheel:
+    """
+    Rueda de temporizadores (hashed timing wheel).
+
+    Cada comando pendiente va a la ranura de su tick de vencimiento, así
+    registrar y cancelar son O(1) y el avance solo revisa las ranuras de
+    los ticks transcurridos, sin recorrer todos los pendientes.
+    """
+
+    def __init__(self, resolution=0.05, slots=512):
+        self.resolution = resolution
+        self.slots = [{} for _ in range(slots)]
+        self.tick = self._tick_at(time.monotonic())
+
+    def _tick_at(self, moment):
+        return int(moment / self.resolution)
+
+    def add(self, key, deadline, value):
+        """Agrega un temporizador; devuelve el tick con el que se puede cancelar."""
+        tick = max(math.ceil(deadline / self.resolution), self.tick + 1)
+        self.slots[tick % len(self.slots)][key] = (tick, value)
+        return tick
+
+    def cancel(self, key, tick):
+        return self.slots[tick % len(self.slots)].pop(key, None) is not None
+
+    def advance(self, now):
+        """Avanza hasta `now` y devuelve [(key, value)] de los temporizadores vencidos."""
+        expired = []
+        target = self._tick_at(now)
+        # Tras una pausa larga basta con una vuelta completa a la rueda
+        start = max(self.tick + 1, target - len(self.slots) + 1)
+        for tick in range(start, target + 1):
+            slot = self.slots[tick % len(self.slots)]
+            for key, (due, value) in list(slot.items()):
+                if due <= target:
+                    del slot[key]
+                    expired.append((key, value))
+        self.tick = max(self.tick, target)
+        return expired
+
+
+class PendingCommand:
+    """Comando enviado que espera su ack."""
+
+    __slots__ = ('command_id', 'robot_id', 'robot_key', 'action', 'client_sent', 'received',
+                 'published', 'tick', 'event', 'ack')
+
+    def __init__(self, command_id, robot_id, robot_key, action, client_sent, received):
+        self.command_id = command_id
+        self.robot_id = robot_id
+        self.robot_key = robot_key
+        self.action = action
+        self.client_sent = client_sent   # epoch (s) según el navegador, o None
+        self.received = received         # epoch (s) en que Flask recibió la petición
+        self.published = None
+        self.tick = None
+        self.event = threading.Event()
+        self.ack = None
+
+
+class CommandAcks:
+    """
+    Seguimiento de acks de comandos y latencias por robot.
+
+    Cada comando lleva un id de correlación; el robot responde en
+    jojo/<serial>/ack con {"id": ..., "status": "ok"|"error"}. Los
+    pendientes viven en un diccionario por id más una rueda de
+    temporizadores para los vencimientos (COMMAND_ACK_TIMEOUT). Con cada ack
+    se alimentan los histogramas del robot; los que vencen cuentan como
+    timeouts.
+    """
+
+    def __init__(self):
+        self.timeout = 5.0
+        self.max_wait = 5.0
+        self._lock = threading.Lock()
+        self._pending = {}      # command_id -> PendingCommand
+        self._wheel = TimerWheel()
+        self._stats = {}        # robot_id -> {'stages': {stage: histograma}, 'acked', 'errors', 'timeouts'}
+        self._wake = threading.Event()
+        self._worker = None
+
+    def init_app(self, app):
+        self.timeout = app.config.get('COMMAND_ACK_TIMEOUT', self.timeout)
+        self.max_wait = app.config.get('COMMAND_ACK_MAX_WAIT', self.max_wait)
+
+    # --- API pública -------------------------------------------------------
+
+    def register(self, robot, action, command_id=None, client_sent=None, received=None):
+        """
+        Registra un comando antes de publicarlo (el ack puede llegar enseguida).
+
+        Args:
+            robot (Robot): Robot destino
+            action (str): Acción enviada
+            client_sent (float): Epoch en segundos según el navegador (opcional)
+            received (float): Epoch en que llegó la petición (por defecto ahora)
+
+        Returns:
+            PendingCommand
+        """
+        pending = PendingCommand(command_id or new_command_id(), robot.id, robot.mqtt_topic,
+                                 action, client_sent, received or time.time())
+        with self._lock:
+            self._pending[pending.command_id] = pending
+            pending.tick = self._wheel.add(pending.command_id, time.monotonic() + self.timeout, pending)
+        self._ensure_worker()
+        self._wake.set()
+        return pending
+
+    def published(self, pending, ok=True):
+        """Marca el momento en que paho aceptó el paquete; si falló, deja de esperar."""
+        pending.published = time.time()
+        if not ok:
+            with self._lock:
+                if self._pending.pop(pending.command_id, None) is not None:
+                    self._wheel.cancel(pending.command_id, pending.tick)
+            pending.event.set()
+
+    def wait(self, pending, timeout):
+        """
+        Espera el ack hasta `timeout` segundos (acotado por COMMAND_ACK_MAX_WAIT).
+
+        Returns:
+            dict: El ack con sus latencias, o None si no llegó a tiempo
+        """
+        pending.event.wait(max(0.0, min(timeout, self.max_wait)))
+        return pending.ack
+
+    def handle_ack(self, robot_key, payload):
+        """Procesa jojo/<serial>/ack {"id": ..., "status": ..., "exec_ms": ...}."""
+        received = time.time()
+        try:
+            data = json.loads(payload)
+            command_id = data['id']
+        except (ValueError, TypeError, KeyError):
+            logger.warning(f"Ack inválido de {robot_key}: {payload}")
+            return
+
+        with self._lock:
+            pending = self._pending.pop(command_id, None)
+            if pending is None:
+                return   # vencido o de otro proceso
+            if pending.robot_key != robot_key:
+                # Un robot no puede confirmar comandos de otro
+                self._pending[command_id] = pending
+                return
+            self._wheel.cancel(command_id, pending.tick)
+
+            status = data.get('status', 'ok')
+            latency = self._latencies(pending, received)
+            stats = self._robot_stats(pending.robot_id)
+            for stage, ms in latency.items():
+                stats['stages'][stage].observe(ms)
+            stats['acked' if status == 'ok' else 'errors'] += 1
+
+        pending.ack = {
+            'id': command_id,
+            'status': status,
+            'exec_ms': data.get('exec_ms'),
+            'latency_ms': {stage: round(ms, 1) for stage, ms in latency.items()},
+        }
+        pending.event.set()
+
+    def stats(self, robot_id):
+        """Histogramas de latencia y contadores de un robot."""
+        with self._lock:
+            stats = self._stats.get(robot_id)
+            if stats is None:
+                return {'acked': 0, 'errors': 0, 'timeouts': 0, 'pending': 0, 'latency': {}}
+            pending = sum(1 for p in self._pending.values() if p.robot_id == robot_id)
+            return {
+                'acked': stats['acked'],
+                'errors': stats['errors'],
+                'timeouts': stats['timeouts'],
+                'pending': pending,
+                'latency': {stage: h.as_dict() for stage, h in stats['stages'].items() if h.count},
+            }
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    # --- Internos ----------------------------------------------------------
+
+    @staticmethod
+    def _latencies(pending, acked):
+        latency = {}
+        published = pending.published or pending.received
+        if pending.client_sent is not None and pending.client_sent <= pending.received:
+            latency['browser'] = (pending.received - pending.client_sent) * 1000
+        latency['server'] = (published - pending.received) * 1000
+        latency['robot'] = (acked - published) * 1000
+        start = pending.client_sent if 'browser' in latency else pending.received
+        latency['total'] = (acked - start) * 1000
+        return latency
+
+    def _robot_stats(self, robot_id):
+        stats = self._stats.get(robot_id)
+        if stats is None:
+            stats = {'stages': {stage: LatencyHistogram() for stage in STAGES},
+                     'acked': 0, 'errors': 0, 'timeouts': 0}
+            self._stats[robot_id] = stats
+        return stats
+
+    def _ensure_worker(self):
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='command-acks', daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                idle = not self._pending
+            if idle:
+                # Sin pendientes no hay que avanzar la rueda
+                self._wake.wait()
+                self._wake.clear()
+            time.sleep(self._wheel.resolution)
+            with self._lock:
+                expired = self._wheel.advance(time.monotonic())
+                for command_id, pending in expired:
+                    if self._pending.pop(command_id, None) is not None:
+                        self._robot_stats(pending.robot_id)['timeouts'] += 1
+            for command_id, pending in expired:
+                logger.warning(f"Sin ack del comando {command_id} ({pending.action}) "
+                               f"para {pending.robot_key} en {self.timeout}s")
+                pending.event.set()
+
+
+# Instancia global del seguimiento de acks
+command_acks = CommandAcks()
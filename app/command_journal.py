@@ -0,0 +1,276 @@
+# proyojo/app/command_journal.py
+
+import os
+import re
+import json
+import time
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class CommandJournal:
+    """
+    Bitácora persistente (append-only) de comandos no urgentes por robot.
+
+    Cuando un robot está fuera de línea, los comandos con TTL (notificaciones,
+    mensajes en display, llamadas) se anexan a archivos de segmento en disco
+    y se reenvían en orden cuando el robot publica que vuelve a estar en línea.
+    Toda la E/S ocurre en un hilo propio, por lo que el camino de comandos
+    en tiempo real nunca espera al disco.
+
+    Estructura en disco:
+        <COMMAND_JOURNAL_DIR>/<robot>/index.json
+        <COMMAND_JOURNAL_DIR>/<robot>/00000001.seg   (una línea JSON por comando)
+    """
+
+    def __init__(self):
+        self.base_dir = None
+        self.segment_bytes = 256 * 1024
+        self.default_ttl = 3600
+        self._publisher = None
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._pending = {}   # robot -> comandos pendientes de reenvío
+        self._online = {}    # robot -> último estado conocido
+
+    def init_app(self, app, publisher):
+        """
+        Configura la bitácora y arranca el hilo de escritura.
+
+        Args:
+            app: Aplicación Flask
+            publisher (callable): Función publisher(topic, payload, qos) -> bool
+                usada para reenviar los comandos
+        """
+        self.base_dir = app.config.get('COMMAND_JOURNAL_DIR') or \
+            os.path.join(app.instance_path, 'command_journal')
+        self.segment_bytes = app.config.get('COMMAND_JOURNAL_SEGMENT_BYTES', self.segment_bytes)
+        self.default_ttl = app.config.get('COMMAND_JOURNAL_TTL', self.default_ttl)
+        self._publisher = publisher
+
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._load_pending()
+
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='command-journal', daemon=True)
+            self._worker.start()
+
+    # --- API pública -------------------------------------------------------
+
+    def should_journal(self, robot_key):
+        """Indica si un comando para el robot debe pasar por la bitácora."""
+        with self._lock:
+            return self._pending.get(robot_key, 0) > 0 or self._online.get(robot_key) is False
+
+    def append(self, robot_key, topic, payload, qos=1, ttl=None):
+        """Encola un comando para guardarlo en la bitácora del robot (no bloquea)."""
+        now = time.time()
+        record = {
+            'topic': topic,
+            'payload': payload,
+            'qos': qos,
+            'created': now,
+            'expires': now + (ttl if ttl is not None else self.default_ttl)
+        }
+        with self._lock:
+            self._pending[robot_key] = self._pending.get(robot_key, 0) + 1
+        self._queue.put(('append', robot_key, record))
+
+    def set_online(self, robot_key, online):
+        """Registra el estado del robot y dispara el reenvío si vuelve en línea."""
+        with self._lock:
+            was_online = self._online.get(robot_key)
+            self._online[robot_key] = online
+            has_pending = self._pending.get(robot_key, 0) > 0
+        if online and (was_online is not True or has_pending):
+            self._queue.put(('replay', robot_key, None))
+
+    def replay_all(self):
+        """Reenvía los pendientes de todos los robots no marcados fuera de línea."""
+        self._queue.put(('replay_all', None, None))
+
+    def compact(self):
+        """Solicita la compactación de todas las bitácoras (elimina lo expirado)."""
+        self._queue.put(('compact', None, None))
+
+    def pending_count(self, robot_key):
+        """Número de comandos pendientes de reenvío para un robot."""
+        with self._lock:
+            return self._pending.get(robot_key, 0)
+
+    # --- Hilo de trabajo ---------------------------------------------------
+
+    def _run(self):
+        while True:
+            op, robot_key, record = self._queue.get()
+            try:
+                if op == 'append':
+                    self._write(robot_key, record)
+                elif op == 'replay':
+                    self._replay(robot_key)
+                elif op == 'replay_all':
+                    with self._lock:
+                        keys = [k for k, n in self._pending.items()
+                                if n > 0 and self._online.get(k) is not False]
+                    for key in keys:
+                        self._replay(key)
+                elif op == 'compact':
+                    for key in self._robot_keys():
+                        self._compact(key, self._read_index(key))
+            except Exception as e:
+                logger.error(f"Error en la bitácora de comandos ({op}, {robot_key}): {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    # --- Archivos ----------------------------------------------------------
+
+    @staticmethod
+    def _dir_name(robot_key):
+        return re.sub(r'[^A-Za-z0-9_.-]', '_', robot_key)
+
+    def _robot_dir(self, robot_key):
+        return os.path.join(self.base_dir, self._dir_name(robot_key))
+
+    def _robot_keys(self):
+        keys = []
+        for name in os.listdir(self.base_dir):
+            index = self._read_index_file(os.path.join(self.base_dir, name, 'index.json'))
+            if index and index.get('robot'):
+                keys.append(index['robot'])
+        return keys
+
+    @staticmethod
+    def _read_index_file(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _read_index(self, robot_key):
+        index = self._read_index_file(os.path.join(self._robot_dir(robot_key), 'index.json'))
+        return index or {'robot': robot_key, 'next_seq': 1, 'delivered_seq': 0, 'segments': []}
+
+    def _write_index(self, robot_key, index):
+        path = os.path.join(self._robot_dir(robot_key), 'index.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _load_pending(self):
+        """Recupera los contadores de pendientes tras un reinicio."""
+        now = time.time()
+        for key in self._robot_keys():
+            index = self._read_index(key)
+            pending = sum(
+                seg['last_seq'] - max(seg['first_seq'] - 1, index['delivered_seq'])
+                for seg in index['segments']
+                if seg['last_seq'] > index['delivered_seq'] and seg['max_expires'] > now
+            )
+            if pending:
+                self._pending[key] = pending
+
+    def _write(self, robot_key, record):
+        os.makedirs(self._robot_dir(robot_key), exist_ok=True)
+        index = self._read_index(robot_key)
+
+        seq = index['next_seq']
+        record['seq'] = seq
+        line = json.dumps(record) + '\n'
+
+        segments = index['segments']
+        if not segments or segments[-1]['bytes'] + len(line) > self.segment_bytes:
+            segments.append({'name': f'{seq:08d}.seg', 'first_seq': seq,
+                             'last_seq': seq - 1, 'bytes': 0, 'max_expires': 0})
+        segment = segments[-1]
+
+        with open(os.path.join(self._robot_dir(robot_key), segment['name']), 'a', encoding='utf-8') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+        segment['last_seq'] = seq
+        segment['bytes'] += len(line)
+        segment['max_expires'] = max(segment['max_expires'], record['expires'])
+        index['next_seq'] = seq + 1
+        self._write_index(robot_key, index)
+
+        # Si el robot ya está en línea (p. ej. había pendientes), reenviar enseguida
+        with self._lock:
+            online = self._online.get(robot_key)
+        if online:
+            self._replay(robot_key, index)
+
+    def _replay(self, robot_key, index=None):
+        """Reenvía en orden los comandos no entregados y no expirados."""
+        index = index or self._read_index(robot_key)
+        start_seq = index['delivered_seq']
+        now = time.time()
+        sent = 0
+
+        for segment in index['segments']:
+            if segment['last_seq'] <= index['delivered_seq']:
+                continue
+            path = os.path.join(self._robot_dir(robot_key), segment['name'])
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record['seq'] <= index['delivered_seq']:
+                        continue
+                    with self._lock:
+                        if self._online.get(robot_key) is False:
+                            self._finish_replay(robot_key, index, start_seq, sent)
+                            return
+                    if record['expires'] > now:
+                        if not self._publisher(record['topic'], record['payload'], record['qos']):
+                            self._finish_replay(robot_key, index, start_seq, sent)
+                            return
+                        sent += 1
+                    index['delivered_seq'] = record['seq']
+
+        self._finish_replay(robot_key, index, start_seq, sent)
+
+    def _finish_replay(self, robot_key, index, start_seq, sent):
+        with self._lock:
+            self._pending[robot_key] = max(
+                0, self._pending.get(robot_key, 0) - (index['delivered_seq'] - start_seq))
+        self._compact(robot_key, index)
+        if sent:
+            logger.info(f"Bitácora: {sent} comandos reenviados a {robot_key}")
+
+    def _compact(self, robot_key, index):
+        """
+        Elimina los segmentos iniciales ya entregados o completamente expirados.
+
+        Solo se compacta el prefijo de la bitácora para no saltarse comandos
+        anteriores aún pendientes. El último segmento se conserva porque es
+        el que recibe las nuevas escrituras.
+        """
+        now = time.time()
+        segments = index['segments']
+        while len(segments) > 1:
+            segment = segments[0]
+            if segment['last_seq'] > index['delivered_seq'] and segment['max_expires'] > now:
+                break
+            try:
+                os.remove(os.path.join(self._robot_dir(robot_key), segment['name']))
+            except OSError:
+                pass
+            if segment['last_seq'] > index['delivered_seq']:
+                skipped = segment['last_seq'] - index['delivered_seq']
+                index['delivered_seq'] = segment['last_seq']
+                with self._lock:
+                    self._pending[robot_key] = max(0, self._pending.get(robot_key, 0) - skipped)
+            segments.pop(0)
+        self._write_index(robot_key, index)
+
+
+# Instancia global de la bitácora de comandos
+command_journal = CommandJournal()
@@ -2,7 +2,7 @@
 
 import click
 from app import db
-from app.models import Role, User, Robot, Contact  # <-- Añadimos Contact aquí
+from app.models import Role, User, Robot
 
 # El comando seed-roles no necesita cambios, pero lo dejamos para que el archivo esté completo.
 @click.command('seed-roles')
@@ -73,7 +73,8 @@ def create_admin_command(username, email, password):
 @click.option('--username', prompt='Usuario propietario', help='Nombre de usuario del propietario.')
 @click.option('--camera-ip', prompt='IP de la cámara ESP32-CAM', default='', help='IP de la ESP32-CAM (opcional).')
 @click.option('--mqtt-topic', default=None, help='Tópico MQTT base (opcional, se generará automáticamente si no se proporciona).')
-def create_robot_command(name, serial, username, camera_ip, mqtt_topic):
+@click.option('--group', 'fleet_group', default=None, help='Grupo de la flota (opcional, p. ej. "Pabellón A").')
+def create_robot_command(name, serial, username, camera_ip, mqtt_topic, fleet_group):
     """Crea un nuevo robot y lo asocia a un usuario."""
     
     click.echo("Iniciando creación de robot...")
@@ -99,6 +100,7 @@ def create_robot_command(name, serial, username, camera_ip, mqtt_topic):
         serial_number=serial,
         mqtt_topic=mqtt_topic,
         camera_ip=camera_ip if camera_ip else None,
+        fleet_group=fleet_group or None,
         user_id=user.id,
         is_active=True,
         is_online=False,
@@ -112,6 +114,8 @@ def create_robot_command(name, serial, username, camera_ip, mqtt_topic):
     click.echo(f"  - Número de serie: {serial}")
     click.echo(f"  - Propietario: {username}")
     click.echo(f"  - Tópico MQTT: {mqtt_topic}")
+    if fleet_group:
+        click.echo(f"  - Grupo: {fleet_group}")
     click.echo(f"  - Cámara ESP32-CAM: {camera_ip if camera_ip else 'No configurada'}")
     click.echo(f"  - Stream URL: {new_robot.camera_stream_url if camera_ip else 'N/A'}")
     click.echo(f"  - ID: {new_robot.id}")
@@ -119,75 +123,180 @@ def create_robot_command(name, serial, username, camera_ip, mqtt_topic):
 
 # --- Comando para crear contactos de emergencia ---
 @click.command('seed-emergency-contacts')
-@click.option('--username', prompt='Nombre de usuario', help='Usuario para el que se crearán los contactos de emergencia.')
-def seed_emergency_contacts_command(username):
-    """Crear contactos de emergencia predeterminados para un usuario."""
-    
-    user = User.query.filter_by(username=username).first()
-    
-    if not user:
-        click.echo(click.style(f'❌ Usuario {username} no encontrado.', fg='red'))
-        return
-    
-    # Contactos de emergencia comunes en México
-    emergency_contacts = [
-        {
-            'name': 'Cruz Roja',
-            'phone': '065',
-            'relationship': 'emergencia',
-            'is_emergency': True,
-            'notes': 'Servicio de ambulancias y emergencias médicas'
-        },
-        {
-            'name': 'Policía',
-            'phone': '911',
-            'relationship': 'emergencia',
-            'is_emergency': True,
-            'notes': 'Emergencias policiales y seguridad'
-        },
-        {
-            'name': 'Bomberos',
-            'phone': '068',
-            'relationship': 'emergencia',
-            'is_emergency': True,
-            'notes': 'Emergencias de incendios y rescate'
-        },
-        {
-            'name': 'Protección Civil',
-            'phone': '911',
-            'relationship': 'emergencia',
-            'is_emergency': True,
-            'notes': 'Emergencias y desastres naturales'
-        },
-        {
-            'name': 'Centro de Atención a Emergencias',
-            'phone': '911',
-            'relationship': 'emergencia',
-            'is_emergency': True,
-            'notes': 'Número único de emergencias'
-        }
-    ]
-    
-    created = 0
-    for contact_data in emergency_contacts:
-        # Verificar si ya existe
-        existing = Contact.query.filter_by(
-            user_id=user.id,
-            phone=contact_data['phone'],
-            name=contact_data['name']
-        ).first()
-        
-        if not existing:
-            contact = Contact(
-                user_id=user.id,
-                **contact_data
-            )
-            db.session.add(contact)
-            created += 1
-    
-    db.session.commit()
-    
-    click.echo(click.style(f'✅ {created} contactos de emergencia creados para {username}', fg='green'))
-    click.echo(click.style('📞 Contactos disponibles:', fg='blue'))
-    for contact in Contact.query.filter_by(user_id=user.id, is_emergency=True).all():
-        click.echo(f'   - {contact.name}: {contact.phone}')
+@click.option('--username', 'usernames', multiple=True, help='Usuario a sembrar (se puede repetir).')
+@click.option('--all', 'all_users', is_flag=True, help='Sembrar a todos los usuarios.')
+@click.option('--role', default=None, help='Solo usuarios con este rol (p. ej. user).')
+@click.option('--include-inactive', is_flag=True, help='Incluir usuarios desactivados.')
+@click.option('--dry-run', is_flag=True, help='Mostrar los cambios sin escribir.')
+def seed_emergency_contacts_command(usernames, all_users, role, include_inactive, dry_run):
+    """Crear o actualizar los contactos de emergencia predeterminados."""
+    from app.models import Role
+    from app.emergency_contacts import seed_emergency_contacts, EMERGENCY_CONTACTS
+
+    if not usernames and not all_users and not role:
+        usernames = (click.prompt('Nombre de usuario'),)
+
+    query = User.query
+    if usernames:
+        query = query.filter(User.username.in_(usernames))
+        found = {u for (u,) in query.with_entities(User.username)}
+        for username in set(usernames) - found:
+            click.echo(click.style(f'❌ Usuario {username} no encontrado.', fg='red'))
+    if role:
+        query = query.filter(User.roles.any(Role.name == role))
+    if not include_inactive:
+        query = query.filter(User.is_active.isnot(False))
+
+    result = seed_emergency_contacts(query, dry_run=dry_run)
+
+    prefix = '(simulación) ' if dry_run else ''
+    click.echo(click.style(
+        f"✅ {prefix}{result['users']} usuarios: {result['created']} contactos creados, "
+        f"{result['updated']} actualizados, {result['unchanged']} sin cambios", fg='green'))
+    click.echo(click.style('📞 Contactos de emergencia:', fg='blue'))
+    for contact in EMERGENCY_CONTACTS:
+        click.echo(f"   - {contact['name']}: {contact['phone']}")
+
+
+# --- Comando para construir los archivos estáticos con huella ---
+@click.command('build-assets')
+def build_assets_command():
+    """Genera static/dist: nombres con huella, .gz/.br y derivados WebP."""
+    from flask import current_app
+    from app.assets import build_assets, assets
+
+    click.echo("Construyendo archivos estáticos...")
+    manifest = build_assets(
+        current_app.static_folder,
+        widths=current_app.config.get('ASSET_IMAGE_WIDTHS', (240, 480, 960, 1920)),
+        quality=current_app.config.get('ASSET_IMAGE_QUALITY', 80)
+    )
+    assets.load()
+
+    click.echo(click.style(f"✓ {len(manifest['files'])} archivos con huella", fg='green'))
+    click.echo(f"  - Precomprimidos: {len(manifest['encodings'])}")
+    click.echo(f"  - Variantes WebP: {len(manifest['webp'])}")
+    click.echo(f"  - Imágenes redimensionadas: {len(manifest['sizes'])}")
+    if not manifest['webp']:
+        click.echo(click.style("  Instala Pillow para generar WebP y tamaños reducidos.", fg='yellow'))
+
+
+# --- Comando para medir el tiempo de arranque ---
+@click.command('bench-startup')
+@click.option('--runs', default=5, show_default=True, help='Arranques por modo.')
+@click.option('--command', 'cli_command', default='seed-roles', show_default=True,
+              help='Subcomando de `flask` que se simula en el modo CLI.')
+def bench_startup_command(runs, cli_command):
+    """Mide importación + create_app en modo web y CLI (procesos nuevos)."""
+    import os
+    import sys
+    import json
+    import statistics
+    import subprocess
+
+    # Cada arranque es un proceso nuevo: así se mide también la importación.
+    # El modo CLI se mide como lo carga `flask <comando>`: dentro de un
+    # contexto de click y con el subcomando en sys.argv, que es de donde
+    # create_app decide qué omitir (p. ej. Flask-Migrate).
+    script = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "from app import create_app\n"
+        "imported = time.perf_counter()\n"
+        "if len(sys.argv) > 1:\n"
+        "    import click\n"
+        "    sys.argv = ['flask'] + sys.argv[1:]\n"
+        "    with click.Context(click.Group('flask')):\n"
+        "        app = create_app()\n"
+        "else:\n"
+        "    app = create_app()\n"
+        "done = time.perf_counter()\n"
+        "data = app.extensions['startup']['profile'].as_dict()\n"
+        "data.update(import_ms=(imported - start) * 1000, create_ms=(done - imported) * 1000)\n"
+        "print('BENCH' + json.dumps(data))\n"
+    )
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    env = dict(os.environ, MQTT_ENABLED='false')
+    env.pop('STARTUP_MODE', None)
+    for mode, args in (('web', []), ('cli', [cli_command])):
+        samples = []
+        for _ in range(runs):
+            output = subprocess.run([sys.executable, '-c', script] + args, cwd=project_dir, env=env,
+                                    capture_output=True, text=True, check=True).stdout
+            line = next(l for l in output.splitlines() if l.startswith('BENCH'))
+            samples.append(json.loads(line[len('BENCH'):]))
+
+        import_ms = statistics.median(s['import_ms'] for s in samples)
+        create_ms = statistics.median(s['create_ms'] for s in samples)
+        label = f"{mode} (flask {cli_command})" if args else mode
+        click.echo(click.style(f"Modo {label}: importación {import_ms:.1f} ms + create_app {create_ms:.1f} ms "
+                               f"= {import_ms + create_ms:.1f} ms (mediana de {runs})", fg='green'))
+        for i, phase in enumerate(samples[0]['phases']):
+            ms = statistics.median(s['phases'][i]['ms'] for s in samples)
+            click.echo(f"  {phase['name']:<12} {ms:8.1f} ms  +{phase['modules']} módulos")
+
+
+# --- Importación y exportación masiva ---
+@click.command('import')
+@click.argument('entity', type=click.Choice(['users', 'robots', 'contacts', 'reminders']))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Formato del archivo (por defecto según la extensión).')
+@click.option('--batch-size', default=1000, show_default=True, help='Filas por lote (un commit por lote).')
+@click.option('--resume', is_flag=True, help='Continuar desde el último lote confirmado.')
+def import_command(entity, path, fmt, batch_size, resume):
+    """Importa usuarios, robots, contactos o recordatorios desde CSV/JSONL."""
+    from app.data_transfer import import_file
+
+    def progress(stats):
+        click.echo(f"  línea {stats.line}: {stats.inserted} insertadas, "
+                   f"{stats.skipped} existentes, {stats.invalid} inválidas")
+
+    click.echo(f"Importando {entity} desde {path}...")
+    stats = import_file(path, entity, fmt=fmt, batch_size=batch_size, resume=resume, progress=progress)
+
+    for line, message in stats.errors:
+        click.echo(click.style(f"  Línea {line}: {message}", fg='yellow'))
+    click.echo(click.style(f"✓ {stats.inserted} {entity} importados "
+                           f"({stats.skipped} ya existían, {stats.invalid} inválidos)", fg='green'))
+
+
+@click.command('export')
+@click.argument('entity', type=click.Choice(['users', 'robots', 'contacts', 'reminders']))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Formato del archivo (por defecto según la extensión).')
+def export_command(entity, path, fmt):
+    """Exporta usuarios, robots, contactos o recordatorios a CSV/JSONL."""
+    from app.data_transfer import export_file
+
+    written = export_file(path, entity, fmt=fmt, progress=lambda n: click.echo(f"  {n} filas..."))
+    click.echo(click.style(f"✓ {written} {entity} exportados a {path}", fg='green'))
+
+
+# --- Ventana de ocurrencias de recordatorios ---
+@click.command('extend-reminders')
+@click.option('--days', default=None, type=int, help='Días hacia adelante (por defecto REMINDER_WINDOW_DAYS).')
+def extend_reminders_command(days):
+    """Genera las ocurrencias de recordatorios que faltan y purga las antiguas."""
+    from app.reminder_occurrences import reminder_occurrences
+
+    if days is not None:
+        reminder_occurrences.window_days = days
+    inserted, pruned = reminder_occurrences.refresh()
+    click.echo(click.style(f"✓ Ventana hasta {reminder_occurrences.horizon():%Y-%m-%d}: "
+                           f"{inserted} ocurrencias nuevas, {pruned} purgadas", fg='green'))
+
+
+# --- Retención de la bitácora de auditoría ---
+@click.command('prune-audit-log')
+def prune_audit_log_command():
+    """Elimina los segmentos de auditoría más antiguos que AUDIT_LOG_RETENTION_DAYS."""
+    from app.audit_log import audit_log
+
+    removed = audit_log.prune()
+    if removed:
+        click.echo(click.style(f"✓ Segmentos eliminados: {', '.join(removed)}", fg='green'))
+    else:
+        click.echo("No hay segmentos fuera del periodo de retención.")
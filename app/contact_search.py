@@ -0,0 +1,259 @@
+# proyojo/app/contact_search.py
+
+import re
+import bisect
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from sqlalchemy import event, select
+
+logger = logging.getLogger(__name__)
+
+SEARCH_FIELDS = ('name', 'phone', 'notes', 'relationship')
+
+
+def normalize(text):
+    """Minúsculas y sin acentos: 'María' -> 'maria'."""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    """Divide el texto normalizado en palabras (letras y números)."""
+    return re.findall(r'[a-z0-9ñ]+', normalize(text))
+
+
+def _contact_tokens(data):
+    tokens = set()
+    for field in SEARCH_FIELDS:
+        tokens.update(tokenize(data.get(field)))
+    # El teléfono también se indexa como una sola cadena de dígitos
+    digits = ''.join(filter(str.isdigit, data.get('phone') or ''))
+    if digits:
+        tokens.add(digits)
+    return tokens
+
+
+def _snapshot(contact):
+    """Datos del contacto que guarda el índice (lo que devuelve la búsqueda)."""
+    return {
+        'id': contact.id,
+        'user_id': contact.user_id,
+        'name': contact.name,
+        'phone': contact.phone,
+        'notes': contact.notes,
+        'relationship': contact.relationship,
+        'is_emergency': bool(contact.is_emergency),
+        'is_favorite': bool(contact.is_favorite),
+    }
+
+
+class _UserIndex:
+    """Índice invertido de los contactos de un usuario con búsqueda por prefijo."""
+
+    def __init__(self, version=0):
+        self.version = version  # versión de 'contacts' en cache_version con la que se construyó
+        self.docs = {}        # contact_id -> snapshot
+        self.doc_tokens = {}  # contact_id -> set(tokens)
+        self.postings = {}    # token -> set(contact_id)
+        self.tokens = []      # tokens ordenados (para prefijos con bisect)
+
+    def add(self, data):
+        self.remove(data['id'])
+        tokens = _contact_tokens(data)
+        self.docs[data['id']] = data
+        self.doc_tokens[data['id']] = tokens
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                self.postings[token] = ids = set()
+                bisect.insort(self.tokens, token)
+            ids.add(data['id'])
+
+    def remove(self, contact_id):
+        self.docs.pop(contact_id, None)
+        for token in self.doc_tokens.pop(contact_id, ()):
+            ids = self.postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(contact_id)
+            if not ids:
+                del self.postings[token]
+                position = bisect.bisect_left(self.tokens, token)
+                if position < len(self.tokens) and self.tokens[position] == token:
+                    self.tokens.pop(position)
+
+    def prefix_ids(self, prefix):
+        ids = set()
+        position = bisect.bisect_left(self.tokens, prefix)
+        while position < len(self.tokens) and self.tokens[position].startswith(prefix):
+            ids |= self.postings[self.tokens[position]]
+            position += 1
+        return ids
+
+    def search(self, query, limit):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        matches = None
+        for term in terms:
+            ids = self.prefix_ids(term)
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+
+        first = terms[0]
+
+        def rank(contact_id):
+            data = self.docs[contact_id]
+            name = normalize(data['name'])
+            return (not data['is_emergency'] and not data['is_favorite'],
+                    not name.startswith(first),
+                    name)
+
+        return [self.docs[i] for i in sorted(matches, key=rank)[:limit]]
+
+
+class ContactSearchIndex:
+    """
+    Índice de búsqueda de contactos en memoria, uno por usuario.
+
+    Búsqueda por prefijo e insensible a acentos sobre nombre, teléfono,
+    notas y relación ("mar" encuentra a "María"). El índice de un usuario
+    se construye con una sola consulta la primera vez que se usa y luego se
+    mantiene al día con los eventos de SQLAlchemy al confirmar cada
+    creación, edición o eliminación. Se conservan como máximo
+    CONTACT_SEARCH_MAX_USERS índices (los menos usados se descartan).
+
+    Cada índice guarda la versión 'contacts' del usuario (tabla
+    cache_version, la misma de los ETag) y cada búsqueda la compara con la
+    actual: si otro proceso, `flask import` o una inserción masiva cambió
+    los contactos, el índice se reconstruye.
+    """
+
+    def __init__(self):
+        self.max_users = 500
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()   # user_id -> _UserIndex
+        self._listening = False
+
+    def init_app(self, app, db):
+        self.max_users = app.config.get('CONTACT_SEARCH_MAX_USERS', self.max_users)
+        if not self._listening:
+            event.listen(db.session, 'after_flush', self._after_flush)
+            event.listen(db.session, 'after_flush_postexec', self._after_flush_postexec)
+            event.listen(db.session, 'after_commit', self._after_commit)
+            event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+            self._listening = True
+
+    def search(self, user_id, query, limit=10):
+        """
+        Busca contactos del usuario.
+
+        Returns:
+            list[dict]: Contactos coincidentes, emergencias y favoritos primero
+        """
+        index = self._get_index(user_id)
+        with self._lock:
+            return index.search(query, limit)
+
+    def _get_index(self, user_id):
+        from app.models import Contact
+        from app.response_cache import response_cache
+
+        version = response_cache.versions([('contacts', user_id)])[0]
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None and index.version == version:
+                self._indexes.move_to_end(user_id)
+                return index
+
+        # La versión se lee antes que los contactos: un cambio intermedio
+        # solo provoca otra reconstrucción en la siguiente búsqueda
+        index = _UserIndex(version)
+        for contact in Contact.query.filter_by(user_id=user_id).all():
+            index.add(_snapshot(contact))
+
+        with self._lock:
+            self._indexes[user_id] = index
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    # --- Sincronización con la base de datos -----------------------------
+
+    def _after_flush(self, session, flush_context):
+        from app.models import Contact
+
+        changes = session.info.setdefault('contact_search_changes', [])
+        start = len(changes)
+        for obj in session.new | session.dirty:
+            if isinstance(obj, Contact):
+                changes.append(('add', _snapshot(obj)))
+        for obj in session.deleted:
+            if isinstance(obj, Contact):
+                changes.append(('remove', {'id': obj.id, 'user_id': obj.user_id}))
+        session.info['contact_search_flushed'] = {data['user_id'] for _, data in changes[start:]}
+
+    def _after_flush_postexec(self, session, flush_context):
+        """
+        Versión 'contacts' de cada usuario afectado tras este flush.
+
+        response_cache la incrementa una vez por flush en after_flush, así
+        que (versión final, flushes) permite saber al confirmar si el índice
+        estaba al día antes de esta transacción.
+        """
+        from app.models import CacheVersion
+
+        flushed = session.info.pop('contact_search_flushed', None)
+        if not flushed:
+            return
+        table = CacheVersion.__table__
+        rows = session.connection().execute(
+            select(table.c.user_id, table.c.version)
+            .where(table.c.scope == 'contacts', table.c.user_id.in_(flushed))
+        )
+        versions = session.info.setdefault('contact_search_versions', {})
+        for user_id, version in rows:
+            flushes = versions.get(user_id, (0, 0))[1] + 1
+            versions[user_id] = (version, flushes)
+
+    def _after_commit(self, session):
+        changes = session.info.pop('contact_search_changes', None)
+        versions = session.info.pop('contact_search_versions', {})
+        if not changes:
+            return
+        with self._lock:
+            stale = set()
+            for op, data in changes:
+                # Solo se actualizan los índices ya construidos
+                user_id = data['user_id']
+                index = self._indexes.get(user_id)
+                if index is None:
+                    continue
+                version, flushes = versions.get(user_id, (None, 0))
+                if version is None or index.version != version - flushes:
+                    # Hubo cambios de otro origen: se reconstruye al buscar
+                    stale.add(user_id)
+                    continue
+                if op == 'add':
+                    index.add(data)
+                else:
+                    index.remove(data['id'])
+            for user_id, (version, _) in versions.items():
+                index = self._indexes.get(user_id)
+                if index is not None and user_id not in stale:
+                    index.version = version
+            for user_id in stale:
+                self._indexes.pop(user_id, None)
+
+    def _after_rollback(self, session, previous_transaction):
+        session.info.pop('contact_search_changes', None)
+        session.info.pop('contact_search_versions', None)
+        session.info.pop('contact_search_flushed', None)
+
+
+# Instancia global del índice de búsqueda de contactos
+contact_search = ContactSearchIndex()
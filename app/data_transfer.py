@@ -0,0 +1,483 @@
+# proyojo/app/data_transfer.py
+
+import os
+import csv
+import json
+import logging
+from datetime import datetime
+from sqlalchemy.orm import noload
+from werkzeug.security import generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Columnas de cada entidad en los archivos (las referencias a usuarios van
+# por username, no por id, para poder mover datos entre instalaciones)
+COLUMNS = {
+    'users': ['username', 'email', 'password_hash', 'first_name', 'last_name',
+              'is_active', 'roles', 'created_at'],
+    'robots': ['name', 'serial_number', 'mqtt_topic', 'camera_ip', 'description',
+               'is_active', 'is_public', 'fleet_group', 'owner', 'created_at'],
+    'contacts': ['owner', 'name', 'phone', 'email', 'address', 'relationship',
+                 'is_emergency', 'is_favorite', 'notes', 'created_at'],
+    'reminders': ['owner', 'title', 'description', 'reminder_time', 'category',
+                  'is_completed', 'is_active', 'repeat', 'robot_notification',
+                  'created_at', 'completed_at'],
+}
+
+
+class RowError(Exception):
+    """Fila inválida (se omite y se reporta con su número de línea)."""
+
+
+class ImportStats:
+    """Conteos de una importación."""
+
+    def __init__(self, line=0, read=0, inserted=0, skipped=0, invalid=0):
+        self.line = line          # última línea confirmada (para reanudar)
+        self.read = read
+        self.inserted = inserted
+        self.skipped = skipped    # ya existían (clave duplicada)
+        self.invalid = invalid
+        self.errors = []          # (línea, mensaje), solo los primeros
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < 50:
+            self.errors.append((line, message))
+
+    def as_dict(self):
+        return {'line': self.line, 'read': self.read, 'inserted': self.inserted,
+                'skipped': self.skipped, 'invalid': self.invalid}
+
+
+# --- Conversión de valores ----------------------------------------------------
+
+def _text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _bool(value, default):
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 't', 'si', 'sí', 'yes', 'y')
+
+
+def _datetime(value, default=None):
+    if value is None or value == '':
+        return default
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value).strip())
+    except ValueError:
+        raise RowError(f"fecha inválida: {value!r}")
+
+
+def _required(row, *fields):
+    values = []
+    for field in fields:
+        value = _text(row.get(field))
+        if value is None:
+            raise RowError(f"falta el campo '{field}'")
+        values.append(value)
+    return values
+
+
+def _detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+# --- Lectura y escritura en streaming -------------------------------------------
+
+def read_rows(path, fmt=None):
+    """Genera (número de línea, dict) sin cargar el archivo completo."""
+    fmt = _detect_format(path, fmt)
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if fmt == 'csv':
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_no, line in enumerate(f, start=1):
+                line = line.strip()
+                if line:
+                    try:
+                        yield line_no, json.loads(line)
+                    except ValueError:
+                        yield line_no, None
+
+
+class _Writer:
+    def __init__(self, f, fmt, columns):
+        self.f = f
+        self.fmt = fmt
+        self.columns = columns
+        if fmt == 'csv':
+            self.csv = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+            self.csv.writeheader()
+
+    def write(self, row):
+        row = {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in row.items()}
+        if self.fmt == 'csv':
+            self.csv.writerow(row)
+        else:
+            self.f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+# --- Importadores por entidad (un lote a la vez) --------------------------------
+
+class _Context:
+    """Datos compartidos entre lotes: ids de usuarios y roles ya resueltos."""
+
+    def __init__(self):
+        self.user_ids = {}      # username -> id
+        self.roles = None       # nombre -> id
+        self.touched = set()    # (ámbito, user_id) para invalidar cachés
+
+
+def _resolve_users(ctx, usernames):
+    """Resuelve usernames -> id con una sola consulta por lote."""
+    from app.models import User
+
+    missing = {name for name in usernames if name and name not in ctx.user_ids}
+    if missing:
+        rows = User.query.with_entities(User.username, User.id) \
+            .filter(User.username.in_(missing)).all()
+        ctx.user_ids.update(rows)
+
+
+def _import_users(session, batch, stats, ctx):
+    from app.models import User, Role, user_roles
+    from app.database import bulk_insert
+
+    if ctx.roles is None:
+        ctx.roles = dict(Role.query.with_entities(Role.name, Role.id).all())
+
+    parsed = []
+    for line, row in batch:
+        try:
+            username, email = _required(row, 'username', 'email')
+            password_hash = _text(row.get('password_hash'))
+            if not password_hash:
+                password = _text(row.get('password'))
+                if not password:
+                    raise RowError("falta 'password' o 'password_hash'")
+                password_hash = generate_password_hash(password)
+            roles = [r.strip() for r in (_text(row.get('roles')) or 'user').split(',') if r.strip()]
+            unknown = [r for r in roles if r not in ctx.roles]
+            if unknown:
+                raise RowError(f"rol desconocido: {', '.join(unknown)}")
+            parsed.append((line, roles, {
+                'username': username,
+                'email': email,
+                'password_hash': password_hash,
+                'first_name': _text(row.get('first_name')),
+                'last_name': _text(row.get('last_name')),
+                'is_active': _bool(row.get('is_active'), True),
+                'created_at': _datetime(row.get('created_at'), datetime.utcnow()),
+                'last_login': None,
+            }))
+        except RowError as e:
+            stats.error(line, str(e))
+
+    # Unicidad en bloque: una consulta por lote para username y email
+    usernames = {p[2]['username'] for p in parsed}
+    emails = {p[2]['email'] for p in parsed}
+    taken_names = {u for (u,) in session.query(User.username).filter(User.username.in_(usernames))}
+    taken_emails = {e for (e,) in session.query(User.email).filter(User.email.in_(emails))}
+
+    rows, roles_by_name = [], {}
+    for line, roles, data in parsed:
+        if data['username'] in taken_names or data['email'] in taken_emails:
+            stats.skipped += 1
+            continue
+        taken_names.add(data['username'])
+        taken_emails.add(data['email'])
+        rows.append(data)
+        roles_by_name[data['username']] = roles
+
+    stats.inserted += bulk_insert(session, User.__table__, rows)
+    if rows:
+        _resolve_users(ctx, roles_by_name)
+        bulk_insert(session, user_roles, [
+            {'user_id': ctx.user_ids[name], 'role_id': ctx.roles[role]}
+            for name, roles in roles_by_name.items() for role in set(roles)
+        ])
+
+
+def _import_robots(session, batch, stats, ctx):
+    from app.models import Robot
+    from app.database import bulk_insert
+
+    _resolve_users(ctx, {_text(row.get('owner')) for _, row in batch})
+
+    parsed = []
+    for line, row in batch:
+        try:
+            name, serial = _required(row, 'name', 'serial_number')
+            owner = _text(row.get('owner'))
+            if owner and owner not in ctx.user_ids:
+                raise RowError(f"usuario desconocido: {owner}")
+            parsed.append({
+                'name': name,
+                'serial_number': serial,
+                'mqtt_topic': _text(row.get('mqtt_topic')) or f"jojo/{serial.lower().replace(' ', '_')}",
+                'camera_ip': _text(row.get('camera_ip')),
+                'description': _text(row.get('description')),
+                'is_active': _bool(row.get('is_active'), True),
+                'is_online': False,
+                'battery_level': 100,
+                'last_seen': None,
+                'is_public': _bool(row.get('is_public'), True),
+                'fleet_group': _text(row.get('fleet_group')),
+                'user_id': ctx.user_ids.get(owner),
+                'created_at': _datetime(row.get('created_at'), datetime.utcnow()),
+            })
+        except RowError as e:
+            stats.error(line, str(e))
+
+    serials = {p['serial_number'] for p in parsed}
+    taken = {s for (s,) in session.query(Robot.serial_number).filter(Robot.serial_number.in_(serials))}
+    rows = []
+    for data in parsed:
+        if data['serial_number'] in taken:
+            stats.skipped += 1
+            continue
+        taken.add(data['serial_number'])
+        rows.append(data)
+
+    stats.inserted += bulk_insert(session, Robot.__table__, rows)
+    if rows:
+        ctx.touched.add(('robots', 0))
+
+
+def _import_owned(session, batch, stats, ctx, model, parse, key):
+    """
+    Contactos y recordatorios: filas de un usuario (columna owner).
+
+    Una fila se omite si ya existe otra con la misma clave natural para ese
+    usuario, así volver a importar el mismo archivo no duplica nada.
+    """
+    from app.database import bulk_insert
+
+    _resolve_users(ctx, {_text(row.get('owner')) for _, row in batch})
+
+    parsed = []
+    for line, row in batch:
+        try:
+            (owner,) = _required(row, 'owner')
+            if owner not in ctx.user_ids:
+                raise RowError(f"usuario desconocido: {owner}")
+            data = parse(row)
+            data['user_id'] = ctx.user_ids[owner]
+            parsed.append(data)
+        except RowError as e:
+            stats.error(line, str(e))
+
+    # Claves existentes de los usuarios del lote, en una sola consulta
+    user_ids = {data['user_id'] for data in parsed}
+    key_columns = [getattr(model, column) for column in key]
+    existing = set(session.query(*key_columns).filter(model.user_id.in_(user_ids)).all()) \
+        if user_ids else set()
+
+    rows = []
+    for data in parsed:
+        natural_key = tuple(data[column] for column in key)
+        if natural_key in existing:
+            stats.skipped += 1
+            continue
+        existing.add(natural_key)
+        rows.append(data)
+
+    stats.inserted += bulk_insert(session, model.__table__, rows)
+    scope = 'contacts' if model.__tablename__ == 'contact' else 'reminders'
+    ctx.touched.update((scope, data['user_id']) for data in rows)
+
+
+def _parse_contact(row):
+    from app.phone_numbers import normalize_phone, format_phone
+
+    name, phone = _required(row, 'name', 'phone')
+    normalized = normalize_phone(phone)
+    now = datetime.utcnow()
+    return {
+        'name': name,
+        'phone': phone,
+        # El validador del modelo no corre en inserciones masivas
+        'phone_normalized': normalized,
+        'phone_display': format_phone(normalized, phone),
+        'email': _text(row.get('email')),
+        'address': _text(row.get('address')),
+        'relationship': _text(row.get('relationship')) or 'otro',
+        'is_emergency': _bool(row.get('is_emergency'), False),
+        'is_favorite': _bool(row.get('is_favorite'), False),
+        'notes': _text(row.get('notes')),
+        'photo_url': None,
+        'created_at': _datetime(row.get('created_at'), now),
+        'updated_at': now,
+        'last_call': None,
+    }
+
+
+def _parse_reminder(row):
+    title, reminder_time = _required(row, 'title', 'reminder_time')
+    return {
+        'title': title,
+        'description': _text(row.get('description')),
+        'reminder_time': _datetime(reminder_time),
+        'category': _text(row.get('category')) or 'otro',
+        'is_completed': _bool(row.get('is_completed'), False),
+        'is_active': _bool(row.get('is_active'), True),
+        'repeat': _text(row.get('repeat')) or 'once',
+        'robot_notification': _bool(row.get('robot_notification'), True),
+        'created_at': _datetime(row.get('created_at'), datetime.utcnow()),
+        'completed_at': _datetime(row.get('completed_at')),
+        'materialized_until': None,
+    }
+
+
+def _import_contacts(session, batch, stats, ctx):
+    from app.models import Contact
+    _import_owned(session, batch, stats, ctx, Contact, _parse_contact,
+                  ('user_id', 'name', 'phone_normalized'))
+
+
+def _import_reminders(session, batch, stats, ctx):
+    from app.models import Reminder
+    _import_owned(session, batch, stats, ctx, Reminder, _parse_reminder,
+                  ('user_id', 'title', 'reminder_time'))
+
+
+IMPORTERS = {
+    'users': _import_users,
+    'robots': _import_robots,
+    'contacts': _import_contacts,
+    'reminders': _import_reminders,
+}
+
+
+# --- API pública ------------------------------------------------------------------
+
+def checkpoint_path(path):
+    return path + '.progress'
+
+
+def import_file(path, entity, fmt=None, batch_size=1000, resume=False, progress=None):
+    """
+    Importa un archivo CSV/JSONL por lotes.
+
+    Cada lote se valida con consultas en bloque (unicidad, usuarios
+    referenciados), se inserta con bulk_insert y se confirma. Después de
+    cada lote se guarda la última línea confirmada en <archivo>.progress;
+    con resume=True se continúa desde ahí tras una interrupción.
+
+    Returns:
+        ImportStats
+    """
+    from app import db
+    from app.response_cache import bump_version
+
+    importer = IMPORTERS[entity]
+    checkpoint = checkpoint_path(path)
+
+    stats = ImportStats()
+    if resume and os.path.exists(checkpoint):
+        with open(checkpoint, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('entity') == entity:
+            stats = ImportStats(**saved['stats'])
+
+    ctx = _Context()
+
+    def flush(batch):
+        importer(db.session, batch, stats, ctx)
+        for scope, user_id in ctx.touched:
+            bump_version(db.session, scope, user_id)
+        ctx.touched.clear()
+        db.session.commit()
+        stats.line = batch[-1][0]
+        with open(checkpoint, 'w', encoding='utf-8') as f:
+            json.dump({'entity': entity, 'stats': stats.as_dict()}, f)
+        if progress:
+            progress(stats)
+
+    batch = []
+    try:
+        for line, row in read_rows(path, fmt):
+            if line <= stats.line:
+                continue
+            stats.read += 1
+            if not isinstance(row, dict):
+                stats.error(line, "JSON inválido")
+                continue
+            batch.append((line, row))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    except Exception:
+        db.session.rollback()
+        raise
+
+    # Terminado: ya no hay nada que reanudar
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    if entity in ('users', 'robots'):
+        from app.admin_stats import admin_stats
+        admin_stats.reconcile()
+    elif entity == 'reminders':
+        # Las series importadas entran a la ventana de ocurrencias
+        from app.reminder_occurrences import reminder_occurrences
+        reminder_occurrences.extend(db.session)
+        db.session.commit()
+    return stats
+
+
+def export_file(path, entity, fmt=None, batch_size=1000, progress=None):
+    """
+    Exporta una entidad a CSV/JSONL leyendo por bloques (yield_per).
+
+    Returns:
+        int: Filas escritas
+    """
+    from app import db
+    from app.models import User, Role, Robot, Contact, Reminder, user_roles
+
+    fmt = _detect_format(path, fmt)
+    columns = COLUMNS[entity]
+    usernames = dict(db.session.query(User.id, User.username).all())
+
+    if entity == 'users':
+        roles = {}
+        for user_id, name in db.session.query(user_roles.c.user_id, Role.name) \
+                .join(Role, Role.id == user_roles.c.role_id):
+            roles.setdefault(user_id, []).append(name)
+        query = User.query.options(noload(User.roles)).order_by(User.id)
+        convert = lambda u: {**_columns(u, columns), 'roles': ','.join(sorted(roles.get(u.id, [])))}
+    else:
+        model = {'robots': Robot, 'contacts': Contact, 'reminders': Reminder}[entity]
+        query = model.query.order_by(model.id)
+        convert = lambda o: {**_columns(o, columns), 'owner': usernames.get(o.user_id)}
+
+    written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = _Writer(f, fmt, columns)
+        for obj in query.yield_per(batch_size):
+            writer.write(convert(obj))
+            written += 1
+            if progress and written % batch_size == 0:
+                progress(written)
+    return written
+
+
+def _columns(obj, columns):
+    return {c: getattr(obj, c) for c in columns if c not in ('owner', 'roles')}
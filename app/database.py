@@ -0,0 +1,151 @@
+# proyojo/app/database.py
+
+import io
+import csv
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from sqlalchemy import event, insert
+
+logger = logging.getLogger(__name__)
+
+
+def configure_sqlite(app, engine):
+    """
+    Aplica los PRAGMA de producción de SQLite en cada conexión nueva.
+
+    Con WAL los lectores (peticiones web) no se bloquean mientras la
+    ingesta MQTT o el planificador escriben. Solo actúa si la base de
+    datos es SQLite y SQLITE_WAL está activo.
+    """
+    if engine.dialect.name != 'sqlite' or not app.config.get('SQLITE_WAL', True):
+        return
+
+    pragmas = {
+        'journal_mode': 'WAL',
+        'synchronous': app.config.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'cache_size': app.config.get('SQLITE_CACHE_SIZE', -16000),
+        'mmap_size': app.config.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024),
+        'busy_timeout': app.config.get('SQLITE_BUSY_TIMEOUT', 5000),
+        'temp_store': 'MEMORY',
+    }
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def bulk_insert(session, table, rows, chunk_size=1000):
+    """
+    Inserta muchas filas de una vez.
+
+    En PostgreSQL usa COPY (psycopg2 o psycopg 3); en el resto de motores
+    usa un INSERT con executemany en bloques de chunk_size (la sentencia se
+    compila una sola vez, a diferencia de un VALUES multi-fila).
+
+    Args:
+        session: Sesión de SQLAlchemy (no se hace commit)
+        table (Table): Tabla destino
+        rows (list[dict]): Filas con las mismas claves
+
+    Returns:
+        int: Número de filas insertadas
+    """
+    if not rows:
+        return 0
+
+    columns = list(rows[0].keys())
+    connection = session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        cursor = connection.connection.dbapi_connection.cursor()
+        # Nombres entre comillas cuando hace falta ("user" es palabra reservada)
+        preparer = connection.dialect.identifier_preparer
+        statement = (f'COPY {preparer.format_table(table)} '
+                     f'({", ".join(preparer.quote(c) for c in columns)}) FROM STDIN')
+        try:
+            if hasattr(cursor, 'copy_expert'):
+                # psycopg2: CSV en memoria
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                for row in rows:
+                    writer.writerow(['' if row[c] is None else row[c] for c in columns])
+                buffer.seek(0)
+                cursor.copy_expert(f"{statement} WITH (FORMAT csv, NULL '')", buffer)
+            else:
+                # psycopg 3
+                with cursor.copy(statement) as copy:
+                    for row in rows:
+                        copy.write_row([row[c] for c in columns])
+        finally:
+            cursor.close()
+        return len(rows)
+
+    for start in range(0, len(rows), chunk_size):
+        session.execute(insert(table), rows[start:start + chunk_size])
+    return len(rows)
+
+
+class DatabaseWriter:
+    """
+    Cola de escritura única para los procesos en segundo plano.
+
+    Las escrituras de la ingesta MQTT, la presencia y el planificador se
+    ejecutan de una en una en un hilo dedicado, de modo que nunca compiten
+    entre sí por el bloqueo de escritura de SQLite.
+    """
+
+    def __init__(self):
+        self.app = None
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configura el escritor; el hilo arranca con la primera escritura."""
+        self.app = app
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='db-writer', daemon=True)
+                self._worker.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Encola una función de escritura. Se ejecuta dentro del contexto de la
+        aplicación y la sesión se confirma (commit) al terminar.
+
+        Returns:
+            Future: resultado de la función o la excepción producida
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        return future
+
+    def _run(self):
+        from app import db
+
+        while True:
+            func, args, kwargs, future = self._queue.get()
+            try:
+                with self.app.app_context():
+                    try:
+                        result = func(*args, **kwargs)
+                        db.session.commit()
+                        future.set_result(result)
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"Error en escritura en segundo plano: {str(e)}")
+                        future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+
+# Instancia global del escritor en segundo plano
+db_writer = DatabaseWriter()
@@ -0,0 +1,142 @@
+# proyojo/app/emergency_contacts.py
+
+from datetime import datetime
+from sqlalchemy import update, bindparam
+
+# Contactos de emergencia comunes en México
+EMERGENCY_CONTACTS = [
+    {
+        'name': 'Cruz Roja',
+        'phone': '065',
+        'relationship': 'emergencia',
+        'is_emergency': True,
+        'notes': 'Servicio de ambulancias y emergencias médicas'
+    },
+    {
+        'name': 'Policía',
+        'phone': '911',
+        'relationship': 'emergencia',
+        'is_emergency': True,
+        'notes': 'Emergencias policiales y seguridad'
+    },
+    {
+        'name': 'Bomberos',
+        'phone': '068',
+        'relationship': 'emergencia',
+        'is_emergency': True,
+        'notes': 'Emergencias de incendios y rescate'
+    },
+    {
+        'name': 'Protección Civil',
+        'phone': '911',
+        'relationship': 'emergencia',
+        'is_emergency': True,
+        'notes': 'Emergencias y desastres naturales'
+    },
+    {
+        'name': 'Centro de Atención a Emergencias',
+        'phone': '911',
+        'relationship': 'emergencia',
+        'is_emergency': True,
+        'notes': 'Número único de emergencias'
+    }
+]
+
+# Campos que se sincronizan si cambian en la lista
+SYNCED_FIELDS = ('phone', 'relationship', 'is_emergency', 'notes')
+
+
+def seed_emergency_contacts(user_query, contacts=EMERGENCY_CONTACTS, batch_size=1000, dry_run=False):
+    """
+    Asegura que todos los usuarios de user_query tengan los contactos de emergencia.
+
+    Se compara el conjunto deseado (usuario x contacto, por nombre) contra
+    los contactos existentes con una sola consulta; solo se insertan los que
+    faltan y se actualizan los que cambiaron (teléfono, notas...), en lotes.
+    Es idempotente: volver a ejecutarlo sin cambios en la lista no escribe nada.
+
+    Args:
+        user_query: Consulta de User con los usuarios a sembrar
+        contacts (list[dict]): Contactos deseados
+        dry_run (bool): Solo contar, sin escribir
+
+    Returns:
+        dict: users, created, updated, unchanged
+    """
+    from app import db
+    from app.models import User, Contact
+    from app.database import bulk_insert
+    from app.phone_numbers import normalize_phone, format_phone
+    from app.response_cache import bump_version
+
+    user_ids = [user_id for (user_id,) in user_query.with_entities(User.id).order_by(User.id)]
+    desired = {c['name']: c for c in contacts}
+
+    # Estado actual de todos los usuarios en una sola consulta
+    existing = {}
+    rows = db.session.query(Contact.id, Contact.user_id, Contact.name,
+                            *[getattr(Contact, f) for f in SYNCED_FIELDS]) \
+        .filter(Contact.user_id.in_(user_query.with_entities(User.id).scalar_subquery()),
+                Contact.name.in_(list(desired)))
+    for row in rows:
+        existing.setdefault((row.user_id, row.name), row)
+
+    now = datetime.utcnow()
+    inserts, updates, touched = [], [], set()
+    unchanged = 0
+    for user_id in user_ids:
+        for name, data in desired.items():
+            current = existing.get((user_id, name))
+            if current is None:
+                normalized = normalize_phone(data['phone'])
+                inserts.append({
+                    'user_id': user_id,
+                    'name': name,
+                    'phone': data['phone'],
+                    'phone_normalized': normalized,
+                    'phone_display': format_phone(normalized, data['phone']),
+                    'relationship': data.get('relationship', 'emergencia'),
+                    'is_emergency': data.get('is_emergency', True),
+                    'is_favorite': False,
+                    'notes': data.get('notes'),
+                    'created_at': now,
+                    'updated_at': now,
+                })
+                touched.add(user_id)
+            elif any(getattr(current, f) != data.get(f) for f in SYNCED_FIELDS):
+                normalized = normalize_phone(data['phone'])
+                updates.append({
+                    '_id': current.id,
+                    'phone': data['phone'],
+                    'phone_normalized': normalized,
+                    'phone_display': format_phone(normalized, data['phone']),
+                    'relationship': data.get('relationship'),
+                    'is_emergency': data.get('is_emergency'),
+                    'notes': data.get('notes'),
+                    'updated_at': now,
+                })
+                touched.add(user_id)
+            else:
+                unchanged += 1
+
+    result = {'users': len(user_ids), 'created': len(inserts),
+              'updated': len(updates), 'unchanged': unchanged}
+    if dry_run or not touched:
+        return result
+
+    table = Contact.__table__
+    for start in range(0, len(inserts), batch_size):
+        bulk_insert(db.session, table, inserts[start:start + batch_size])
+    if updates:
+        statement = update(table).where(table.c.id == bindparam('_id')).values(
+            **{column: bindparam(column) for column in updates[0] if column != '_id'}
+        )
+        connection = db.session.connection()
+        for start in range(0, len(updates), batch_size):
+            connection.execute(statement, updates[start:start + batch_size])
+
+    # Las inserciones en bloque no pasan por los eventos del ORM
+    for user_id in touched:
+        bump_version(db.session, 'contacts', user_id)
+    db.session.commit()
+    return result
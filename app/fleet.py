@@ -0,0 +1,140 @@
+# proyojo/app/fleet.py
+
+import json
+import time
+import logging
+from datetime import datetime
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Subtópicos que se pueden enviar a la flota (jojo/<serial>/<subtópico>)
+DEFAULT_FLEET_TOPICS = ('command', 'audio/play', 'display/mensaje', 'checkin')
+
+
+class FleetError(ValueError):
+    """Selección de robots o comando inválidos para un envío a la flota."""
+
+
+def fleet_topics():
+    return tuple(current_app.config.get('FLEET_TOPICS') or DEFAULT_FLEET_TOPICS)
+
+
+def resolve_targets(robot_ids=None, visibility=None, group=None, online_only=False):
+    """
+    Robots destino de un envío a la flota, en una sola consulta.
+
+    Los filtros se combinan (p. ej. públicos del grupo 'Pabellón A').
+    visibility='all' selecciona toda la flota de forma explícita.
+
+    Args:
+        robot_ids (list[int]): Robots concretos
+        visibility (str): 'public', 'private' o 'all'
+        group (str): Valor de Robot.fleet_group
+        online_only (bool): Solo robots en línea
+
+    Returns:
+        list: Filas (id, name, mqtt_topic, is_active, is_online)
+    """
+    from app import db
+    from app.models import Robot
+
+    if not robot_ids and not visibility and not group:
+        raise FleetError('Indica los robots, la visibilidad o el grupo de destino.')
+    if visibility not in (None, '', 'all', 'public', 'private'):
+        raise FleetError(f'Visibilidad inválida: {visibility}')
+
+    query = db.session.query(Robot.id, Robot.name, Robot.mqtt_topic, Robot.is_active, Robot.is_online)
+    if robot_ids:
+        query = query.filter(Robot.id.in_(robot_ids))
+    if visibility in ('public', 'private'):
+        query = query.filter(Robot.is_public == (visibility == 'public'))
+    if group:
+        query = query.filter(Robot.fleet_group == group)
+    if online_only:
+        query = query.filter(Robot.is_online == True)
+
+    targets = query.order_by(Robot.id).all()
+    limit = current_app.config.get('FLEET_MAX_TARGETS', 500)
+    if len(targets) > limit:
+        raise FleetError(f'La selección incluye {len(targets)} robots (máximo {limit}).')
+    return targets
+
+
+def broadcast(targets, subtopic, payload, qos=1, ttl=None, wait=None):
+    """
+    Envía el mismo mensaje a varios robots con una sola publicación en lote.
+
+    Cada robot recibe su propio id de correlación. Los robots desconectados
+    van a la bitácora de comandos si se indica ttl; el resto se publica con
+    mqtt_client.publish_many (todos los paquetes primero, luego los PUBACK).
+    Con wait (segundos) se esperan además los acks de los robots, todos
+    contra el mismo plazo.
+
+    Returns:
+        dict: total, elapsed_ms, summary {estado: n} y results por robot.
+            Estados: 'acked', 'delivered', 'sent', 'journaled', 'skipped', 'failed'
+    """
+    from app.mqtt_client import mqtt_client
+    from app.command_journal import command_journal
+    from app.command_ack import command_acks, new_command_id
+    from app.audit_log import audit_log
+
+    if subtopic not in fleet_topics():
+        raise FleetError(f'Tópico no permitido: {subtopic}')
+    if not isinstance(payload, dict):
+        raise FleetError('El mensaje debe ser un objeto JSON.')
+
+    started = time.perf_counter()
+    timestamp = datetime.utcnow().isoformat() + 'Z'
+    results, live = [], []
+    for robot in targets:
+        message = dict(payload, id=new_command_id(), timestamp=timestamp)
+        topic = f"{robot.mqtt_topic}/{subtopic}"
+        result = {'robot_id': robot.id, 'name': robot.name, 'topic': topic,
+                  'command_id': message['id'], 'status': None}
+        results.append(result)
+
+        if not robot.is_active:
+            result['status'] = 'skipped'
+        elif ttl is not None and (not mqtt_client.connected or
+                                  command_journal.should_journal(robot.mqtt_topic)):
+            command_journal.append(robot.mqtt_topic, topic, json.dumps(message), qos=qos, ttl=ttl)
+            result['status'] = 'journaled'
+        else:
+            live.append((result, robot, topic, message))
+
+    pending = []
+    if wait:
+        # Se registran antes de publicar: el ack puede llegar enseguida
+        pending = [command_acks.register(robot, subtopic, command_id=message['id'])
+                   for _, robot, _, message in live]
+
+    if live:
+        statuses = mqtt_client.publish_many([(topic, message) for _, _, topic, message in live], qos=qos,
+                                            timeout=current_app.config.get('FLEET_PUBLISH_TIMEOUT', 2.0))
+        for (result, *_), status in zip(live, statuses):
+            result['status'] = status
+        for tracked, status in zip(pending, statuses):
+            command_acks.published(tracked, status != 'failed')
+
+    if pending:
+        deadline = time.monotonic() + min(wait, command_acks.max_wait)
+        for (result, *_), tracked in zip(live, pending):
+            ack = command_acks.wait(tracked, deadline - time.monotonic())
+            result['ack'] = ack
+            if ack is not None and ack['status'] == 'ok':
+                result['status'] = 'acked'
+
+    for result in results:
+        audit_log.record('fleet.command', robot_id=result['robot_id'], target=result['topic'],
+                         status='error' if result['status'] == 'failed' else 'ok',
+                         details={'id': result['command_id'], 'topic': subtopic,
+                                  'result': result['status'], 'payload': payload})
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(f"Envío a la flota {subtopic}: {len(results)} robots en {elapsed_ms} ms {summary}")
+    return {'total': len(results), 'elapsed_ms': elapsed_ms, 'summary': summary, 'results': results}
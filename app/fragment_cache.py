@@ -0,0 +1,106 @@
+# proyojo/app/fragment_cache.py
+
+import time
+import hashlib
+import logging
+from markupsafe import Markup
+from jinja2 import nodes
+from jinja2.ext import Extension
+from flask_login import current_user
+
+from app.response_cache import ByteLRU, response_cache, GLOBAL
+
+logger = logging.getLogger(__name__)
+
+# Ámbitos de datos con versión (ver response_cache.py)
+SCOPES = {'contacts', 'reminders', 'robots', 'users'}
+
+
+class FragmentCache:
+    """
+    Caché de fragmentos de plantilla renderizados.
+
+    La clave combina el nombre del fragmento, el usuario, las versiones de
+    los ámbitos de datos de los que depende y los valores extra indicados
+    (p. ej. el id del robot). Cualquier escritura que incremente la versión
+    de un ámbito invalida sus fragmentos sin tener que borrarlos: las
+    entradas viejas simplemente dejan de usarse y salen del LRU.
+    """
+
+    def __init__(self):
+        self.lru = None
+
+    def init_app(self, app):
+        max_bytes = app.config.get('FRAGMENT_CACHE_MAX_BYTES', 4 * 1024 * 1024)
+        self.lru = ByteLRU(max_bytes) if max_bytes else None
+        app.jinja_env.add_extension(FragmentCacheExtension)
+
+    def render(self, name, parts, ttl, caller):
+        """Devuelve el fragmento cacheado o lo renderiza con caller()."""
+        if self.lru is None:
+            return caller()
+
+        key = self._key(name, parts, ttl)
+        cached = self.lru.get(key)
+        if cached is not None:
+            return Markup(cached[0])
+
+        rendered = caller()
+        self.lru.put(key, str(rendered), None)
+        return rendered
+
+    def _key(self, name, parts, ttl):
+        user_id = current_user.id if current_user.is_authenticated else None
+        scopes = [part for part in parts if isinstance(part, str) and part in SCOPES]
+        extra = [repr(part) for part in parts if part not in scopes]
+
+        keys = [(scope, GLOBAL if scope == 'robots' else user_id) for scope in scopes]
+        versions = response_cache.versions(keys) if keys and user_id is not None else []
+
+        items = [name, str(user_id)]
+        items += [f'{scope}:{version}' for scope, version in zip(scopes, versions)]
+        items += extra
+        if ttl:
+            items.append(str(int(time.time() // ttl)))
+        return hashlib.sha1('|'.join(items).encode('utf-8')).hexdigest()
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Etiqueta {% cache %} para las plantillas.
+
+        {% cache 'recordatorios-pendientes', 'reminders', ttl=60 %}
+            ...
+        {% endcache %}
+
+    El primer argumento es el nombre del fragmento; los demás son ámbitos
+    de datos ('contacts', 'reminders', 'robots') o valores que también
+    forman parte de la clave. ttl (segundos) es para fragmentos con textos
+    relativos al tiempo.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        name = parser.parse_expression()
+        parts = []
+        ttl = nodes.Const(None)
+        while parser.stream.skip_if('comma'):
+            if parser.stream.current.test('name:ttl') and parser.stream.look().test('assign'):
+                next(parser.stream)
+                next(parser.stream)
+                ttl = parser.parse_expression()
+            else:
+                parts.append(parser.parse_expression())
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        call = self.call_method('_render', [name, nodes.List(parts), ttl])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, name, parts, ttl, caller):
+        return fragment_cache.render(name, parts, ttl, caller)
+
+
+# Instancia global del caché de fragmentos
+fragment_cache = FragmentCache()
@@ -0,0 +1,192 @@
+# proyojo/app/live_stream.py
+
+import math
+import time
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class LiveSegment:
+    """Segmento en memoria: cuadros JPEG concatenados y su duración."""
+
+    __slots__ = ('sequence', 'start', 'duration', 'data', 'lengths', 'offsets_ms')
+
+    def __init__(self, sequence, frames, end):
+        self.sequence = sequence
+        self.start = frames[0][0]
+        self.duration = max(end - self.start, 0.001)
+        self.data = b''.join(jpeg for _, jpeg in frames)
+        self.lengths = [len(jpeg) for _, jpeg in frames]
+        self.offsets_ms = [int((timestamp - self.start) * 1000) for timestamp, _ in frames]
+
+
+class LiveSegmenter:
+    """
+    Empaquetador de la cámara de un robot en segmentos cortos.
+
+    Recibe los cuadros de la lectura compartida de camera_feeds, los agrupa
+    en segmentos de segment_seconds y conserva los últimos `window` en una
+    ventana deslizante: al entrar uno nuevo se descarta el más antiguo. Los
+    segmentos se construyen una sola vez y se sirven tal cual a todos los
+    espectadores. Si nadie pide la lista durante idle_timeout segundos, se
+    da de baja de la cámara.
+    """
+
+    def __init__(self, robot_id, segment_seconds=1.0, window=6, fps=10, idle_timeout=30):
+        self.robot_id = robot_id
+        self.segment_seconds = segment_seconds
+        self.fps = fps
+        self.idle_timeout = idle_timeout
+        self.url = None
+        self.segments = deque(maxlen=window)
+        self.sequence = 0
+        self.last_request = time.monotonic()
+        self._frames = []
+        self._last_frame = 0.0
+        self._lock = threading.Lock()
+
+    def touch(self):
+        self.last_request = time.monotonic()
+
+    @property
+    def idle(self):
+        return time.monotonic() - self.last_request > self.idle_timeout
+
+    def on_frame(self, timestamp, jpeg):
+        if timestamp - self._last_frame < 1.0 / self.fps:
+            return
+        self._last_frame = timestamp
+        if self._frames and timestamp - self._frames[0][0] >= self.segment_seconds:
+            segment = LiveSegment(self.sequence, self._frames, timestamp)
+            with self._lock:
+                self.segments.append(segment)
+                self.sequence += 1
+            self._frames = []
+        self._frames.append((timestamp, jpeg))
+
+    def playlist(self, segment_url):
+        """
+        Lista de reproducción de la ventana actual (formato M3U8 en vivo).
+
+        Args:
+            segment_url: Función que devuelve la URL de un número de secuencia
+        """
+        with self._lock:
+            segments = list(self.segments)
+        target = max([math.ceil(segment.duration) for segment in segments] or [math.ceil(self.segment_seconds)])
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3', f'#EXT-X-TARGETDURATION:{target}',
+                 f'#EXT-X-MEDIA-SEQUENCE:{segments[0].sequence if segments else self.sequence}']
+        for segment in segments:
+            lines.append(f'#EXTINF:{segment.duration:.3f},')
+            lines.append(segment_url(segment.sequence))
+        return '\n'.join(lines) + '\n'
+
+    def segment(self, sequence):
+        """Segmento de la ventana con ese número, o None si ya salió de ella."""
+        with self._lock:
+            for segment in self.segments:
+                if segment.sequence == sequence:
+                    return segment
+        return None
+
+    def reset(self):
+        with self._lock:
+            self.segments.clear()
+        self._frames = []
+
+
+class LiveStreams:
+    """
+    Segmentos en vivo de las cámaras para las videollamadas.
+
+    La cámara se abre con el primer espectador (a través de camera_feeds,
+    la misma lectura que usan el grabador y el análisis de movimiento) y
+    se cierra sola cuando todos se van: la ESP32-CAM atiende una única
+    conexión sin importar cuántos familiares se unan a la llamada.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.segment_seconds = 1.0
+        self.window = 6
+        self.fps = 10
+        self.idle_timeout = 30
+        self._segmenters = {}
+        self._listeners = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.app = app
+        self.segment_seconds = app.config.get('LIVE_SEGMENT_SECONDS', self.segment_seconds)
+        self.window = app.config.get('LIVE_WINDOW_SEGMENTS', self.window)
+        self.fps = app.config.get('LIVE_FPS', self.fps)
+        self.idle_timeout = app.config.get('LIVE_IDLE_TIMEOUT', self.idle_timeout)
+
+    def get(self, robot_id, url):
+        """
+        Empaquetador de la cámara del robot, abriéndola si hace falta.
+
+        Cada petición de la lista de reproducción renueva la suscripción.
+        """
+        from app.camera_feed import camera_feeds
+
+        # Una cámara caída no entrega cuadros con los que notar la inactividad
+        for idle_id in [rid for rid, seg in list(self._segmenters.items()) if seg.idle and rid != robot_id]:
+            self._stop(idle_id)
+
+        with self._lock:
+            segmenter = self._segmenters.get(robot_id)
+            if segmenter is None:
+                segmenter = self._segmenters[robot_id] = LiveSegmenter(
+                    robot_id, self.segment_seconds, self.window, self.fps, self.idle_timeout)
+                self._listeners[robot_id] = self._make_listener(segmenter)
+            listener = self._listeners[robot_id]
+            subscribe = segmenter.url != url
+            if subscribe:
+                if segmenter.url is not None:
+                    segmenter.reset()
+                segmenter.url = url
+        segmenter.touch()
+        if subscribe:
+            camera_feeds.subscribe(robot_id, url, listener)
+            logger.info(f"Transmisión en vivo del robot {robot_id} iniciada")
+        return segmenter
+
+    def _make_listener(self, segmenter):
+        def listener(timestamp, jpeg):
+            if segmenter.idle:
+                self._stop(segmenter.robot_id)
+                return
+            segmenter.on_frame(timestamp, jpeg)
+        return listener
+
+    def _stop(self, robot_id):
+        from app.camera_feed import camera_feeds
+
+        with self._lock:
+            segmenter = self._segmenters.pop(robot_id, None)
+            listener = self._listeners.pop(robot_id, None)
+        if listener is not None:
+            camera_feeds.unsubscribe(robot_id, listener)
+            logger.info(f"Transmisión en vivo del robot {robot_id} detenida: sin espectadores")
+        return segmenter
+
+    def segment(self, robot_id, sequence):
+        with self._lock:
+            segmenter = self._segmenters.get(robot_id)
+        return segmenter.segment(sequence) if segmenter is not None else None
+
+    def status(self):
+        with self._lock:
+            segmenters = list(self._segmenters.values())
+        return {segmenter.robot_id: {'segments': len(segmenter.segments), 'sequence': segmenter.sequence,
+                                     'bytes': sum(len(segment.data) for segment in list(segmenter.segments)),
+                                     'idle_seconds': round(time.monotonic() - segmenter.last_request, 1)}
+                for segmenter in segmenters}
+
+
+# Instancia global de las transmisiones en vivo
+live_streams = LiveStreams()
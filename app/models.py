@@ -5,6 +5,8 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 check_password_hash
 from flask_login import UserMixin # <-- 1. Importar UserMixin
+from sqlalchemy.orm import validates
+from app.phone_numbers import normalize_phone, format_phone
 
 # Tabla de asociación para la relación Muchos a Muchos entre User y Role
 user_roles = db.Table('user_roles',
@@ -43,6 +45,11 @@ class User(db.Model, UserMixin):
     # Relación con Reminder (un usuario puede tener varios recordatorios)
     reminders = db.relationship('Reminder', backref='user', lazy=True, cascade='all, delete-orphan')
     
+    # Índice para la paginación por keyset del panel de administración
+    __table_args__ = (
+        db.Index('ix_user_created_at_id', 'created_at', 'id'),
+    )
+    
     def has_role(self, role_name):
         """Verifica si el usuario tiene un rol específico."""
         return any(role.name == role_name for role in self.roles)
@@ -86,6 +93,15 @@ class Robot(db.Model):
     
     # Indica si es un robot público (disponible para todos)
     is_public = db.Column(db.Boolean, default=True)
+    
+    # Grupo de la flota (p. ej. 'Pabellón A') para los comandos en lote
+    fleet_group = db.Column(db.String(50))
+    
+    # Índice para la paginación por keyset del panel de administración
+    __table_args__ = (
+        db.Index('ix_robot_created_at_id', 'created_at', 'id'),
+        db.Index('ix_robot_fleet_group', 'fleet_group'),
+    )
 
     def __repr__(self):
         return f'<Robot {self.name} ({self.serial_number})>'
@@ -98,6 +114,22 @@ class Robot(db.Model):
         return None
 
 
+class Telemetry(db.Model):
+    """Lecturas de sensores enviadas por los robots (jojo/<serial>/telemetry)."""
+    id = db.Column(db.Integer, primary_key=True)
+    robot_id = db.Column(db.Integer, db.ForeignKey('robot.id'), nullable=False)
+    sensor = db.Column(db.String(50), nullable=False)  # 'bateria', 'ultrasonico', 'temperatura', ...
+    value = db.Column(db.Float)
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_telemetry_robot_recorded', 'robot_id', 'recorded_at'),
+    )
+
+    def __repr__(self):
+        return f'<Telemetry {self.robot_id} {self.sensor}={self.value}>'
+
+
 class Reminder(db.Model):
     """Modelo para recordatorios del usuario."""
     id = db.Column(db.Integer, primary_key=True)
@@ -111,10 +143,17 @@ class Reminder(db.Model):
     robot_notification = db.Column(db.Boolean, default=True)  # Notificar vía robot
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime)
+    # Hasta dónde están generadas sus ocurrencias (ver reminder_occurrences.py)
+    materialized_until = db.Column(db.DateTime)
     
     # Foreign Key al usuario
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Las ocurrencias las borra el ORM: SQLite corre sin foreign_keys, así que
+    # el ON DELETE CASCADE no se aplica y SQLite reutiliza el id liberado
+    occurrences = db.relationship('ReminderOccurrence', backref='reminder', lazy='dynamic',
+                                  cascade='all, delete-orphan')
+
     def __repr__(self):
         return f'<Reminder {self.title} - {self.reminder_time}>'
     
@@ -150,11 +189,71 @@ class Reminder(db.Model):
             return "Ahora"
 
 
+class ReminderOccurrence(db.Model):
+    """
+    Ocurrencia concreta de un recordatorio dentro de la ventana materializada.
+
+    Los recordatorios repetidos se expanden en filas (una por fecha) para
+    que "próximas 24 horas" o "vencidos" sean un rango sobre un índice.
+    El estado de completado es por ocurrencia, no por serie.
+    """
+    __tablename__ = 'reminder_occurrence'
+    id = db.Column(db.Integer, primary_key=True)
+    reminder_id = db.Column(db.Integer, db.ForeignKey('reminder.id', ondelete='CASCADE'), nullable=False)
+    # Copia del dueño del recordatorio para filtrar sin unir tablas
+    user_id = db.Column(db.Integer, nullable=False)
+    occurs_at = db.Column(db.DateTime, nullable=False)
+    is_completed = db.Column(db.Boolean, nullable=False, default=False)
+    completed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.UniqueConstraint('reminder_id', 'occurs_at', name='uq_reminder_occurrence'),
+        db.Index('ix_reminder_occurrence_user_pending', 'user_id', 'is_completed', 'occurs_at'),
+    )
+
+    def __repr__(self):
+        return f'<ReminderOccurrence {self.reminder_id} @ {self.occurs_at}>'
+
+    @property
+    def is_overdue(self):
+        """Verifica si la ocurrencia está vencida."""
+        if self.is_completed:
+            return False
+        return datetime.utcnow() > self.occurs_at
+
+    @property
+    def time_until(self):
+        """Tiempo hasta la ocurrencia en formato legible."""
+        if self.is_completed:
+            return "Completado"
+
+        delta = self.occurs_at - datetime.utcnow()
+
+        if delta.total_seconds() < 0:
+            return "Vencido"
+
+        days = delta.days
+        hours = delta.seconds // 3600
+        minutes = (delta.seconds % 3600) // 60
+
+        if days > 0:
+            return f"En {days} día{'s' if days > 1 else ''}"
+        elif hours > 0:
+            return f"En {hours} hora{'s' if hours > 1 else ''}"
+        elif minutes > 0:
+            return f"En {minutes} minuto{'s' if minutes > 1 else ''}"
+        else:
+            return "Ahora"
+
+
 class Contact(db.Model):
     """Modelo para contactos y agenda telefónica del usuario."""
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     phone = db.Column(db.String(20), nullable=False)
+    # Teléfono normalizado (tipo E.164) y formato de visualización, calculados al guardar
+    phone_normalized = db.Column(db.String(20))
+    phone_display = db.Column(db.String(30))
     email = db.Column(db.String(120))
     address = db.Column(db.String(200))
     
@@ -174,12 +273,24 @@ class Contact(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_call = db.Column(db.DateTime)
     
-    # Foreign Key al usuario
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Foreign Key al usuario (indexada: todas las vistas de la agenda filtran por usuario)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+
+    # Búsqueda inversa número -> contacto (identificación de llamadas)
+    __table_args__ = (
+        db.Index('ix_contact_user_phone_normalized', 'user_id', 'phone_normalized'),
+    )
 
     def __repr__(self):
         return f'<Contact {self.name} - {self.phone}>'
     
+    @validates('phone')
+    def _normalize_phone(self, key, phone):
+        """Normaliza el teléfono una sola vez, al asignarlo."""
+        self.phone_normalized = normalize_phone(phone)
+        self.phone_display = format_phone(self.phone_normalized, phone)
+        return phone
+    
     @property
     def relationship_icon(self):
         """Retorna el icono de FontAwesome según la relación."""
@@ -206,11 +317,29 @@ class Contact(db.Model):
     
     @property
     def formatted_phone(self):
-        """Formatea el número de teléfono."""
-        # Eliminar caracteres no numéricos
-        digits = ''.join(filter(str.isdigit, self.phone))
-        
-        # Formato para números de 10 dígitos (XXX) XXX-XXXX
-        if len(digits) == 10:
-            return f'({digits[:3]}) {digits[3:6]}-{digits[6:]}'
-        return self.phone
\ No newline at end of file
+        """Teléfono formateado (precalculado al guardar el contacto)."""
+        if self.phone_display:
+            return self.phone_display
+        return format_phone(normalize_phone(self.phone), self.phone)
+
+
+class AdminCounter(db.Model):
+    """Contadores materializados del panel de administración (ver admin_stats.py)."""
+    __tablename__ = 'admin_counter'
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<AdminCounter {self.name}={self.value}>'
+
+
+class CacheVersion(db.Model):
+    """Versiones de datos por ámbito y usuario para los ETag (ver response_cache.py)."""
+    __tablename__ = 'cache_version'
+    scope = db.Column(db.String(30), primary_key=True)   # 'contacts', 'reminders', 'robots', 'users'
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)  # 0 = global
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.scope}:{self.user_id}={self.version}>'
@@ -0,0 +1,333 @@
+# proyojo/app/motion.py
+
+import io
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# NumPy y Pillow son opcionales (sin ellos no hay análisis) y se importan
+# solo cuando el análisis arranca: los comandos CLI no deben cargarlos
+np = None
+Image = None
+
+
+def _load_dependencies():
+    """Importa NumPy y Pillow la primera vez; False si falta alguno."""
+    global np, Image
+    if np is None:
+        try:
+            import numpy
+            from PIL import Image as pil_image
+            np, Image = numpy, pil_image
+        except ImportError:
+            np = False
+    return np is not False
+
+
+def decode_small(jpeg, width=80):
+    """
+    Decodifica un JPEG en escala de grises a baja resolución.
+
+    Image.draft() pide al decodificador JPEG el escalado por DCT (1/2, 1/4
+    o 1/8), así la imagen nunca se descomprime a tamaño completo; el
+    resize final solo ajusta al ancho de análisis.
+
+    Returns:
+        numpy.ndarray: Matriz float32 (alto × width)
+    """
+    if not _load_dependencies():
+        raise RuntimeError('La detección de movimiento requiere numpy y Pillow')
+    image = Image.open(io.BytesIO(jpeg))
+    height = max(1, round(width * image.height / image.width))
+    image.draft('L', (width, height))
+    image = image.convert('L')
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.BILINEAR)
+    return np.asarray(image, dtype=np.float32)
+
+
+class CameraActivity:
+    """Estado del análisis de una cámara."""
+
+    __slots__ = ('robot_id', 'previous', 'score', 'activity', 'last_activity', 'last_event',
+                 'last_sudden', 'inactivity_alerted', 'analyzed', 'skipped', 'last_analyzed', 'total_ms')
+
+    def __init__(self, robot_id, now):
+        self.robot_id = robot_id
+        self.previous = None
+        self.score = 0.0          # fracción de píxeles que cambiaron en el último cuadro
+        self.activity = 0.0       # promedio móvil de score
+        self.last_activity = now
+        self.last_event = 0.0
+        self.last_sudden = 0.0
+        self.inactivity_alerted = False
+        self.analyzed = 0
+        self.skipped = 0
+        self.last_analyzed = 0.0
+        self.total_ms = 0.0
+
+    def as_dict(self):
+        return {
+            'score': round(self.score, 4),
+            'activity': round(self.activity, 4),
+            'last_activity': self.last_activity,
+            'inactive_hours': round(max(0.0, time.time() - self.last_activity) / 3600, 2),
+            'analyzed': self.analyzed,
+            'skipped': self.skipped,
+            'avg_ms': round(self.total_ms / self.analyzed, 2) if self.analyzed else None,
+        }
+
+
+class MotionDetector:
+    """
+    Detección de movimiento e inactividad en las cámaras de los robots.
+
+    Los cuadros llegan de la lectura compartida de camera_feeds; por cámara
+    solo se guarda el más reciente y un único hilo los analiza a como
+    máximo MOTION_FPS por cámara. Cada cuadro se decodifica reducido
+    (escalado DCT del JPEG) y se compara con el anterior con NumPy: la
+    fracción de píxeles que cambian más de MOTION_PIXEL_THRESHOLD es la
+    puntuación de actividad.
+
+    Eventos (cola SSE de suscriptores, bitácora de auditoría y log):
+      - 'motion':     actividad >= MOTION_THRESHOLD (con MOTION_EVENT_COOLDOWN)
+      - 'sudden':     un cuadro con cambio >= MOTION_SUDDEN_THRESHOLD (con MOTION_EVENT_COOLDOWN)
+      - 'inactivity': sin actividad durante INACTIVITY_ALERT_HOURS
+
+    MOTION_CPU_BUDGET limita la fracción de un núcleo que puede usar el
+    análisis (tiempo de CPU del propio hilo): si se excede, se descartan
+    cuadros hasta recuperar el margen.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.fps = 1.0
+        self.width = 80
+        self.pixel_threshold = 25
+        self.threshold = 0.02
+        self.sudden_threshold = 0.3
+        self.cooldown = 60
+        self.inactivity_seconds = 4 * 3600
+        self.cpu_budget = 0.2
+        self.refresh_interval = 60
+        self.events = deque(maxlen=200)
+        self._cameras = {}      # robot_id -> CameraActivity
+        self._latest = {}       # robot_id -> (timestamp, jpeg) pendiente de analizar
+        self._listeners = {}    # robot_id -> función registrada en camera_feeds
+        self._subscribers = []  # colas de los dashboards suscritos
+        self._budget = deque()  # (fin, segundos de CPU) de los análisis recientes
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+
+    def init_app(self, app, background=True):
+        """background=False (comandos CLI) no abre las cámaras."""
+        self.app = app
+        self.enabled = app.config.get('MOTION_ENABLED', False)
+        self.fps = app.config.get('MOTION_FPS', self.fps)
+        self.width = app.config.get('MOTION_WIDTH', self.width)
+        self.pixel_threshold = app.config.get('MOTION_PIXEL_THRESHOLD', self.pixel_threshold)
+        self.threshold = app.config.get('MOTION_THRESHOLD', self.threshold)
+        self.sudden_threshold = app.config.get('MOTION_SUDDEN_THRESHOLD', self.sudden_threshold)
+        self.cooldown = app.config.get('MOTION_EVENT_COOLDOWN', self.cooldown)
+        self.inactivity_seconds = app.config.get('INACTIVITY_ALERT_HOURS', 4) * 3600
+        self.cpu_budget = app.config.get('MOTION_CPU_BUDGET', self.cpu_budget)
+        self.refresh_interval = app.config.get('VIDEO_CAMERA_REFRESH', self.refresh_interval)
+        if not (background and self.enabled):
+            return
+        if not _load_dependencies():
+            logger.warning("NumPy o Pillow no instalados: detección de movimiento desactivada")
+            self.enabled = False
+            return
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='motion', daemon=True)
+            self._worker.start()
+
+    # --- Cámaras -----------------------------------------------------------
+
+    def sync_cameras(self):
+        from app.camera_feed import camera_feeds, active_cameras
+
+        cameras = active_cameras(self.app)
+        for robot_id, url in cameras.items():
+            feed = camera_feeds.get(robot_id)
+            if robot_id in self._listeners and feed is not None and feed.url == url:
+                continue
+            listener = self._listeners.get(robot_id) or self._make_listener(robot_id)
+            self._listeners[robot_id] = listener
+            camera_feeds.subscribe(robot_id, url, listener)
+        for robot_id in set(self._listeners) - set(cameras):
+            camera_feeds.unsubscribe(robot_id, self._listeners.pop(robot_id))
+            with self._lock:
+                self._cameras.pop(robot_id, None)
+                self._latest.pop(robot_id, None)
+
+    def _make_listener(self, robot_id):
+        def listener(timestamp, jpeg):
+            # Solo interesa el cuadro más reciente; el análisis va a su ritmo
+            with self._lock:
+                if robot_id in self._latest:
+                    camera = self._cameras.get(robot_id)
+                    if camera is not None:
+                        camera.skipped += 1
+                self._latest[robot_id] = (timestamp, jpeg)
+            self._wake.set()
+        return listener
+
+    # --- Análisis ----------------------------------------------------------
+
+    def _run(self):
+        next_sync = 0.0
+        while True:
+            now = time.monotonic()
+            if now >= next_sync:
+                try:
+                    self.sync_cameras()
+                except Exception as e:
+                    logger.error(f"Error al sincronizar las cámaras para el análisis: {str(e)}")
+                next_sync = now + self.refresh_interval
+            self._wake.wait(1.0)
+            self._wake.clear()
+            self._analyze_pending()
+            self.check_inactivity()
+
+    def _analyze_pending(self):
+        interval = 1.0 / self.fps
+        with self._lock:
+            ready = [(robot_id, frame) for robot_id, frame in self._latest.items()
+                     if frame[0] - self._camera(robot_id, frame[0]).last_analyzed >= interval]
+            for robot_id, _ in ready:
+                del self._latest[robot_id]
+
+        for robot_id, (timestamp, jpeg) in ready:
+            if not self._within_budget():
+                self._cameras[robot_id].skipped += 1
+                continue
+            # Solo el CPU de este hilo: process_time() sumaría las peticiones
+            # web y los lectores de cámara
+            started = time.thread_time()
+            try:
+                self.analyze(robot_id, timestamp, jpeg)
+            except Exception as e:
+                logger.error(f"Error al analizar un cuadro de la cámara {robot_id}: {str(e)}")
+            self._spend(time.thread_time() - started)
+
+    def _camera(self, robot_id, now):
+        camera = self._cameras.get(robot_id)
+        if camera is None:
+            camera = self._cameras[robot_id] = CameraActivity(robot_id, now)
+        return camera
+
+    def _within_budget(self, window=10.0):
+        """True si el análisis usó menos de MOTION_CPU_BUDGET de un núcleo en la ventana."""
+        now = time.monotonic()
+        while self._budget and self._budget[0][0] < now - window:
+            self._budget.popleft()
+        return sum(spent for _, spent in self._budget) < self.cpu_budget * window
+
+    def _spend(self, seconds):
+        self._budget.append((time.monotonic(), seconds))
+
+    def analyze(self, robot_id, timestamp, jpeg):
+        """
+        Analiza un cuadro y emite los eventos que correspondan.
+
+        Returns:
+            float: Fracción de píxeles que cambiaron respecto al cuadro anterior
+        """
+        started = time.perf_counter()
+        frame = decode_small(jpeg, self.width)
+        with self._lock:
+            camera = self._camera(robot_id, timestamp)
+        previous, camera.previous = camera.previous, frame
+        camera.last_analyzed = timestamp
+        camera.analyzed += 1
+        if previous is None or previous.shape != frame.shape:
+            camera.total_ms += (time.perf_counter() - started) * 1000
+            return 0.0
+
+        # Diferencia absoluta vectorizada; se descuenta el cambio global de brillo
+        # (p. ej. se enciende una luz) restando la mediana de la diferencia
+        diff = np.abs(frame - previous)
+        diff -= np.median(diff)
+        score = float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+        camera.score = score
+        camera.activity = 0.8 * camera.activity + 0.2 * score
+        camera.total_ms += (time.perf_counter() - started) * 1000
+
+        if score >= self.threshold:
+            camera.last_activity = timestamp
+            camera.inactivity_alerted = False
+            # Cada tipo con su propio enfriamiento: una cámara que parpadea o
+            # ajusta la exposición no genera un evento (y una entrada de
+            # auditoría) por cuadro, y un movimiento previo no oculta un 'sudden'
+            if score >= self.sudden_threshold:
+                if timestamp - camera.last_sudden >= self.cooldown:
+                    self._emit('sudden', robot_id, timestamp, score)
+                    camera.last_sudden = camera.last_event = timestamp
+            elif timestamp - camera.last_event >= self.cooldown:
+                self._emit('motion', robot_id, timestamp, score)
+                camera.last_event = timestamp
+        return score
+
+    def check_inactivity(self, now=None):
+        """Emite 'inactivity' para las cámaras sin actividad en INACTIVITY_ALERT_HOURS."""
+        now = now or time.time()
+        with self._lock:
+            cameras = list(self._cameras.values())
+        for camera in cameras:
+            if not camera.inactivity_alerted and now - camera.last_activity >= self.inactivity_seconds:
+                camera.inactivity_alerted = True
+                self._emit('inactivity', camera.robot_id, now, camera.activity,
+                           hours=round((now - camera.last_activity) / 3600, 1))
+
+    # --- Eventos -----------------------------------------------------------
+
+    def _emit(self, kind, robot_id, timestamp, score, **extra):
+        from app.audit_log import audit_log
+
+        event = {'type': kind, 'robot_id': robot_id, 'timestamp': timestamp,
+                 'score': round(score, 4), **extra}
+        self.events.append(event)
+        if kind == 'motion':
+            logger.debug(f"Movimiento en la cámara del robot {robot_id}: {score:.3f}")
+        else:
+            logger.info(f"Evento de cámara {kind} en el robot {robot_id}: {event}")
+            audit_log.record(f'camera.{kind}', robot_id=robot_id, target=f'robot:{robot_id}',
+                             details={k: v for k, v in event.items() if k not in ('type', 'robot_id')})
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                pass
+
+    def subscribe(self):
+        """Crea una cola que recibirá los eventos de movimiento e inactividad."""
+        subscriber = queue.Queue(maxsize=100)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def status(self, robot_id=None):
+        """Actividad por cámara y eventos recientes."""
+        with self._lock:
+            cameras = {rid: camera.as_dict() for rid, camera in self._cameras.items()
+                       if robot_id is None or rid == robot_id}
+        events = [event for event in self.events if robot_id is None or event['robot_id'] == robot_id]
+        return {'enabled': self.enabled, 'cameras': cameras, 'events': events[-20:]}
+
+
+# Instancia global de la detección de movimiento
+motion_detector = MotionDetector()
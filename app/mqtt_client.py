@@ -1,21 +1,57 @@
 # proyojo/app/mqtt_client.py
 
-import paho.mqtt.client as mqtt
 import json
+import time
 import logging
+import threading
 from flask import current_app
+from app.command_journal import command_journal
+from app.presence import presence, parse_presence_payload
+from app.telemetry import telemetry_ingestor
+from app.command_ack import command_acks
+from app.mqtt_dispatch import mqtt_dispatcher
+from app.payload_codec import payload_codec, decode_batch, decode_json_batch, CodecError
 
 logger = logging.getLogger(__name__)
 
+# Los cambios de presencia disparan el reenvío de la bitácora de comandos
+presence.on_change(command_journal.set_online)
+
 class MQTTClient:
     """Cliente MQTT singleton para comunicación con los robots."""
     
     def __init__(self):
+        self.app = None
         self.client = None
         self.connected = False
+        self._lock = threading.Lock()
     
-    def init_app(self, app):
-        """Inicializa el cliente MQTT con la configuración de Flask."""
+    def init_app(self, app, connect=True):
+        """
+        Inicializa el cliente MQTT con la configuración de Flask.
+        
+        Con connect=False (comandos CLI) no se importa paho-mqtt ni se abre
+        la conexión; start() se llama al publicar por primera vez.
+        """
+        from app import db
+        
+        self.app = app
+        mqtt_dispatcher.init_app(app, db)
+        payload_codec.init_app(app)
+        if connect:
+            self.start()
+    
+    def start(self):
+        """Crea el cliente, conecta con el broker y arranca los servicios asociados."""
+        with self._lock:
+            if self.client is not None:
+                return
+            self._start()
+    
+    def _start(self):
+        import paho.mqtt.client as mqtt
+        
+        app = self.app
         self.client = mqtt.Client(client_id="jojo_web_app", protocol=mqtt.MQTTv311)
         
         # Callbacks
@@ -41,14 +77,22 @@ class MQTTClient:
             
         except Exception as e:
             logger.error(f"Error al conectar con MQTT broker: {str(e)}")
+        
+        # Bitácora de comandos, presencia de robots e ingesta de telemetría
+        command_journal.init_app(app, self._publish_journaled)
+        presence.init_app(app)
+        telemetry_ingestor.init_app(app)
     
     def _on_connect(self, client, userdata, flags, rc):
         """Callback cuando se conecta al broker."""
         if rc == 0:
             self.connected = True
             logger.info("Conectado exitosamente al broker MQTT")
-            # Suscribirse a tópicos de estado de robots
-            client.subscribe("jojo/+/status")
+            # Suscribirse a los tópicos de los manejadores registrados
+            for pattern, qos in mqtt_dispatcher.subscriptions():
+                client.subscribe(pattern, qos=qos)
+            # Reenviar comandos que quedaron en la bitácora mientras no había conexión
+            command_journal.replay_all()
         else:
             logger.error(f"Falló la conexión al broker MQTT. Código: {rc}")
     
@@ -61,41 +105,137 @@ class MQTTClient:
             logger.info("Desconectado del broker MQTT")
     
     def _on_message(self, client, userdata, msg):
-        """Callback cuando se recibe un mensaje."""
+        """Callback cuando se recibe un mensaje: se despacha por patrón de tópico."""
         try:
-            topic = msg.topic
-            payload = msg.payload.decode('utf-8')
-            logger.info(f"Mensaje recibido - Tópico: {topic}, Payload: {payload}")
-            
-            # Aquí puedes procesar mensajes de estado de los robots
-            # Por ejemplo, actualizar la base de datos con el estado
-            
+            mqtt_dispatcher.dispatch(msg.topic, msg.payload)
         except Exception as e:
             logger.error(f"Error al procesar mensaje MQTT: {str(e)}")
     
-    def publish(self, topic, payload, qos=1):
+    def _identify_caller(self, robot_key, payload, robot_id=None):
+        """
+        Identificación de llamadas: jojo/<serial>/call/incoming {"number": ...}
+        se responde en jojo/<serial>/call/caller con el contacto del dueño del robot.
+        """
+        from app import db
+        from app.models import Robot
+        from app.phone_numbers import identify_caller
+        
+        try:
+            number = json.loads(payload).get('number')
+        except (ValueError, AttributeError):
+            number = payload
+        
+        with self.app.app_context():
+            robot = db.session.get(Robot, robot_id) if robot_id is not None else \
+                Robot.query.filter_by(mqtt_topic=robot_key).first()
+            contact = identify_caller(robot.user_id, number) if robot and robot.user_id else None
+            response = {
+                'number': number,
+                'name': contact.name if contact else None,
+                'display': contact.formatted_phone if contact else number,
+                'is_emergency': bool(contact.is_emergency) if contact else False
+            }
+        
+        self._publish_now(f"{robot_key}/call/caller", json.dumps(response), qos=1)
+    
+    def publish(self, topic, payload, qos=1, robot=None, ttl=None):
         """
         Publica un mensaje en un tópico MQTT.
         
+        Los comandos no urgentes (con `robot` y `ttl`) pasan por la bitácora
+        de comandos cuando el robot está fuera de línea o tiene comandos
+        pendientes, y se reenvían en orden cuando vuelve a conectarse.
+        
         Args:
             topic (str): El tópico MQTT
             payload (dict or str): El mensaje a enviar
             qos (int): Quality of Service (0, 1, o 2)
+            robot (Robot): Robot destino (opcional, habilita la bitácora)
+            ttl (int): Segundos de validez del comando en la bitácora
         
         Returns:
-            bool: True si se publicó exitosamente
+            bool: True si se publicó (o quedó en la bitácora) exitosamente
         """
+        if self.client is None:
+            self.start()
+        
+        # La bitácora guarda JSON (lo entiende todo el firmware); el envío
+        # inmediato usa la codificación acordada con el robot
+        text = json.dumps(payload) if isinstance(payload, dict) else payload
+        
+        if robot is not None and ttl is not None:
+            robot_key = robot.mqtt_topic
+            if not self.connected or command_journal.should_journal(robot_key):
+                command_journal.append(robot_key, topic, text, qos=qos, ttl=ttl)
+                logger.info(f"Comando guardado en bitácora - Robot: {robot_key}, Tópico: {topic}")
+                return True
+            if not self._publish_now(topic, payload_codec.encode(topic, payload), qos):
+                command_journal.append(robot_key, topic, text, qos=qos, ttl=ttl)
+            return True
+        
         if not self.connected:
             logger.warning("No conectado al broker MQTT. Intentando enviar de todas formas...")
         
+        return self._publish_now(topic, payload_codec.encode(topic, payload), qos)
+    
+    def publish_many(self, messages, qos=1, timeout=2.0):
+        """
+        Publica varios mensajes seguidos y espera las confirmaciones juntas.
+        
+        Todos los paquetes se entregan a paho antes de esperar ningún PUBACK,
+        así el broker los recibe en ráfaga y el tiempo total es cercano al de
+        un solo viaje de ida y vuelta, no uno por mensaje.
+        
+        Args:
+            messages (list): [(topic, payload)] con payload dict o str
+            qos (int): Quality of Service
+            timeout (float): Espera máxima total de los PUBACK (qos >= 1)
+        
+        Returns:
+            list[str]: Por mensaje, 'delivered' (confirmado por el broker),
+                'sent' (aceptado por paho, sin confirmación a tiempo) o 'failed'
+        """
+        from paho.mqtt.client import MQTT_ERR_SUCCESS
+        
+        if self.client is None:
+            self.start()
+        
+        infos = []
+        for topic, payload in messages:
+            payload = payload_codec.encode(topic, payload)
+            try:
+                info = self.client.publish(topic, payload, qos=qos)
+                infos.append(info if info.rc == MQTT_ERR_SUCCESS else None)
+            except Exception as e:
+                logger.error(f"Excepción al publicar en {topic}: {str(e)}")
+                infos.append(None)
+        
+        deadline = time.monotonic() + timeout
+        results = []
+        for info in infos:
+            if info is None:
+                results.append('failed')
+                continue
+            remaining = deadline - time.monotonic()
+            if qos > 0 and self.connected and remaining > 0 and not info.is_published():
+                try:
+                    info.wait_for_publish(remaining)
+                except (RuntimeError, ValueError):
+                    pass
+            results.append('delivered' if info.is_published() else 'sent')
+        
+        logger.info(f"Publicación en lote: {len(messages)} mensajes, "
+                    f"{results.count('delivered')} confirmados, {results.count('failed')} fallidos")
+        return results
+    
+    def _publish_now(self, topic, payload, qos=1):
+        """Publica directamente en el broker (sin pasar por la bitácora)."""
+        from paho.mqtt.client import MQTT_ERR_SUCCESS
+        
         try:
-            # Convertir payload a JSON si es un diccionario
-            if isinstance(payload, dict):
-                payload = json.dumps(payload)
-            
             result = self.client.publish(topic, payload, qos=qos)
             
-            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+            if result.rc == MQTT_ERR_SUCCESS:
                 logger.info(f"Mensaje publicado - Tópico: {topic}, Payload: {payload}")
                 return True
             else:
@@ -106,6 +246,12 @@ class MQTTClient:
             logger.error(f"Excepción al publicar mensaje: {str(e)}")
             return False
     
+    def _publish_journaled(self, topic, payload, qos=1):
+        """Reenvío desde la bitácora: solo se considera entregado si hay conexión."""
+        if not self.connected:
+            return False
+        return self._publish_now(topic, payload, qos)
+    
     def disconnect(self):
         """Desconecta del broker MQTT."""
         if self.client:
@@ -116,3 +262,92 @@ class MQTTClient:
 
 # Instancia global del cliente MQTT
 mqtt_client = MQTTClient()
+
+
+# --- Manejadores de mensajes entrantes ---------------------------------------
+
+@mqtt_dispatcher.route('jojo/+/status', log=True)
+def _status(message):
+    """Estado del robot, incluido el Last Will ('offline')."""
+    online, battery_level = parse_presence_payload(message.payload)
+    if online is not None:
+        presence.handle_status(message.robot_key, online, battery_level)
+
+
+@mqtt_dispatcher.route('jojo/+/heartbeat', qos=0)
+def _heartbeat(message):
+    """Latidos periódicos: frecuentes, no se registran en el log."""
+    _status(message)
+
+
+@mqtt_dispatcher.route('jojo/+/ack', qos=0)
+def _ack(message):
+    """Confirmaciones de comandos (frecuentes durante la teleoperación)."""
+    command_acks.handle_ack(message.robot_key, message.payload)
+
+
+@mqtt_dispatcher.route('jojo/+/telemetry', qos=0)
+def _telemetry(message):
+    """Telemetría de sensores: se guarda por lotes."""
+    telemetry_ingestor.handle_message(message.robot_key, message.payload)
+
+
+@mqtt_dispatcher.route('jojo/+/telemetry/batch', qos=0)
+def _telemetry_batch(message):
+    """Lote de lecturas: binario bin1 o JSON {"t0", "dt", "sensors", "samples"}."""
+    try:
+        if message.raw[:1] == b'{':
+            sensors, times, rows = decode_json_batch(message.payload)
+        else:
+            sensors, times, rows = decode_batch(message.raw)
+    except CodecError as e:
+        logger.warning(f"Lote de telemetría inválido de {message.robot_key}: {str(e)}")
+        return
+    telemetry_ingestor.add_samples(message.robot_key, sensors, times, rows)
+
+
+@mqtt_dispatcher.route('jojo/+/codec', log=True)
+def _codec(message):
+    """Anuncio de codificaciones del firmware (retenido): {"codecs": ["bin1", "json"]}."""
+    try:
+        offered = json.loads(message.payload).get('codecs') or []
+    except (ValueError, AttributeError):
+        offered = []
+    chosen = payload_codec.negotiate(message.robot_key, offered)
+    mqtt_client._publish_now(f"{message.robot_key}/codec/set", json.dumps({'codec': chosen}), qos=1)
+
+
+@mqtt_dispatcher.route('jojo/+/estado/online', log=True)
+def _estado_online(message):
+    """Estado publicado por el ESP32: {"estado": true}."""
+    _status(message)
+
+
+@mqtt_dispatcher.route('jojo/+/estado/bateria', qos=0)
+def _estado_bateria(message):
+    """Nivel de batería {"nivel": 85}: cuenta como latido y se guarda como lectura."""
+    try:
+        level = json.loads(message.payload).get('nivel')
+    except (ValueError, AttributeError):
+        return
+    if isinstance(level, (int, float)) and not isinstance(level, bool):
+        presence.heartbeat(message.robot_key, int(level))
+        telemetry_ingestor.add_reading(message.robot_key, 'bateria', float(level))
+
+
+@mqtt_dispatcher.route('jojo/+/estado/sensores', qos=0)
+def _estado_sensores(message):
+    """Lecturas de sensores {"ultrasonico": 25, ...}."""
+    telemetry_ingestor.handle_message(message.robot_key, message.payload)
+
+
+@mqtt_dispatcher.route('jojo/+/estado/temperatura', qos=0)
+def _estado_temperatura(message):
+    """Temperaturas {"cpu": 45}: se guardan como 'temperatura_cpu'."""
+    telemetry_ingestor.handle_message(message.robot_key, message.payload, prefix='temperatura_')
+
+
+@mqtt_dispatcher.route('jojo/+/call/incoming', log=True)
+def _call_incoming(message):
+    """Llamada entrante en el robot: responder con el contacto identificado."""
+    mqtt_client._identify_caller(message.robot_key, message.payload, message.robot_id)
@@ -0,0 +1,271 @@
+# proyojo/app/mqtt_dispatch.py
+
+import time
+import logging
+import threading
+from sqlalchemy import event, inspect
+from app.command_ack import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Cubetas (ms) de los histogramas de los manejadores: deberían tardar microsegundos
+HANDLER_BUCKETS = (0.05, 0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000)
+
+# Segundos que se recuerda que un serial no corresponde a ningún robot
+UNKNOWN_ROBOT_TTL = 60
+
+
+class TopicTrie:
+    """
+    Árbol de tópicos con comodines MQTT ('+' un nivel, '#' el resto).
+
+    Cada nivel del patrón es un nodo, así que buscar los manejadores de un
+    tópico recorre sus niveles una vez (más las ramas '+'), sin importar
+    cuántos patrones haya registrados.
+    """
+
+    __slots__ = ('children', 'handlers', 'tail')
+
+    def __init__(self):
+        self.children = {}
+        self.handlers = []   # patrones que terminan exactamente aquí
+        self.tail = []       # patrones que terminan en '#' desde aquí
+
+    def insert(self, pattern, handler):
+        levels = pattern.split('/')
+        for i, level in enumerate(levels):
+            if level == '#' and i != len(levels) - 1:
+                raise ValueError(f"'#' solo puede ir al final del patrón: {pattern}")
+        node = self
+        for level in levels:
+            if level == '#':
+                node.tail.append(handler)
+                return
+            node = node.children.setdefault(level, TopicTrie())
+        node.handlers.append(handler)
+
+    def match(self, topic):
+        """Manejadores de los patrones que coinciden con el tópico, en orden de nivel."""
+        matched = []
+        nodes = [self]
+        for level in topic.split('/'):
+            following = []
+            for node in nodes:
+                matched.extend(node.tail)
+                child = node.children.get(level)
+                if child is not None:
+                    following.append(child)
+                child = node.children.get('+')
+                if child is not None:
+                    following.append(child)
+            if not following:
+                return matched
+            nodes = following
+        for node in nodes:
+            matched.extend(node.tail)   # 'a/#' también coincide con 'a'
+            matched.extend(node.handlers)
+        return matched
+
+
+class HandlerStats:
+    """Contadores y tiempos de un manejador."""
+
+    __slots__ = ('pattern', 'name', 'qos', 'func', 'log', 'calls', 'errors', 'last_error', 'timing')
+
+    def __init__(self, pattern, name, qos, func, log):
+        self.pattern = pattern
+        self.name = name
+        self.qos = qos
+        self.func = func
+        self.log = log
+        self.calls = 0
+        self.errors = 0
+        self.last_error = None
+        self.timing = LatencyHistogram(HANDLER_BUCKETS)
+
+    def as_dict(self):
+        return {
+            'pattern': self.pattern,
+            'qos': self.qos,
+            'calls': self.calls,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'timing': self.timing.as_dict(),
+        }
+
+
+class InboundMessage:
+    """Mensaje recibido, con el robot identificado a partir del tópico."""
+
+    __slots__ = ('topic', 'raw', 'robot_key', 'serial', 'subtopic', '_dispatcher', '_text')
+
+    def __init__(self, topic, raw, dispatcher):
+        self.topic = topic
+        self.raw = raw if isinstance(raw, bytes) else raw.encode('utf-8')
+        self._text = raw if isinstance(raw, str) else None
+        parts = topic.split('/', 2)
+        # jojo/<serial>/<subtópico...>
+        self.serial = parts[1] if len(parts) > 1 else None
+        self.robot_key = '/'.join(parts[:2])
+        self.subtopic = parts[2] if len(parts) > 2 else ''
+        self._dispatcher = dispatcher
+
+    @property
+    def payload(self):
+        """Contenido como texto (los mensajes binarios se leen en `raw`)."""
+        if self._text is None:
+            self._text = self.raw.decode('utf-8', errors='replace')
+        return self._text
+
+    @property
+    def robot_id(self):
+        """Id del robot (caché serial -> id; None si no está registrado)."""
+        return self._dispatcher.robot_id(self.robot_key)
+
+
+class MQTTDispatcher:
+    """
+    Despacho de mensajes MQTT entrantes por patrón de tópico.
+
+    Cada subsistema registra sus manejadores con comodines MQTT:
+
+        @mqtt_dispatcher.route('jojo/+/telemetry', qos=0)
+        def _telemetry(message): ...
+
+    Los patrones se compilan en un TopicTrie, así que cada mensaje cuesta
+    O(profundidad del tópico) sin importar cuántos manejadores haya. Las
+    suscripciones al broker salen de los mismos patrones. El id del robot
+    se resuelve con una caché serial -> id que se invalida al cambiar o
+    borrar un robot. Por manejador se cuentan llamadas, errores y un
+    histograma de tiempos (stats()).
+    """
+
+    def __init__(self):
+        self.app = None
+        self.unmatched = 0
+        self._trie = TopicTrie()
+        self._handlers = []
+        self._lock = threading.Lock()
+        self._robot_ids = {}    # 'jojo/<serial>' -> (id o None, vence)
+        self._listening = False
+
+    def init_app(self, app, db):
+        self.app = app
+        if not self._listening:
+            event.listen(db.session, 'after_flush', self._after_flush)
+            self._listening = True
+
+    # --- Registro ----------------------------------------------------------
+
+    def route(self, pattern, qos=1, name=None, log=False):
+        """
+        Decorador que registra un manejador para un patrón de tópico.
+
+        Args:
+            pattern (str): Patrón MQTT, p. ej. 'jojo/+/estado/#'
+            qos (int): QoS de la suscripción
+            name (str): Nombre en las estadísticas (por defecto el de la función)
+            log (bool): Registrar cada mensaje en el log (solo tópicos poco frecuentes)
+        """
+        def decorator(func):
+            self.register(pattern, func, qos=qos, name=name, log=log)
+            return func
+        return decorator
+
+    def register(self, pattern, func, qos=1, name=None, log=False):
+        handler = HandlerStats(pattern, name or func.__name__.lstrip('_'), qos, func, log)
+        with self._lock:
+            self._trie.insert(pattern, handler)
+            self._handlers.append(handler)
+        return handler
+
+    def subscriptions(self):
+        """[(patrón, qos)] a suscribir en el broker; el mayor QoS por patrón."""
+        qos = {}
+        for handler in self._handlers:
+            qos[handler.pattern] = max(qos.get(handler.pattern, 0), handler.qos)
+        return list(qos.items())
+
+    # --- Despacho ----------------------------------------------------------
+
+    def dispatch(self, topic, payload):
+        """
+        Entrega el mensaje a todos los manejadores que coinciden.
+
+        Un error en un manejador se cuenta y se registra sin afectar a los demás.
+        El contenido puede ser texto o bytes (codificaciones binarias).
+
+        Returns:
+            int: Manejadores ejecutados
+        """
+        handlers = self._trie.match(topic)
+        if not handlers:
+            self.unmatched += 1
+            logger.debug(f"Mensaje sin manejador - Tópico: {topic}")
+            return 0
+
+        message = InboundMessage(topic, payload, self)
+        for handler in handlers:
+            if handler.log:
+                logger.info(f"Mensaje recibido - Tópico: {topic}, Payload: {message.payload}")
+            started = time.perf_counter()
+            try:
+                handler.func(message)
+            except Exception as e:
+                handler.errors += 1
+                handler.last_error = str(e)
+                logger.error(f"Error en el manejador MQTT {handler.name} ({topic}): {str(e)}")
+            finally:
+                handler.calls += 1
+                handler.timing.observe((time.perf_counter() - started) * 1000)
+        return len(handlers)
+
+    def stats(self):
+        """Estadísticas por manejador."""
+        return {
+            'unmatched': self.unmatched,
+            'robots_cached': len(self._robot_ids),
+            'handlers': {handler.name: handler.as_dict() for handler in self._handlers},
+        }
+
+    # --- Caché serial -> robot ---------------------------------------------
+
+    def robot_id(self, robot_key):
+        """Id del robot con el tópico base robot_key ('jojo/<serial>')."""
+        cached = self._robot_ids.get(robot_key)
+        if cached is not None and (cached[0] is not None or cached[1] > time.monotonic()):
+            return cached[0]
+
+        from app import db
+        from app.models import Robot
+
+        with self.app.app_context():
+            robot_id = db.session.query(Robot.id).filter(Robot.mqtt_topic == robot_key).scalar()
+        # Los seriales desconocidos se recuerdan un rato para no consultar en cada mensaje
+        self._robot_ids[robot_key] = (robot_id, time.monotonic() + UNKNOWN_ROBOT_TTL)
+        return robot_id
+
+    def forget(self, robot_key=None):
+        """Olvida un robot de la caché (o todos)."""
+        if robot_key is None:
+            self._robot_ids.clear()
+        else:
+            self._robot_ids.pop(robot_key, None)
+
+    def _after_flush(self, session, flush_context):
+        from app.models import Robot
+
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if not isinstance(obj, Robot):
+                continue
+            history = inspect(obj).attrs.mqtt_topic.history
+            keys = set(history.deleted or ()) | set(history.added or ())
+            if obj in session.deleted:
+                keys.add(obj.mqtt_topic)
+            for robot_key in keys:
+                if robot_key:
+                    self.forget(robot_key)
+
+
+# Instancia global del despachador de mensajes MQTT
+mqtt_dispatcher = MQTTDispatcher()
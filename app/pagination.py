@@ -0,0 +1,112 @@
+# proyojo/app/pagination.py
+
+import time
+import base64
+import threading
+from datetime import datetime
+from sqlalchemy import or_, and_
+
+
+class KeysetPage:
+    """Resultado de una página obtenida por keyset (sin OFFSET)."""
+
+    def __init__(self, items, next_cursor, cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return not self.cursor
+
+
+def encode_cursor(created_at, item_id):
+    """Codifica la posición (created_at, id) en un token opaco para la URL."""
+    raw = f"{created_at.isoformat() if created_at else ''}|{item_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Decodifica un token de posición. Devuelve None si no es válido."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_raw, item_id = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+        created_at = datetime.fromisoformat(created_raw) if created_raw else None
+        return created_at, int(item_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_paginate(query, model, cursor=None, per_page=50):
+    """
+    Pagina por (created_at, id) descendente usando keyset.
+
+    Cada página cuesta lo mismo sin importar cuántas filas haya antes,
+    porque la consulta arranca desde la última posición vista (índice
+    sobre created_at, id) en lugar de saltar filas con OFFSET.
+
+    Args:
+        query: Consulta base (ya filtrada)
+        model: Modelo con columnas created_at e id
+        cursor (str): Token de la página anterior (None = primera página)
+        per_page (int): Tamaño de página
+
+    Returns:
+        KeysetPage
+    """
+    position = decode_cursor(cursor)
+    if position:
+        created_at, item_id = position
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < item_id)
+        ))
+
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.created_at, last.id)
+
+    return KeysetPage(rows, next_cursor, cursor)
+
+
+class CountCache:
+    """
+    Caché en memoria de conteos con expiración.
+
+    Evita ejecutar count() en cada vista para los mismos filtros; el
+    conteo puede ir hasta `ttl` segundos por detrás del real.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def get(self, key, compute):
+        now = time.time()
+        with self._lock:
+            cached = self._values.get(key)
+            if cached and cached[1] > now:
+                return cached[0]
+        value = compute()
+        with self._lock:
+            self._values[key] = (value, now + self.ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+# Conteos de los listados de administración
+admin_counts = CountCache()
@@ -0,0 +1,255 @@
+# proyojo/app/payload_codec.py
+
+import sys
+import json
+import struct
+import logging
+import threading
+from array import array
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# NumPy es opcional (sin él se decodifica con array) y se importa con el
+# primer lote binario: cargarlo aquí retrasaría cada arranque de la app
+_numpy = None
+
+# Codificaciones conocidas, de la más compacta a la más compatible
+CODECS = ('bin1', 'json')
+
+# Tablas del protocolo binario: el índice es el código en el cable.
+# Solo se agregan valores al final; nunca se reordenan.
+ACTIONS = (
+    'stop', 'forward', 'backward', 'left', 'right',
+    'speed-up', 'speed-down', 'horn', 'lights', 'emergency',
+    'base', 'shoulder', 'elbow', 'wrist', 'gripper',
+)
+SENSORS = (
+    'bateria', 'ultrasonico', 'temperatura', 'temperatura_cpu', 'humedad',
+    'infrarrojo', 'corriente', 'voltaje', 'wifi_rssi',
+)
+ACTION_CODES = {action: code for code, action in enumerate(ACTIONS)}
+SENSOR_CODES = {sensor: code for code, sensor in enumerate(SENSORS)}
+
+# Comando (18 bytes, little endian):
+#   versión u8 | acción u8 | id 8 bytes | segundos u32 | milisegundos u16 | valor i16
+COMMAND = struct.Struct('<BB8sIHh')
+NO_VALUE = -32768
+
+# Lote de telemetría (jojo/<serial>/telemetry/batch):
+#   versión u8 | sensores u8 | muestras u16 | inicio u32 (epoch s) | intervalo u16 (ms)
+#   códigos de sensor (u8 × sensores)
+#   muestras float32 (muestras × sensores, por filas); NaN = sin lectura
+BATCH_HEADER = struct.Struct('<BBHIH')
+VERSION = 1
+
+
+class CodecError(ValueError):
+    """Mensaje binario mal formado."""
+
+
+def encode_command(payload):
+    """
+    Comando {'id', 'action', 'value', 'timestamp'} en formato bin1.
+
+    Returns:
+        bytes: El mensaje, o None si no cabe en el formato fijo (acción
+            desconocida, valor no entero de 16 bits, claves adicionales...)
+    """
+    if set(payload) - {'id', 'action', 'value', 'timestamp'}:
+        return None
+    action = ACTION_CODES.get(payload.get('action'))
+    value = payload.get('value')
+    if action is None:
+        return None
+    if value is None:
+        value = NO_VALUE
+    elif isinstance(value, bool) or not isinstance(value, int) or not NO_VALUE < value <= 32767:
+        return None
+    try:
+        command_id = bytes.fromhex(payload.get('id') or '')
+        sent = datetime.fromisoformat(payload['timestamp'].rstrip('Z')) if payload.get('timestamp') \
+            else datetime.utcnow()
+    except (ValueError, TypeError, AttributeError):
+        return None
+    if len(command_id) != 8:
+        return None
+    epoch = (sent - datetime(1970, 1, 1)).total_seconds()
+    return COMMAND.pack(VERSION, action, command_id, int(epoch), int(epoch * 1000) % 1000, value)
+
+
+def decode_command(data):
+    """Inverso de encode_command (lo usa el firmware; aquí sirve de referencia)."""
+    if len(data) != COMMAND.size or data[0] != VERSION:
+        raise CodecError('Comando binario inválido')
+    _, action, command_id, seconds, millis, value = COMMAND.unpack(data)
+    if action >= len(ACTIONS):
+        raise CodecError(f'Acción desconocida: {action}')
+    sent = datetime(1970, 1, 1) + timedelta(seconds=seconds, milliseconds=millis)
+    return {'id': command_id.hex(), 'action': ACTIONS[action],
+            'value': None if value == NO_VALUE else value,
+            'timestamp': sent.isoformat() + 'Z'}
+
+
+def encode_batch(start, interval_ms, sensors, samples):
+    """
+    Empaqueta un lote de telemetría bin1 (referencia para el firmware y pruebas).
+
+    Args:
+        start (float): Epoch en segundos de la primera muestra
+        interval_ms (int): Milisegundos entre muestras
+        sensors (list[str]): Sensores, en el orden de las columnas
+        samples (list[list[float]]): Una fila por muestra
+    """
+    codes = bytes(SENSOR_CODES[sensor] for sensor in sensors)
+    values = array('f', [float(v) for row in samples for v in row])
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return BATCH_HEADER.pack(VERSION, len(sensors), len(samples), int(start), interval_ms) + \
+        codes + values.tobytes()
+
+
+def _sensor_name(code):
+    return SENSORS[code] if code < len(SENSORS) else f'sensor_{code}'
+
+
+def _load_numpy():
+    """Módulo numpy, o None si no está instalado (se comprueba una sola vez)."""
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+
+def decode_batch(data):
+    """
+    Decodifica un lote de telemetría bin1 de forma vectorizada.
+
+    Toda la matriz de muestras se interpreta de una vez (numpy.frombuffer o
+    array.frombytes), sin desempaquetar valor por valor.
+
+    Returns:
+        tuple: (sensores, marcas de tiempo, filas de valores)
+    """
+    if len(data) < BATCH_HEADER.size or data[0] != VERSION:
+        raise CodecError('Lote de telemetría inválido')
+    _, n_sensors, n_samples, start, interval_ms = BATCH_HEADER.unpack_from(data)
+    offset = BATCH_HEADER.size
+    body = memoryview(data)[offset + n_sensors:]
+    if len(body) != n_sensors * n_samples * 4:
+        raise CodecError(f'Tamaño de lote inválido: {len(body)} bytes para '
+                         f'{n_samples}×{n_sensors} muestras')
+    sensors = [_sensor_name(code) for code in data[offset:offset + n_sensors]]
+
+    base = datetime(1970, 1, 1) + timedelta(seconds=start)
+    step = timedelta(milliseconds=interval_ms)
+    times = [base + step * i for i in range(n_samples)]
+
+    np = _load_numpy()
+    if np is not None:
+        rows = np.frombuffer(body, dtype='<f4').reshape(n_samples, n_sensors).tolist()
+    else:
+        values = array('f')
+        values.frombytes(body)
+        if sys.byteorder == 'big':
+            values.byteswap()
+        values = values.tolist()
+        rows = [values[i * n_sensors:(i + 1) * n_sensors] for i in range(n_samples)]
+    return sensors, times, rows
+
+
+def decode_json_batch(text):
+    """
+    Lote de telemetría en JSON para el firmware sin formato binario:
+    {"t0": epoch, "dt": ms, "sensors": [...], "samples": [[...], ...]}
+    """
+    try:
+        data = json.loads(text)
+        sensors = data['sensors']
+        samples = data['samples']
+        if not isinstance(sensors, list):
+            raise TypeError("'sensors' debe ser una lista")
+        # Filas como listas: add_samples las recorre sin más validación
+        if not isinstance(samples, list) or not all(isinstance(row, list) for row in samples):
+            raise TypeError("'samples' debe ser una lista de listas")
+        sensors = [str(sensor) for sensor in sensors]
+        # t0/dt enormes o no finitos desbordan datetime (OverflowError) o son NaN (ValueError)
+        base = datetime(1970, 1, 1) + timedelta(seconds=float(data['t0']))
+        step = timedelta(milliseconds=float(data.get('dt', 0)))
+        times = [base + step * i for i in range(len(samples))]
+    except (ValueError, TypeError, KeyError, OverflowError) as e:
+        raise CodecError(f'Lote JSON inválido: {str(e)}')
+    return sensors, times, samples
+
+
+class PayloadCodec:
+    """
+    Codificación negociada por robot de los mensajes MQTT.
+
+    El firmware anuncia en jojo/<serial>/codec (mensaje retenido, así el
+    servidor lo vuelve a recibir al reconectarse) las codificaciones que
+    entiende, p. ej. {"codecs": ["bin1", "json"]}. El servidor elige la
+    primera de PAYLOAD_CODECS que el robot admita y la confirma en
+    jojo/<serial>/codec/set. Con 'bin1' los comandos viajan en un struct
+    fijo de 18 bytes en lugar de ~100 bytes de JSON; lo que no cabe en el
+    formato (acciones o valores nuevos, otros subtópicos) y la bitácora de
+    comandos siguen en JSON, que todo el firmware entiende.
+    """
+
+    def __init__(self):
+        self.preferred = CODECS
+        self.encoded = 0
+        self.fallbacks = 0
+        self._codecs = {}    # 'jojo/<serial>' -> codificación acordada
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.preferred = tuple(c for c in app.config.get('PAYLOAD_CODECS', CODECS) if c in CODECS)
+
+    def negotiate(self, robot_key, offered):
+        """Elige la codificación para el robot a partir de las que anuncia."""
+        chosen = next((codec for codec in self.preferred if codec in offered), 'json')
+        with self._lock:
+            previous = self._codecs.get(robot_key, 'json')
+            self._codecs[robot_key] = chosen
+        if chosen != previous:
+            logger.info(f"Codificación de {robot_key}: {chosen}")
+        return chosen
+
+    def codec_for(self, robot_key):
+        return self._codecs.get(robot_key, 'json')
+
+    def encode(self, topic, payload):
+        """
+        Codifica un mensaje saliente para el robot del tópico.
+
+        Returns:
+            bytes | str: bin1 si el robot lo acordó y el mensaje cabe; si no, JSON
+        """
+        if isinstance(payload, (str, bytes)):
+            return payload
+        parts = topic.split('/', 2)
+        if len(parts) == 3 and parts[2] == 'command' and \
+                self.codec_for('/'.join(parts[:2])) == 'bin1':
+            data = encode_command(payload)
+            if data is not None:
+                self.encoded += 1
+                return data
+            self.fallbacks += 1
+        return json.dumps(payload)
+
+    def stats(self):
+        with self._lock:
+            robots = {}
+            for codec in self._codecs.values():
+                robots[codec] = robots.get(codec, 0) + 1
+        return {'preferred': list(self.preferred), 'robots': robots,
+                'encoded': self.encoded, 'fallbacks': self.fallbacks}
+
+
+# Instancia global de la codificación de mensajes
+payload_codec = PayloadCodec()
@@ -0,0 +1,77 @@
+# proyojo/app/phone_numbers.py
+
+from flask import current_app
+
+# Lada de país por defecto (México)
+DEFAULT_COUNTRY_CODE = '52'
+
+
+def _default_country_code():
+    try:
+        return current_app.config.get('PHONE_DEFAULT_COUNTRY_CODE', DEFAULT_COUNTRY_CODE)
+    except RuntimeError:
+        # Fuera del contexto de la aplicación (p. ej. migraciones)
+        return DEFAULT_COUNTRY_CODE
+
+
+def normalize_phone(raw, country_code=None):
+    """
+    Normaliza un teléfono a formato canónico tipo E.164.
+
+    - Números nacionales de 10 dígitos: '+52' + número ('55 1234 5678' -> '+525512345678')
+    - Números con '+' o prefijo internacional '00': se conservan los dígitos
+    - Números cortos de servicio (911, 065...): solo dígitos, sin lada
+
+    Returns:
+        str or None: Número canónico, o None si no tiene dígitos
+    """
+    if not raw:
+        return None
+    country_code = country_code or _default_country_code()
+
+    text = raw.strip()
+    digits = ''.join(filter(str.isdigit, text))
+    if not digits:
+        return None
+
+    if text.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00') and len(digits) > 10:
+        return '+' + digits[2:]
+    if len(digits) == 10:
+        return f'+{country_code}{digits}'
+    if len(digits) == 10 + len(country_code) and digits.startswith(country_code):
+        return '+' + digits
+    return digits
+
+
+def format_phone(normalized, raw=None, country_code=None):
+    """
+    Formato de visualización a partir del número canónico.
+
+    Los números nacionales se muestran como (XXX) XXX-XXXX; el resto
+    se muestra tal como lo escribió el usuario.
+    """
+    country_code = country_code or _default_country_code()
+    prefix = '+' + country_code
+    if normalized and normalized.startswith(prefix) and len(normalized) == len(prefix) + 10:
+        national = normalized[len(prefix):]
+        return f'({national[:3]}) {national[3:6]}-{national[6:]}'
+    return raw or normalized or ''
+
+
+def identify_caller(user_id, number):
+    """
+    Búsqueda inversa: número -> contacto del usuario (usa el índice
+    sobre user_id, phone_normalized).
+
+    Returns:
+        Contact or None
+    """
+    from app.models import Contact
+
+    normalized = normalize_phone(number)
+    if not normalized:
+        return None
+    return Contact.query.filter_by(user_id=user_id, phone_normalized=normalized) \
+        .order_by(Contact.is_emergency.desc(), Contact.is_favorite.desc()).first()
@@ -0,0 +1,303 @@
+# proyojo/app/presence.py
+
+import json
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceTracker:
+    """
+    Seguimiento de presencia de los robots a partir de MQTT.
+
+    Los robots publican latidos periódicos (jojo/<serial>/heartbeat) y
+    registran un Last Will en jojo/<serial>/status con 'offline'. Un robot
+    que falla PRESENCE_MISSED_HEARTBEATS latidos seguidos se marca fuera de línea.
+
+    Como todos los robots comparten el mismo tiempo de expiración, basta un
+    OrderedDict ordenado por último latido: cada latido mueve al robot al
+    final (O(1)) y un único hilo expira desde el principio. Los cambios de
+    estado se envían a los dashboards suscritos y se guardan en la base de
+    datos agrupados cada PRESENCE_FLUSH_INTERVAL segundos; la versión
+    'robots' de la caché HTTP solo cambia si cambió is_online o la batería
+    (un latido que solo mueve last_seen no invalida las páginas).
+    """
+
+    def __init__(self):
+        self.app = None
+        self.timeout = 90
+        self.flush_interval = 5
+        self._lock = threading.Lock()
+        self._last_seen = OrderedDict()   # robot -> timestamp del último latido (solo en línea)
+        self._state = {}                  # robot -> True/False
+        self._dirty = {}                  # robot -> cambios pendientes de guardar
+        self._written = {}                # robot -> (online, batería) guardados en la base
+        self._listeners = []              # colas de los dashboards suscritos
+        self._on_change = []              # callbacks(robot, online)
+        self._worker = None
+
+    def init_app(self, app):
+        """Configura los tiempos y arranca el hilo de expiración y guardado."""
+        self.app = app
+        interval = app.config.get('PRESENCE_HEARTBEAT_INTERVAL', 30)
+        missed = app.config.get('PRESENCE_MISSED_HEARTBEATS', 3)
+        self.timeout = interval * missed
+        self.flush_interval = app.config.get('PRESENCE_FLUSH_INTERVAL', self.flush_interval)
+
+        if self._worker is None:
+            self._reset_online()
+            self._worker = threading.Thread(target=self._run, name='presence', daemon=True)
+            self._worker.start()
+
+    def on_change(self, callback):
+        """Registra un callback(robot, online) para cada cambio de estado."""
+        self._on_change.append(callback)
+        return callback
+
+    # --- Entradas desde MQTT ----------------------------------------------
+
+    def heartbeat(self, robot_key, battery_level=None):
+        """Registra un latido del robot (O(1))."""
+        now = time.time()
+        with self._lock:
+            self._last_seen[robot_key] = now
+            self._last_seen.move_to_end(robot_key)
+            changed = self._state.get(robot_key) is not True
+            self._state[robot_key] = True
+            self._mark_dirty(robot_key, True, now, battery_level)
+        if changed:
+            self._notify(robot_key, True)
+
+    def set_offline(self, robot_key):
+        """Marca al robot fuera de línea (Last Will o estado 'offline')."""
+        now = time.time()
+        with self._lock:
+            self._last_seen.pop(robot_key, None)
+            changed = self._state.get(robot_key) is not False
+            self._state[robot_key] = False
+            if changed:
+                self._mark_dirty(robot_key, False, now)
+        if changed:
+            self._notify(robot_key, False)
+
+    def handle_status(self, robot_key, online, battery_level=None):
+        """Procesa un mensaje de estado: 'online' cuenta como latido."""
+        if online:
+            self.heartbeat(robot_key, battery_level)
+        else:
+            self.set_offline(robot_key)
+
+    # --- Consultas ---------------------------------------------------------
+
+    def is_online(self, robot_key):
+        """Estado conocido del robot (None si no se ha recibido nada)."""
+        with self._lock:
+            return self._state.get(robot_key)
+
+    def snapshot(self):
+        """Copia del estado de todos los robots conocidos."""
+        with self._lock:
+            return dict(self._state)
+
+    # --- Suscripción de dashboards ----------------------------------------
+
+    def subscribe(self):
+        """Crea una cola que recibirá los cambios de estado."""
+        listener = queue.Queue(maxsize=100)
+        with self._lock:
+            self._listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    # --- Internos ----------------------------------------------------------
+
+    def _mark_dirty(self, robot_key, online, now, battery_level=None):
+        """Acumula el último estado del robot; se guarda en el próximo flush."""
+        entry = self._dirty.setdefault(robot_key, {})
+        entry['online'] = online
+        entry['last_seen'] = now
+        if battery_level is not None:
+            entry['battery_level'] = battery_level
+
+    def _notify(self, robot_key, online):
+        logger.info(f"Presencia: {robot_key} {'en línea' if online else 'fuera de línea'}")
+        event = {'robot': robot_key, 'online': online, 'timestamp': time.time()}
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener.put_nowait(event)
+            except queue.Full:
+                # Dashboard lento: se descarta el evento, el polling lo corregirá
+                pass
+        for callback in self._on_change:
+            try:
+                callback(robot_key, online)
+            except Exception as e:
+                logger.error(f"Error en callback de presencia: {str(e)}")
+
+    def _run(self):
+        last_flush = time.time()
+        while True:
+            time.sleep(1)
+            self._expire()
+            if time.time() - last_flush >= self.flush_interval:
+                last_flush = time.time()
+                try:
+                    self._flush()
+                except Exception as e:
+                    logger.error(f"Error al guardar presencia de robots: {str(e)}")
+
+    def _expire(self):
+        """Expira desde el frente del orden los robots sin latidos recientes."""
+        deadline = time.time() - self.timeout
+        expired = []
+        with self._lock:
+            while self._last_seen:
+                robot_key, seen = next(iter(self._last_seen.items()))
+                if seen > deadline:
+                    break
+                self._last_seen.popitem(last=False)
+                self._state[robot_key] = False
+                self._mark_dirty(robot_key, False, seen)
+                expired.append(robot_key)
+        for robot_key in expired:
+            self._notify(robot_key, False)
+
+    def _reset_online(self):
+        """
+        Al arrancar, ningún robot cuenta como en línea hasta su próximo latido:
+        los que se desconectaron con el servidor apagado quedarían en línea
+        para siempre (no hay latidos que expirar).
+        """
+        from sqlalchemy import update
+        from app import db
+        from app.database import db_writer
+        from app.models import Robot
+        from app.response_cache import bump_version
+
+        table = Robot.__table__
+
+        def write():
+            result = db.session.execute(
+                update(table).where(table.c.is_online == True).values(is_online=False)
+            )
+            if result.rowcount:
+                bump_version(db.session, 'robots')
+
+        try:
+            return db_writer.submit(write)
+        except Exception as e:
+            logger.error(f"Error al reiniciar la presencia de los robots: {str(e)}")
+
+    def _flush(self):
+        """Guarda en un solo lote los estados acumulados desde el último flush."""
+        with self._lock:
+            if not self._dirty:
+                return
+            dirty, self._dirty = self._dirty, {}
+
+        from sqlalchemy import update, bindparam
+        from app import db
+        from app.database import db_writer
+        from app.models import Robot
+        from app.response_cache import bump_version
+
+        table = Robot.__table__
+        # ¿Cambió algo visible? Solo last_seen no invalida la caché
+        changed = False
+        with self._lock:
+            for key, entry in dirty.items():
+                written = self._written.get(key, (None, None))
+                values = (entry['online'], entry.get('battery_level', written[1]))
+                if values != written:
+                    self._written[key] = values
+                    changed = True
+        rows = [{'key': key,
+                 'online': entry['online'],
+                 'seen': datetime.utcfromtimestamp(entry['last_seen'])}
+                for key, entry in dirty.items()]
+        battery_rows = [{'key': key, 'battery': entry['battery_level']}
+                        for key, entry in dirty.items() if 'battery_level' in entry]
+
+        def write():
+            db.session.execute(
+                update(table)
+                .where(table.c.mqtt_topic == bindparam('key'))
+                .values(is_online=bindparam('online'), last_seen=bindparam('seen')),
+                rows
+            )
+            if battery_rows:
+                db.session.execute(
+                    update(table)
+                    .where(table.c.mqtt_topic == bindparam('key'))
+                    .values(battery_level=bindparam('battery')),
+                    battery_rows
+                )
+            # Las páginas que muestran el estado de los robots dejan de ser válidas
+            if changed:
+                bump_version(db.session, 'robots')
+
+        def forget(future):
+            # Si la escritura falló, el próximo flush vuelve a guardar (e invalidar)
+            if future.exception() is not None:
+                with self._lock:
+                    for key in dirty:
+                        self._written.pop(key, None)
+
+        # Las escrituras en segundo plano pasan por el escritor único
+        future = db_writer.submit(write)
+        future.add_done_callback(forget)
+        return future
+
+
+def parse_presence_payload(payload):
+    """
+    Interpreta un mensaje de estado o latido del robot.
+
+    Acepta texto plano ('online'/'offline') o JSON con las claves
+    'online', 'estado' o 'status', y opcionalmente 'bateria'/'battery'.
+
+    Returns:
+        tuple: (online, battery_level); online es None si no es reconocible
+    """
+    try:
+        data = json.loads(payload)
+    except ValueError:
+        data = payload
+
+    battery_level = None
+    if isinstance(data, dict):
+        battery = data.get('bateria', data.get('battery'))
+        if isinstance(battery, (int, float)):
+            battery_level = int(battery)
+        for key in ('online', 'estado', 'status'):
+            if key in data:
+                data = data[key]
+                break
+        else:
+            # Un latido sin campo de estado implica que el robot está en línea
+            return True, battery_level
+
+    if isinstance(data, bool):
+        return data, battery_level
+    if isinstance(data, str):
+        value = data.strip().lower()
+        if value in ('online', 'true', '1', 'conectado', ''):
+            return True, battery_level
+        if value in ('offline', 'false', '0', 'desconectado'):
+            return False, battery_level
+    return None, battery_level
+
+
+# Instancia global del seguimiento de presencia
+presence = PresenceTracker()
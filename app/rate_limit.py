@@ -0,0 +1,294 @@
+# proyojo/app/rate_limit.py
+
+import re
+import math
+import time
+import zlib
+import logging
+import threading
+from functools import wraps
+from flask import request, jsonify, render_template, current_app
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+UNITS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+LIMIT_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(second|minute|hour|day)s?\s*(?:burst\s+(\d+))?\s*$')
+
+
+def parse_limit(text):
+    """
+    Convierte '20/second', '5/minute' o '20/second burst 40' en
+    (tokens por segundo, capacidad). Sin burst, la capacidad es N.
+    """
+    match = LIMIT_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Límite inválido: {text!r}")
+    count, unit, burst = match.groups()
+    return int(count) / UNITS[unit], int(burst or count)
+
+
+class MemoryBackend:
+    """
+    Cubetas de tokens en memoria del proceso, con bloqueo por franjas.
+
+    Cada clave cae en una franja (hash % stripes) con su propio lock, así
+    peticiones de usuarios distintos casi nunca compiten por el mismo
+    bloqueo. Comprobar una cubeta es O(1). Las cubetas que ya se rellenaron
+    por completo se descartan cuando una franja crece demasiado (volver a
+    crearlas da el mismo resultado).
+
+    Es también el sustituto local del backend compartido en pruebas y
+    despliegues de un solo proceso.
+    """
+
+    def __init__(self, stripes=64, max_keys=100000):
+        self.stripes = [(threading.Lock(), {}) for _ in range(stripes)]
+        self.max_per_stripe = max(1, max_keys // stripes)
+
+    def consume(self, key, rate, burst, cost=1, now=None):
+        """
+        Descuenta `cost` tokens de la cubeta `key`.
+
+        Returns:
+            tuple: (permitido, segundos hasta poder reintentar)
+        """
+        now = time.monotonic() if now is None else now
+        lock, buckets = self.stripes[zlib.crc32(key.encode('utf-8')) % len(self.stripes)]
+        with lock:
+            bucket = buckets.get(key)
+            if bucket is None:
+                tokens = float(burst)
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            # [tokens, último cálculo, momento en que vuelve a estar llena]
+            buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+
+            if len(buckets) > self.max_per_stripe:
+                for stale in [k for k, b in buckets.items() if b[2] <= now]:
+                    del buckets[stale]
+
+        return allowed, 0.0 if allowed else (cost - tokens) / rate
+
+    def reset(self):
+        for lock, buckets in self.stripes:
+            with lock:
+                buckets.clear()
+
+
+# Cubeta de tokens atómica en Redis: un HSET por clave con expiración al rellenarse
+REDIS_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = tonumber(ARGV[4])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(data[1]) or burst
+local ts = tonumber(data[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local retry = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    retry = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(retry)}
+"""
+
+
+class RedisBackend:
+    """
+    Cubetas compartidas entre procesos (varios workers de gunicorn).
+
+    Requiere el paquete opcional `redis`; la operación completa es un
+    script Lua, así que es atómica sin bloqueos del lado de Python.
+
+    Si Redis no responde, los límites pasan a un MemoryBackend del proceso
+    durante `retry_interval` segundos en lugar de fallar: una caída de la
+    caché no debe bloquear llamadas de emergencia ni comandos.
+    """
+
+    def __init__(self, url, prefix='ratelimit:', timeout=0.5, retry_interval=30):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+        self.prefix = prefix
+        self.retry_interval = retry_interval
+        self.fallback = MemoryBackend()
+        self._errors = redis.exceptions.RedisError
+        self._script = self.client.register_script(REDIS_SCRIPT)
+        self._down_until = 0.0
+
+    def consume(self, key, rate, burst, cost=1, now=None):
+        if time.monotonic() < self._down_until:
+            return self.fallback.consume(key, rate, burst, cost)
+        now = time.time() if now is None else now
+        try:
+            allowed, retry = self._script(keys=[self.prefix + key], args=[rate, burst, cost, now])
+        except self._errors as e:
+            # Un solo aviso por intervalo; mientras tanto ni se intenta Redis
+            self._down_until = time.monotonic() + self.retry_interval
+            logger.warning(f"Redis no disponible para los límites de peticiones ({str(e)}): "
+                           f"límites en memoria del proceso durante {self.retry_interval}s")
+            return self.fallback.consume(key, rate, burst, cost)
+        return bool(allowed), float(retry)
+
+    def reset(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+def _client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def _user_key():
+    if current_user.is_authenticated:
+        return f'u{current_user.id}'
+    return f'ip{_client_ip()}'
+
+
+def _robot_key():
+    robot_id = (request.view_args or {}).get('robot_id')
+    return f'r{robot_id}' if robot_id is not None else None
+
+
+# Funciones que identifican al "quién" de cada límite
+KEY_FUNCTIONS = {
+    'ip': _client_ip,
+    'user': _user_key,
+    'robot': _robot_key,
+}
+
+
+class RateLimiter:
+    """
+    Limitación de peticiones por cubetas de tokens.
+
+    Uso en cualquier Blueprint:
+
+        @rate_limiter.limit('20/second burst 40', by='user')
+        def send_command(robot_id): ...
+
+    o, dentro de la vista y tras comprobar permisos:
+
+        limited = rate_limiter.enforce('api.send_command:robot', f'r{robot_id}', '30/second')
+
+    El límite de un endpoint se puede cambiar sin tocar código con
+    RATELIMITS = {'api.send_command:user': '10/second'} (endpoint:by).
+    El estado vive en MemoryBackend (por proceso) o, con
+    RATELIMIT_STORAGE_URL='redis://...', en Redis para compartirlo entre
+    workers. Las respuestas limitadas son 429 con Retry-After.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = True
+        self.backend = MemoryBackend()
+        self.overrides = {}
+        self._parsed = {}
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('RATELIMIT_ENABLED', True)
+        self.overrides = app.config.get('RATELIMITS') or {}
+        self._parsed = {}
+        self.backend = self._create_backend(app)
+
+    @staticmethod
+    def _create_backend(app):
+        backend = app.config.get('RATELIMIT_BACKEND')
+        if backend is not None:
+            return backend
+        url = app.config.get('RATELIMIT_STORAGE_URL') or 'memory://'
+        if url.startswith('redis://') or url.startswith('rediss://'):
+            try:
+                return RedisBackend(url)
+            except ImportError:
+                logger.warning("Paquete 'redis' no instalado: límites de peticiones en memoria por proceso")
+        return MemoryBackend(stripes=app.config.get('RATELIMIT_STRIPES', 64))
+
+    def _limit_for(self, name, default):
+        text = self.overrides.get(name, default)
+        parsed = self._parsed.get(text)
+        if parsed is None:
+            parsed = self._parsed[text] = parse_limit(text)
+        return parsed
+
+    def hit(self, name, key, limit, cost=1):
+        """
+        Consume de la cubeta `name`/`key` con el límite indicado (o su override).
+
+        Returns:
+            tuple: (permitido, segundos para reintentar)
+        """
+        rate, burst = self._limit_for(name, limit)
+        return self.backend.consume(f'{name}:{key}', rate, burst, cost)
+
+    def enforce(self, name, key, limit, cost=1):
+        """
+        Aplica un límite desde dentro de una vista (p. ej. después de
+        comprobar permisos, para que peticiones rechazadas no consuman).
+
+        Returns:
+            Response 429 si se superó el límite; None si se permite
+        """
+        if not self.enabled or key is None:
+            return None
+        allowed, retry_after = self.hit(name, key, limit, cost)
+        if not allowed:
+            return self._limited(name, key, retry_after)
+        return None
+
+    def limit(self, limit, by='user', methods=None, name=None, cost=1):
+        """
+        Decorador que limita una vista.
+
+        Args:
+            limit (str): p. ej. '20/second', '5/minute burst 10'
+            by (str|callable): 'user', 'ip', 'robot' o función que devuelve la clave
+                (None = no aplicar)
+            methods (tuple): Solo limitar estos métodos HTTP (p. ej. ('POST',))
+            name (str): Nombre de la cubeta; por defecto '<endpoint>:<by>'
+            cost (int): Tokens que consume cada petición
+        """
+        key_function = KEY_FUNCTIONS[by] if isinstance(by, str) else by
+        label = by if isinstance(by, str) else getattr(by, '__name__', 'custom')
+        parse_limit(limit)   # validar al importar
+
+        def decorator(view):
+            @wraps(view)
+            def wrapped(*args, **kwargs):
+                if self.enabled and (methods is None or request.method in methods):
+                    limited = self.enforce(name or f'{request.endpoint}:{label}', key_function(), limit, cost)
+                    if limited is not None:
+                        return limited
+                return view(*args, **kwargs)
+            return wrapped
+        return decorator
+
+    @staticmethod
+    def _limited(bucket, key, retry_after):
+        seconds = max(1, math.ceil(retry_after))
+        logger.warning(f"Límite de peticiones alcanzado: {bucket} ({key}), reintentar en {seconds}s")
+        if request.path.startswith('/api/') or request.is_json:
+            response = jsonify({'success': False,
+                                'error': 'Demasiadas solicitudes, intenta de nuevo en un momento.',
+                                'retry_after': seconds})
+        else:
+            response = current_app.make_response(
+                render_template('errors/429.html', title="Demasiadas solicitudes", retry_after=seconds))
+        response.status_code = 429
+        response.headers['Retry-After'] = str(seconds)
+        return response
+
+
+# Instancia global del limitador de peticiones
+rate_limiter = RateLimiter()
@@ -0,0 +1,255 @@
+# proyojo/app/reminder_occurrences.py
+
+import time
+import logging
+import calendar
+import threading
+from datetime import datetime, timedelta, time as dt_time
+from sqlalchemy import update, delete, or_, and_
+from sqlalchemy.exc import IntegrityError
+
+logger = logging.getLogger(__name__)
+
+# Reglas de repetición que generan más de una ocurrencia
+RECURRING = ('daily', 'weekly', 'monthly')
+STEPS = {'daily': timedelta(days=1), 'weekly': timedelta(weeks=1)}
+
+# Al materializar por primera vez una serie ya iniciada no se generan todas
+# sus fechas pasadas: solo las del último día (p. ej. la pastilla de esta
+# mañana que quedó pendiente).
+FIRST_BACKFILL = timedelta(days=1)
+
+
+def add_months(anchor, months):
+    """La misma fecha `months` meses después; el día se ajusta al fin de mes (31 -> 30)."""
+    month_index = anchor.month - 1 + months
+    year, month = anchor.year + month_index // 12, month_index % 12 + 1
+    day = min(anchor.day, calendar.monthrange(year, month)[1])
+    return anchor.replace(year=year, month=month, day=day)
+
+
+def nth_occurrence(anchor, repeat, n):
+    """
+    Ocurrencia n de una serie (0 = la fecha original).
+
+    Se calcula siempre desde el ancla y no desde la ocurrencia anterior,
+    así un recordatorio del día 31 vuelve al 31 después de febrero.
+    """
+    if repeat == 'monthly':
+        return add_months(anchor, n)
+    return anchor + STEPS[repeat] * n
+
+
+def first_index_after(anchor, repeat, after):
+    """Índice de la primera ocurrencia estrictamente posterior a `after`."""
+    if after < anchor:
+        return 0
+    if repeat == 'monthly':
+        n = (after.year - anchor.year) * 12 + after.month - anchor.month
+        while nth_occurrence(anchor, repeat, n) <= after:
+            n += 1
+        return n
+    return (after - anchor) // STEPS[repeat] + 1
+
+
+def occurrences_between(anchor, repeat, start, end):
+    """
+    Fechas de una serie en el intervalo (start, end].
+
+    Args:
+        anchor (datetime): Fecha original del recordatorio
+        repeat (str): 'once', 'daily', 'weekly' o 'monthly'
+        start (datetime): Límite inferior exclusivo; None incluye el ancla
+        end (datetime): Límite superior inclusivo
+    """
+    if repeat not in RECURRING:
+        if (start is None or anchor > start) and anchor <= end:
+            return [anchor]
+        return []
+
+    n = 0 if start is None else first_index_after(anchor, repeat, start)
+    dates = []
+    when = nth_occurrence(anchor, repeat, n)
+    while when <= end:
+        dates.append(when)
+        n += 1
+        when = nth_occurrence(anchor, repeat, n)
+    return dates
+
+
+class ReminderOccurrences:
+    """
+    Motor de ocurrencias de recordatorios.
+
+    Las series ('daily', 'weekly', 'monthly') se expanden en la tabla
+    reminder_occurrence hasta un horizonte móvil (REMINDER_WINDOW_DAYS).
+    Reminder.materialized_until guarda hasta dónde está generada cada
+    serie, de modo que extender la ventana solo agrega las fechas nuevas.
+    Un hilo en segundo plano la extiende y purga las ocurrencias antiguas;
+    las vistas solo hacen consultas por rango sobre el índice
+    (user_id, is_completed, occurs_at).
+    """
+
+    def __init__(self):
+        self.app = None
+        self.window_days = 30
+        self.retention_days = 90
+        self.interval = 3600
+        self._worker = None
+
+    def init_app(self, app, background=True):
+        """background=False (comandos CLI) no arranca el hilo que extiende la ventana."""
+        self.app = app
+        self.window_days = app.config.get('REMINDER_WINDOW_DAYS', self.window_days)
+        self.retention_days = app.config.get('REMINDER_OCCURRENCE_RETENTION_DAYS', self.retention_days)
+        self.interval = app.config.get('REMINDER_WINDOW_INTERVAL', self.interval)
+        if background and self._worker is None and self.interval:
+            self._worker = threading.Thread(target=self._run, name='reminder-window', daemon=True)
+            self._worker.start()
+
+    def horizon(self, now=None):
+        """
+        Fin de la ventana: la medianoche posterior a now + REMINDER_WINDOW_DAYS.
+
+        Al redondear al día, las ejecuciones del mismo día no vuelven a
+        tocar las series ya extendidas.
+        """
+        now = now or datetime.utcnow()
+        end_day = (now + timedelta(days=self.window_days)).date() + timedelta(days=1)
+        return datetime.combine(end_day, dt_time.min)
+
+    def extend(self, session, horizon=None, user_id=None, reminder_ids=None, batch_size=1000):
+        """
+        Genera las ocurrencias que faltan hasta el horizonte (sin commit).
+
+        Solo se leen las series nuevas (materialized_until vacío) y las
+        repetidas cuyo horizonte quedó atrás. Los recordatorios únicos se
+        materializan una vez con su estado de completado; una serie
+        repetida marcada como completada (comportamiento anterior) ya no
+        genera fechas nuevas.
+
+        Args:
+            session: Sesión de SQLAlchemy
+            horizon (datetime): Fin de la ventana; por defecto self.horizon()
+            user_id (int): Limitar a los recordatorios de un usuario
+            reminder_ids (list[int]): Limitar a ciertos recordatorios
+
+        Returns:
+            int: Ocurrencias insertadas
+        """
+        from app.models import Reminder, ReminderOccurrence
+        from app.database import bulk_insert
+        from app.response_cache import bump_version
+
+        now = datetime.utcnow()
+        horizon = horizon or self.horizon(now)
+
+        query = session.query(
+            Reminder.id, Reminder.user_id, Reminder.reminder_time, Reminder.repeat,
+            Reminder.is_completed, Reminder.completed_at, Reminder.materialized_until
+        ).filter(
+            Reminder.is_active == True,
+            or_(Reminder.materialized_until.is_(None),
+                and_(Reminder.repeat.in_(RECURRING),
+                     Reminder.is_completed == False,
+                     Reminder.materialized_until < horizon))
+        )
+        if user_id is not None:
+            query = query.filter(Reminder.user_id == user_id)
+        if reminder_ids is not None:
+            query = query.filter(Reminder.id.in_(reminder_ids))
+        series_list = query.order_by(Reminder.id).all()
+
+        table = ReminderOccurrence.__table__
+        rows, extended, touched = [], [], set()
+        inserted = 0
+        for series in series_list:
+            extended.append(series.id)
+            if series.repeat in RECURRING:
+                if series.is_completed:
+                    continue
+                start = series.materialized_until
+                if start is None:
+                    start = now - FIRST_BACKFILL
+                dates = occurrences_between(series.reminder_time, series.repeat, start, horizon)
+            else:
+                # Un recordatorio único se materializa aunque caiga fuera de la ventana
+                dates = [series.reminder_time]
+
+            for when in dates:
+                rows.append({
+                    'reminder_id': series.id,
+                    'user_id': series.user_id,
+                    'occurs_at': when,
+                    'is_completed': bool(series.is_completed),
+                    'completed_at': series.completed_at if series.is_completed else None,
+                })
+            if dates:
+                touched.add(series.user_id)
+            if len(rows) >= batch_size:
+                inserted += bulk_insert(session, table, rows)
+                rows = []
+        if rows:
+            inserted += bulk_insert(session, table, rows)
+
+        reminder_table = Reminder.__table__
+        connection = session.connection()
+        for start in range(0, len(extended), batch_size):
+            connection.execute(
+                update(reminder_table)
+                .where(reminder_table.c.id.in_(extended[start:start + batch_size]))
+                .values(materialized_until=horizon)
+            )
+
+        # Las inserciones en bloque no pasan por los eventos del ORM
+        for owner_id in touched:
+            bump_version(session, 'reminders', owner_id)
+        return inserted
+
+    def prune(self, session, now=None):
+        """
+        Elimina las ocurrencias anteriores al periodo de retención (sin commit).
+
+        Returns:
+            int: Ocurrencias eliminadas
+        """
+        from app.models import ReminderOccurrence
+
+        if not self.retention_days:
+            return 0
+        cutoff = (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+        table = ReminderOccurrence.__table__
+        result = session.connection().execute(delete(table).where(table.c.occurs_at < cutoff))
+        return result.rowcount
+
+    def refresh(self):
+        """Extiende la ventana y purga lo antiguo en una transacción."""
+        from app import db
+
+        try:
+            inserted = self.extend(db.session)
+            pruned = self.prune(db.session)
+            db.session.commit()
+        except IntegrityError:
+            # Otro proceso extendió las mismas series al mismo tiempo
+            db.session.rollback()
+            logger.info("Ventana de recordatorios extendida por otro proceso")
+            return 0, 0
+        if inserted or pruned:
+            logger.info(f"Ventana de recordatorios: {inserted} ocurrencias nuevas, {pruned} purgadas")
+        return inserted, pruned
+
+    def _run(self):
+        from app.database import db_writer
+
+        while True:
+            try:
+                # Las escrituras pasan por el escritor único (SQLite)
+                db_writer.submit(self.refresh).result()
+            except Exception as e:
+                logger.error(f"Error al extender la ventana de recordatorios: {str(e)}")
+            time.sleep(self.interval)
+
+
+# Instancia global del motor de ocurrencias
+reminder_occurrences = ReminderOccurrences()
@@ -0,0 +1,190 @@
+# proyojo/app/response_cache.py
+
+import time
+import hashlib
+import logging
+import threading
+from functools import wraps
+from collections import OrderedDict
+from flask import request, session, make_response, current_app
+from flask_login import current_user
+from sqlalchemy import event, update, insert, or_, and_
+
+logger = logging.getLogger(__name__)
+
+# Ámbito global (no ligado a un usuario), p. ej. la lista de robots
+GLOBAL = 0
+
+
+def bump_version(db_session, scope, user_id=GLOBAL):
+    """
+    Incrementa la versión de un ámbito dentro de la transacción actual.
+
+    Las versiones viven en la tabla cache_version, por lo que son
+    coherentes entre todos los procesos de trabajo.
+    """
+    from app.models import CacheVersion
+
+    table = CacheVersion.__table__
+    connection = db_session.connection()
+    result = connection.execute(
+        update(table)
+        .where(table.c.scope == scope, table.c.user_id == user_id)
+        .values(version=table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(table).values(scope=scope, user_id=user_id, version=1))
+
+
+def _scopes_for(obj):
+    """Ámbitos de caché afectados por un objeto modificado."""
+    from app.models import Contact, Reminder, ReminderOccurrence, Robot, User
+
+    if isinstance(obj, Contact):
+        return [('contacts', obj.user_id)]
+    if isinstance(obj, (Reminder, ReminderOccurrence)):
+        return [('reminders', obj.user_id)]
+    if isinstance(obj, Robot):
+        return [('robots', GLOBAL)]
+    if isinstance(obj, User):
+        return [('users', obj.id)]
+    return []
+
+
+class ByteLRU:
+    """LRU de respuestas renderizadas con un presupuesto máximo en bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()   # etag -> (body, mimetype)
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def put(self, key, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.size -= len(old[0])
+            self._items[key] = (body, mimetype)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (evicted, _) = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class ResponseCache:
+    """
+    Caché HTTP basado en versiones de datos (ETag / If-None-Match).
+
+    Cada vista declara de qué datos depende (contactos, recordatorios,
+    robots...). El ETag se calcula con las versiones de esos ámbitos, que
+    se incrementan en la misma transacción que cualquier escritura del ORM
+    (evento after_flush). Si el navegador ya tiene esa versión se responde
+    304 sin ejecutar la vista ni renderizar la plantilla. Opcionalmente las
+    respuestas se guardan en un LRU limitado por RESPONSE_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self):
+        self.enabled = True
+        self.lru = None
+        self._listening = False
+
+    def init_app(self, app, db):
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        max_bytes = app.config.get('RESPONSE_CACHE_MAX_BYTES', 0)
+        self.lru = ByteLRU(max_bytes) if max_bytes else None
+        if not self._listening:
+            event.listen(db.session, 'after_flush', self._after_flush)
+            self._listening = True
+
+    def _after_flush(self, db_session, flush_context):
+        scopes = set()
+        for obj in db_session.new | db_session.dirty | db_session.deleted:
+            scopes.update(_scopes_for(obj))
+        for scope, user_id in scopes:
+            if user_id is not None:
+                bump_version(db_session, scope, user_id)
+
+    def versions(self, keys):
+        """Versiones actuales de los ámbitos pedidos, en una sola consulta."""
+        from app.models import CacheVersion
+
+        rows = CacheVersion.query.filter(or_(*[
+            and_(CacheVersion.scope == scope, CacheVersion.user_id == user_id)
+            for scope, user_id in keys
+        ])).all()
+        found = {(row.scope, row.user_id): row.version for row in rows}
+        return [found.get(key, 0) for key in keys]
+
+    def conditional(self, *scopes, time_bucket=None):
+        """
+        Decorador para vistas GET cacheables.
+
+        Args:
+            scopes: Ámbitos de los que depende la vista. 'robots' es global;
+                el resto son del usuario actual ('contacts', 'reminders').
+            time_bucket (int): Segundos; para vistas con textos relativos al
+                tiempo ("En 2 horas"), el ETag cambia en cada intervalo.
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                # Con mensajes flash pendientes la vista debe ejecutarse para
+                # mostrarlos (y consumirlos); esa respuesta no se cachea
+                if not self.enabled or request.method != 'GET' or session.get('_flashes'):
+                    return view(*args, **kwargs)
+
+                etag = self._compute_etag(scopes, time_bucket)
+
+                if etag in request.if_none_match:
+                    response = current_app.response_class(status=304)
+                    self._set_headers(response, etag)
+                    return response
+
+                cached = self.lru.get(etag) if self.lru else None
+                if cached is not None:
+                    body, mimetype = cached
+                    response = current_app.response_class(body, mimetype=mimetype)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if self.lru and not response.is_streamed:
+                        self.lru.put(etag, response.get_data(), response.mimetype)
+
+                self._set_headers(response, etag)
+                return response
+            return wrapper
+        return decorator
+
+    def _compute_etag(self, scopes, time_bucket):
+        user_id = current_user.id if current_user.is_authenticated else None
+        keys = [(scope, GLOBAL if scope == 'robots' else user_id) for scope in scopes]
+        if user_id is not None:
+            # Cambios del propio usuario (roles, nombre) afectan a toda la página
+            keys.append(('users', user_id))
+        parts = [request.full_path, str(user_id)]
+        parts += [f'{scope}:{owner}:{version}'
+                  for (scope, owner), version in zip(keys, self.versions(keys))]
+        if time_bucket:
+            parts.append(str(int(time.time() // time_bucket)))
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _set_headers(response, etag):
+        response.set_etag(etag)
+        # El navegador guarda la copia pero siempre revalida con If-None-Match
+        response.headers['Cache-Control'] = 'private, no-cache'
+
+
+# Instancia global del caché de respuestas
+response_cache = ResponseCache()
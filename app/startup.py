@@ -0,0 +1,98 @@
+# proyojo/app/startup.py
+
+import os
+import sys
+import time
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Comandos de `flask` que sí levantan el servidor web completo
+WEB_COMMANDS = {'run'}
+# Comandos CLI que necesitan las rutas registradas desde el inicio
+ROUTE_COMMANDS = {'routes', 'shell'}
+# Comandos CLI que usan Flask-Migrate ('' = sin subcomando, p. ej. --help)
+MIGRATE_COMMANDS = {'db', 'shell', ''}
+# Opciones globales de `flask` que reciben un valor (--app run, -e .env)
+VALUE_OPTIONS = {'--app', '-A', '--env-file', '-e'}
+
+
+def cli_command():
+    """
+    Subcomando de `flask` en curso.
+
+    Flask carga la app antes de resolver el subcomando, así que se toma de
+    sys.argv. Devuelve None si la app no se carga desde la CLI de Flask y
+    '' si no hay subcomando.
+    """
+    import click
+    if click.get_current_context(silent=True) is None:
+        return None
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg in VALUE_OPTIONS:
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return ''
+
+
+def startup_mode(app):
+    """
+    Modo de arranque de la aplicación.
+
+    - 'web': servidor (python run.py, gunicorn, flask run). Conecta MQTT y
+      arranca los hilos en segundo plano.
+    - 'cli': cualquier otro comando de `flask` (db upgrade, seed-roles...).
+      No conecta MQTT ni arranca hilos; lo que haga falta se inicia al usarse.
+
+    Se puede forzar con STARTUP_MODE ('web' o 'cli'); por defecto se detecta
+    si la app se está cargando desde la línea de comandos de Flask.
+    """
+    mode = app.config.get('STARTUP_MODE') or 'auto'
+    if mode in ('web', 'cli'):
+        return mode
+
+    command = cli_command()
+    return 'web' if command is None or command in WEB_COMMANDS else 'cli'
+
+
+class StartupProfile:
+    """
+    Mide cuánto tarda cada fase de create_app y cuántos módulos importa.
+
+    El informe se registra al final del arranque si STARTUP_PROFILE está
+    activo, y lo usa `flask bench-startup` para comparar los modos.
+    """
+
+    def __init__(self):
+        self.phases = []    # (nombre, segundos, módulos importados)
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        modules = len(sys.modules)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start, len(sys.modules) - modules))
+
+    @property
+    def total(self):
+        return sum(seconds for _, seconds, _ in self.phases)
+
+    def as_dict(self):
+        return {
+            'pid': os.getpid(),
+            'total_ms': round(self.total * 1000, 2),
+            'phases': [{'name': name, 'ms': round(seconds * 1000, 2), 'modules': modules}
+                       for name, seconds, modules in self.phases],
+        }
+
+    def report(self):
+        lines = [f"Arranque en {self.total * 1000:.1f} ms"]
+        for name, seconds, modules in self.phases:
+            lines.append(f"  {name:<28} {seconds * 1000:8.1f} ms  +{modules} módulos")
+        return '\n'.join(lines)
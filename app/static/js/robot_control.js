@@ -20,6 +20,7 @@ class RobotController {
         console.log(`Controlador de robot inicializado - ID: ${this.robotId}`);
         this.attachEventListeners();
         this.startStatusPolling();
+        this.subscribePresence();
     }
     
     /**
@@ -134,7 +135,9 @@ class RobotController {
                 },
                 body: JSON.stringify({
                     action: action,
-                    value: value
+                    value: value,
+                    // Para medir la latencia navegador -> Flask (ver /api/robot/<id>/latency)
+                    sent_at: Date.now()
                 })
             });
             
@@ -210,6 +213,23 @@ class RobotController {
         }, 5000);
     }
     
+    /**
+     * Se suscribe a los cambios de presencia enviados por el servidor (SSE)
+     */
+    subscribePresence() {
+        if (typeof EventSource === 'undefined') {
+            return;
+        }
+        
+        const source = new EventSource('/api/presence/stream');
+        source.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            if (data.robot === this.mqttTopic) {
+                this.updateStatusDisplay({ is_online: data.online });
+            }
+        };
+    }
+    
     /**
      * Muestra feedback visual al usuario
      */
@@ -0,0 +1,119 @@
+# proyojo/app/telemetry.py
+
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class TelemetryIngestor:
+    """
+    Ingesta de telemetría de los robots (jojo/<serial>/telemetry).
+
+    Las lecturas se acumulan en memoria y se guardan por lotes con
+    bulk_insert (COPY en PostgreSQL, INSERT multi-fila en SQLite) a través
+    del escritor en segundo plano, nunca una fila por mensaje.
+    """
+
+    def __init__(self):
+        self.batch_size = 500
+        self.flush_interval = 2
+        self._lock = threading.Lock()
+        self._buffer = []   # (robot_key, sensor, value, recorded_at)
+        self._worker = None
+
+    def init_app(self, app):
+        self.batch_size = app.config.get('TELEMETRY_BATCH_SIZE', self.batch_size)
+        self.flush_interval = app.config.get('TELEMETRY_FLUSH_INTERVAL', self.flush_interval)
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='telemetry', daemon=True)
+            self._worker.start()
+
+    def add_reading(self, robot_key, sensor, value, recorded_at=None):
+        """Agrega una lectura al lote actual."""
+        with self._lock:
+            self._buffer.append((robot_key, sensor, value, recorded_at or datetime.utcnow()))
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+
+    def add_samples(self, robot_key, sensors, times, rows):
+        """
+        Agrega un lote de muestras ya decodificado (jojo/<serial>/telemetry/batch).
+
+        Args:
+            sensors (list[str]): Nombre de cada columna
+            times (list[datetime]): Momento de cada fila
+            rows (list[list[float]]): Valores por fila; NaN o None = sin lectura
+        """
+        readings = [(robot_key, sensor, float(value), recorded_at)
+                    for recorded_at, row in zip(times, rows)
+                    for sensor, value in zip(sensors, row)
+                    if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value]
+        with self._lock:
+            self._buffer.extend(readings)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+        return len(readings)
+
+    def handle_message(self, robot_key, payload, prefix=''):
+        """
+        Procesa un mensaje JSON de telemetría: {"sensor": valor, ...}.
+        Los valores no numéricos se ignoran; `prefix` se antepone al nombre
+        del sensor (p. ej. 'temperatura_' para jojo/<serial>/estado/temperatura).
+        """
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Telemetría no válida de {robot_key}: {payload}")
+            return
+        if not isinstance(data, dict):
+            return
+        now = datetime.utcnow()
+        for sensor, value in data.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                self.add_reading(robot_key, prefix + sensor, float(value), now)
+
+    def flush(self):
+        """Envía el lote acumulado al escritor en segundo plano."""
+        with self._lock:
+            if not self._buffer:
+                return None
+            batch, self._buffer = self._buffer, []
+
+        from app.database import db_writer
+        return db_writer.submit(_write_batch, batch)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error al guardar telemetría: {str(e)}")
+
+
+def _write_batch(batch):
+    """Resuelve los robots en una sola consulta e inserta el lote."""
+    from app import db
+    from app.database import bulk_insert
+    from app.models import Robot, Telemetry
+
+    keys = {robot_key for robot_key, _, _, _ in batch}
+    robot_ids = dict(
+        db.session.query(Robot.mqtt_topic, Robot.id).filter(Robot.mqtt_topic.in_(keys)).all()
+    )
+
+    rows = [{'robot_id': robot_ids[robot_key], 'sensor': sensor,
+             'value': value, 'recorded_at': recorded_at}
+            for robot_key, sensor, value, recorded_at in batch
+            if robot_key in robot_ids]
+    return bulk_insert(db.session, Telemetry.__table__, rows)
+
+
+# Instancia global de la ingesta de telemetría
+telemetry_ingestor = TelemetryIngestor()
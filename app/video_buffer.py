@@ -0,0 +1,373 @@
+# proyojo/app/video_buffer.py
+
+import os
+import re
+import json
+import mmap
+import time
+import struct
+import logging
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Archivo de segmento (tamaño fijo, mapeado en memoria):
+#   encabezado: magia | versión u16 | reservado u16 | cuadros u32 | inicio f64   (32 bytes)
+#   índice:     max_frames × (marca de tiempo f64 | desplazamiento u32 | longitud u32)
+#   datos:      los JPEG uno tras otro
+MAGIC = b'JJVB'
+HEADER = struct.Struct('<4sHHId')
+HEADER_SIZE = 32
+ENTRY = struct.Struct('<dII')
+
+CLIP_NAME = re.compile(r'^\d+-\d{8}-\d{6}-[a-z_]+$')
+
+
+class Segment:
+    """Segmento preasignado del búfer circular de una cámara."""
+
+    def __init__(self, path, size, max_frames):
+        self.path = path
+        self.size = size
+        self.max_frames = max_frames
+        self.data_start = HEADER_SIZE + max_frames * ENTRY.size
+        if self.data_start >= size:
+            raise ValueError(f'Segmento de {size} bytes demasiado pequeño para {max_frames} cuadros')
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+                if hasattr(os, 'posix_fallocate'):
+                    # Reservar los bloques ahora: el disco no crece después
+                    os.posix_fallocate(fd, 0, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._load()
+
+    def _load(self):
+        magic, version, _, count, start = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != 1 or count > self.max_frames:
+            self.reset(0.0)
+            return
+        self.count, self.start = count, start
+        self.used = self.data_start
+        if count:
+            _, offset, length = self.entry(count - 1)
+            self.used = offset + length
+
+    def reset(self, start):
+        self.count, self.start, self.used = 0, start, self.data_start
+        HEADER.pack_into(self.mm, 0, MAGIC, 1, 0, 0, start)
+
+    def append(self, timestamp, jpeg):
+        """Agrega un cuadro; False si el segmento está lleno."""
+        end = self.used + len(jpeg)
+        if self.count >= self.max_frames or end > self.size:
+            return False
+        self.mm[self.used:end] = jpeg
+        ENTRY.pack_into(self.mm, HEADER_SIZE + self.count * ENTRY.size, timestamp, self.used, len(jpeg))
+        self.count += 1
+        self.used = end
+        # El contador se escribe al final: un cuadro a medias nunca queda indexado
+        HEADER.pack_into(self.mm, 0, MAGIC, 1, 0, self.count, self.start)
+        return True
+
+    def entry(self, i):
+        return ENTRY.unpack_from(self.mm, HEADER_SIZE + i * ENTRY.size)
+
+    def entries(self):
+        return [self.entry(i) for i in range(self.count)]
+
+    def frame(self, offset, length):
+        return self.mm[offset:offset + length]
+
+    def close(self):
+        self.mm.close()
+
+
+class CameraBuffer:
+    """
+    Búfer circular en disco con los últimos minutos de una cámara.
+
+    Son `segments` archivos de tamaño fijo, mapeados en memoria; cada uno
+    cubre segment_seconds y al llenarse se reutiliza el más antiguo. El
+    índice (marca de tiempo, desplazamiento, longitud) vive en el propio
+    segmento, así el disco y la memoria no crecen con el tiempo y el búfer
+    sobrevive a un reinicio.
+    """
+
+    def __init__(self, directory, segments=10, segment_bytes=8 * 1024 * 1024,
+                 max_frames=300, segment_seconds=30):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self._lock = threading.Lock()
+        self.segments = [Segment(os.path.join(directory, f'seg-{i:02d}.bin'), segment_bytes, max_frames)
+                         for i in range(segments)]
+        # Continuar en el segmento más reciente
+        self.current = max(range(segments), key=lambda i: self.segments[i].start)
+
+    def append(self, timestamp, jpeg):
+        with self._lock:
+            segment = self.segments[self.current]
+            if segment.count and timestamp - segment.start < self.segment_seconds and \
+                    segment.append(timestamp, jpeg):
+                return True
+            if segment.count:
+                self.current = (self.current + 1) % len(self.segments)
+                segment = self.segments[self.current]
+            segment.reset(timestamp)
+            if not segment.append(timestamp, jpeg):
+                logger.warning(f"Cuadro de {len(jpeg)} bytes no cabe en un segmento de {self.directory}")
+                return False
+            return True
+
+    def frames_between(self, start, end):
+        """[(marca de tiempo, jpeg)] en [start, end], en orden cronológico."""
+        frames = []
+        with self._lock:
+            for segment in sorted(self.segments, key=lambda s: s.start):
+                if not segment.count:
+                    continue
+                for timestamp, offset, length in segment.entries():
+                    if start <= timestamp <= end:
+                        frames.append((timestamp, bytes(segment.frame(offset, length))))
+        return frames
+
+    def span(self):
+        """(primer cuadro, último cuadro, cuadros) disponibles en el búfer."""
+        with self._lock:
+            first = last = None
+            frames = 0
+            for segment in self.segments:
+                if not segment.count:
+                    continue
+                oldest, newest = segment.entry(0)[0], segment.entry(segment.count - 1)[0]
+                first = oldest if first is None else min(first, oldest)
+                last = newest if last is None else max(last, newest)
+                frames += segment.count
+            return first, last, frames
+
+    def close(self):
+        with self._lock:
+            for segment in self.segments:
+                segment.close()
+
+
+class VideoRecorder:
+    """
+    Grabación continua de las cámaras para revisar incidentes.
+
+    Cada robot con cámara tiene un CameraBuffer con los últimos
+    VIDEO_BUFFER_MINUTES minutos (a VIDEO_BUFFER_FPS cuadros por segundo),
+    alimentado por la lectura compartida de camera_feeds. save_clip()
+    guarda los VIDEO_CLIP_BEFORE segundos anteriores y los VIDEO_CLIP_AFTER
+    posteriores a un evento (llamada de emergencia o solicitud del
+    administrador) como un archivo MJPEG con su índice JSON:
+
+        <VIDEO_BUFFER_DIR>/clips/<robot>-<AAAAMMDD-HHMMSS>-<motivo>.mjpeg|.json
+
+    Los clips más antiguos se borran al superar VIDEO_CLIPS_MAX_MB.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.base_dir = None
+        self.fps = 5
+        self.minutes = 5
+        self.segments = 10
+        self.segment_bytes = 8 * 1024 * 1024
+        self.clip_before = 120
+        self.clip_after = 30
+        self.clips_max_bytes = 2048 * 1024 * 1024
+        self.refresh_interval = 60
+        self._buffers = {}     # robot_id -> CameraBuffer
+        self._listeners = {}   # robot_id -> función registrada en camera_feeds
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def init_app(self, app, background=True):
+        """background=False (comandos CLI) no abre las cámaras."""
+        self.app = app
+        self.enabled = app.config.get('VIDEO_BUFFER_ENABLED', False)
+        self.base_dir = app.config.get('VIDEO_BUFFER_DIR') or os.path.join(app.instance_path, 'video_buffer')
+        self.fps = app.config.get('VIDEO_BUFFER_FPS', self.fps)
+        self.minutes = app.config.get('VIDEO_BUFFER_MINUTES', self.minutes)
+        self.segments = app.config.get('VIDEO_BUFFER_SEGMENTS', self.segments)
+        self.segment_bytes = app.config.get('VIDEO_BUFFER_SEGMENT_MB', 8) * 1024 * 1024
+        self.clip_before = app.config.get('VIDEO_CLIP_BEFORE', self.clip_before)
+        self.clip_after = app.config.get('VIDEO_CLIP_AFTER', self.clip_after)
+        self.clips_max_bytes = app.config.get('VIDEO_CLIPS_MAX_MB', 2048) * 1024 * 1024
+        self.refresh_interval = app.config.get('VIDEO_CAMERA_REFRESH', self.refresh_interval)
+        if background and self.enabled and self._worker is None:
+            self._worker = threading.Thread(target=self._run, name='video-recorder', daemon=True)
+            self._worker.start()
+
+    @property
+    def clips_dir(self):
+        return os.path.join(self.base_dir, 'clips')
+
+    # --- Cámaras -----------------------------------------------------------
+
+    def _run(self):
+        while True:
+            try:
+                self.sync_cameras()
+            except Exception as e:
+                logger.error(f"Error al sincronizar las cámaras: {str(e)}")
+            time.sleep(self.refresh_interval)
+
+    def sync_cameras(self):
+        """Abre el búfer de cada robot activo con cámara y cierra los que ya no la tienen."""
+        from app.camera_feed import camera_feeds, active_cameras
+
+        robots = active_cameras(self.app)
+
+        for robot_id, url in robots.items():
+            feed = camera_feeds.get(robot_id)
+            if robot_id in self._listeners and feed is not None and feed.url == url:
+                continue
+            self.buffer(robot_id)
+            listener = self._listeners.get(robot_id) or self._make_listener(robot_id)
+            self._listeners[robot_id] = listener
+            camera_feeds.subscribe(robot_id, url, listener)
+
+        for robot_id in set(self._listeners) - set(robots):
+            camera_feeds.unsubscribe(robot_id, self._listeners.pop(robot_id))
+            with self._lock:
+                buffer = self._buffers.pop(robot_id, None)
+            if buffer is not None:
+                buffer.close()
+
+    def buffer(self, robot_id):
+        """Búfer de la cámara del robot (se crea al primer uso)."""
+        with self._lock:
+            buffer = self._buffers.get(robot_id)
+            if buffer is None:
+                segment_seconds = self.minutes * 60 / (self.segments - 1)
+                buffer = CameraBuffer(os.path.join(self.base_dir, str(robot_id)),
+                                      segments=self.segments, segment_bytes=self.segment_bytes,
+                                      # margen para cámaras que envían más rápido de lo esperado
+                                      max_frames=int(self.fps * segment_seconds * 1.5) + 1,
+                                      segment_seconds=segment_seconds)
+                self._buffers[robot_id] = buffer
+            return buffer
+
+    def _make_listener(self, robot_id):
+        interval = 1.0 / self.fps
+        last = [0.0]
+
+        def listener(timestamp, jpeg):
+            # Se guardan como máximo VIDEO_BUFFER_FPS cuadros por segundo
+            if timestamp - last[0] >= interval:
+                last[0] = timestamp
+                self.buffer(robot_id).append(timestamp, jpeg)
+        return listener
+
+    # --- Clips -------------------------------------------------------------
+
+    def save_clip(self, robot_id, reason, user_id=None, before=None, after=None, at=None):
+        """
+        Programa un clip alrededor de ahora (no bloquea).
+
+        Returns:
+            str: Nombre del clip, o None si el robot no tiene búfer de video
+        """
+        with self._lock:
+            if robot_id not in self._buffers:
+                return None
+        at = at or time.time()
+        before = self.clip_before if before is None else before
+        after = self.clip_after if after is None else after
+        reason = re.sub(r'[^a-z_]', '', reason.lower()) or 'manual'
+        name = f"{robot_id}-{datetime.utcfromtimestamp(at).strftime('%Y%m%d-%H%M%S')}-{reason}"
+        meta = {'name': name, 'robot_id': robot_id, 'reason': reason, 'user_id': user_id,
+                'at': at, 'start': at - before, 'end': at + after}
+        # Se escribe cuando ya pasaron los segundos posteriores al evento
+        timer = threading.Timer(max(0.0, at + after - time.time()), self._write_clip, (meta,))
+        timer.daemon = True
+        timer.start()
+        logger.info(f"Clip {name} programado ({before}s antes, {after}s después)")
+        return name
+
+    def _write_clip(self, meta):
+        try:
+            frames = self.buffer(meta['robot_id']).frames_between(meta['start'], meta['end'])
+            if not frames:
+                logger.warning(f"Clip {meta['name']} sin cuadros en el búfer")
+                return
+            os.makedirs(self.clips_dir, exist_ok=True)
+            base = os.path.join(self.clips_dir, meta['name'])
+            index, offset = [], 0
+            with open(base + '.mjpeg', 'wb') as f:
+                for timestamp, jpeg in frames:
+                    f.write(jpeg)
+                    index.append([round(timestamp, 3), offset, len(jpeg)])
+                    offset += len(jpeg)
+            meta.update(frames=index, size=offset)
+            with open(base + '.json', 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            logger.info(f"Clip {meta['name']} guardado: {len(index)} cuadros, {offset} bytes")
+            self.prune_clips()
+        except Exception as e:
+            logger.error(f"Error al guardar el clip {meta['name']}: {str(e)}")
+
+    def clips(self, robot_id=None):
+        """Clips guardados, del más reciente al más antiguo (sin el índice de cuadros)."""
+        if not self.base_dir or not os.path.isdir(self.clips_dir):
+            return []
+        clips = []
+        for filename in os.listdir(self.clips_dir):
+            name, ext = os.path.splitext(filename)
+            if ext != '.json' or not CLIP_NAME.match(name):
+                continue
+            if robot_id is not None and not name.startswith(f'{robot_id}-'):
+                continue
+            meta = self.clip_meta(name)
+            if meta is not None:
+                meta.pop('frames', None)
+                clips.append(meta)
+        return sorted(clips, key=lambda clip: clip['at'], reverse=True)
+
+    def clip_meta(self, name):
+        path = self.clip_path(name, '.json')
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            return None
+
+    def clip_path(self, name, ext='.mjpeg'):
+        """Ruta de un clip; None si el nombre no es válido (evita salir del directorio)."""
+        if not CLIP_NAME.match(name or ''):
+            return None
+        return os.path.join(self.clips_dir, name + ext)
+
+    def prune_clips(self):
+        """Borra los clips más antiguos hasta quedar bajo VIDEO_CLIPS_MAX_MB."""
+        clips = sorted(self.clips(), key=lambda clip: clip['at'])
+        total = sum(clip.get('size', 0) for clip in clips)
+        while clips and total > self.clips_max_bytes:
+            clip = clips.pop(0)
+            total -= clip.get('size', 0)
+            for ext in ('.mjpeg', '.json'):
+                path = self.clip_path(clip['name'], ext)
+                if os.path.exists(path):
+                    os.remove(path)
+            logger.info(f"Clip {clip['name']} eliminado por espacio")
+
+    def status(self):
+        """Estado de los búferes por robot: (primer cuadro, último cuadro, cuadros)."""
+        with self._lock:
+            buffers = dict(self._buffers)
+        return {robot_id: buffer.span() for robot_id, buffer in buffers.items()}
+
+
+# Instancia global del grabador de video
+video_recorder = VideoRecorder()
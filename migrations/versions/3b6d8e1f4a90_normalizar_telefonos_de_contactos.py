@@ -0,0 +1,56 @@
+"""normalizar telefonos de contactos (phone_normalized, phone_display)
+
+Revision ID: 3b6d8e1f4a90
+Revises: a7c04f2e9b13
+Create Date: 2026-10-19 12:48:10.227561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.phone_numbers import normalize_phone, format_phone
+
+
+# revision identifiers, used by Alembic.
+revision = '3b6d8e1f4a90'
+down_revision = 'a7c04f2e9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('contact', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('phone_normalized', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('phone_display', sa.String(length=30), nullable=True))
+        batch_op.create_index('ix_contact_user_phone_normalized', ['user_id', 'phone_normalized'], unique=False)
+
+    # Rellenar los contactos existentes
+    contact = sa.table('contact',
+        sa.column('id', sa.Integer),
+        sa.column('phone', sa.String),
+        sa.column('phone_normalized', sa.String),
+        sa.column('phone_display', sa.String)
+    )
+    connection = op.get_bind()
+    rows = connection.execute(sa.select(contact.c.id, contact.c.phone)).fetchall()
+    updates = []
+    for contact_id, phone in rows:
+        normalized = normalize_phone(phone)
+        updates.append({'contact_id': contact_id,
+                        'normalized': normalized,
+                        'display': format_phone(normalized, phone)})
+    if updates:
+        connection.execute(
+            contact.update()
+            .where(contact.c.id == sa.bindparam('contact_id'))
+            .values(phone_normalized=sa.bindparam('normalized'),
+                    phone_display=sa.bindparam('display')),
+            updates
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('contact', schema=None) as batch_op:
+        batch_op.drop_index('ix_contact_user_phone_normalized')
+        batch_op.drop_column('phone_display')
+        batch_op.drop_column('phone_normalized')
@@ -0,0 +1,31 @@
+"""agregar tabla admin_counter para estadisticas del panel
+
+Revision ID: 5e9a13c7b802
+Revises: d41b7e6a0c25
+Create Date: 2026-10-19 11:40:05.663921
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e9a13c7b802'
+down_revision = 'd41b7e6a0c25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('admin_counter',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Los valores iniciales se calculan con count() en la primera lectura
+    # (AdminStats.reconcile)
+
+
+def downgrade():
+    op.drop_table('admin_counter')
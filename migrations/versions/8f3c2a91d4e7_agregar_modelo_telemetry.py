@@ -0,0 +1,37 @@
+"""agregar modelo telemetry para lecturas de sensores
+
+Revision ID: 8f3c2a91d4e7
+Revises: 0a94135a4078
+Create Date: 2026-10-19 10:12:31.402117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3c2a91d4e7'
+down_revision = '0a94135a4078'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('telemetry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('robot_id', sa.Integer(), nullable=False),
+    sa.Column('sensor', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Float(), nullable=True),
+    sa.Column('recorded_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['robot_id'], ['robot.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('telemetry', schema=None) as batch_op:
+        batch_op.create_index('ix_telemetry_robot_recorded', ['robot_id', 'recorded_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('telemetry', schema=None) as batch_op:
+        batch_op.drop_index('ix_telemetry_robot_recorded')
+
+    op.drop_table('telemetry')
@@ -0,0 +1,26 @@
+"""indice en contact.user_id para la agenda por secciones
+
+Revision ID: a7c04f2e9b13
+Revises: 5e9a13c7b802
+Create Date: 2026-10-19 12:15:38.904412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7c04f2e9b13'
+down_revision = '5e9a13c7b802'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('contact', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_contact_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('contact', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_contact_user_id'))
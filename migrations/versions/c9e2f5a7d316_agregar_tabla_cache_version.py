@@ -0,0 +1,29 @@
+"""agregar tabla cache_version para etag de paginas
+
+Revision ID: c9e2f5a7d316
+Revises: 3b6d8e1f4a90
+Create Date: 2026-10-19 13:30:52.581774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e2f5a7d316'
+down_revision = '3b6d8e1f4a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('scope', sa.String(length=30), nullable=False),
+    sa.Column('user_id', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope', 'user_id')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
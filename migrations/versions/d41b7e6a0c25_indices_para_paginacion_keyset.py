@@ -0,0 +1,32 @@
+"""indices para paginacion keyset de usuarios y robots
+
+Revision ID: d41b7e6a0c25
+Revises: 8f3c2a91d4e7
+Create Date: 2026-10-19 11:02:47.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41b7e6a0c25'
+down_revision = '8f3c2a91d4e7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_created_at_id', ['created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('robot', schema=None) as batch_op:
+        batch_op.create_index('ix_robot_created_at_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('robot', schema=None) as batch_op:
+        batch_op.drop_index('ix_robot_created_at_id')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_created_at_id')
@@ -0,0 +1,49 @@
+"""agregar tabla reminder_occurrence y reminder.materialized_until
+
+Las ocurrencias de los recordatorios existentes las genera el motor
+(app/reminder_occurrences.py) en su primera pasada, porque quedan con
+materialized_until vacío.
+
+Revision ID: e6b3d9a4f217
+Revises: c9e2f5a7d316
+Create Date: 2026-10-19 15:12:08.406913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b3d9a4f217'
+down_revision = 'c9e2f5a7d316'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('reminder_occurrence',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('reminder_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('occurs_at', sa.DateTime(), nullable=False),
+    sa.Column('is_completed', sa.Boolean(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['reminder_id'], ['reminder.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('reminder_id', 'occurs_at', name='uq_reminder_occurrence')
+    )
+    with op.batch_alter_table('reminder_occurrence', schema=None) as batch_op:
+        batch_op.create_index('ix_reminder_occurrence_user_pending', ['user_id', 'is_completed', 'occurs_at'], unique=False)
+
+    with op.batch_alter_table('reminder', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('materialized_until', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('reminder', schema=None) as batch_op:
+        batch_op.drop_column('materialized_until')
+
+    with op.batch_alter_table('reminder_occurrence', schema=None) as batch_op:
+        batch_op.drop_index('ix_reminder_occurrence_user_pending')
+
+    op.drop_table('reminder_occurrence')
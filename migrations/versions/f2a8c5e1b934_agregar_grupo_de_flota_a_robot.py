@@ -0,0 +1,28 @@
+"""agregar robot.fleet_group para comandos a la flota
+
+Revision ID: f2a8c5e1b934
+Revises: e6b3d9a4f217
+Create Date: 2026-10-19 18:47:21.904652
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a8c5e1b934'
+down_revision = 'e6b3d9a4f217'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('robot', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('fleet_group', sa.String(length=50), nullable=True))
+        batch_op.create_index('ix_robot_fleet_group', ['fleet_group'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('robot', schema=None) as batch_op:
+        batch_op.drop_index('ix_robot_fleet_group')
+        batch_op.drop_column('fleet_group')
@@ -0,0 +1,79 @@
+# proyojo/tests/test_camera_feed.py
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.camera_feed import CameraFeed, iter_jpeg_frames
+
+# Del tamaño de un cuadro real: iter_jpeg_frames lee en bloques de 16 KiB
+FRAME = b'\xff\xd8' + b'jojo' * 5000 + b'\xff\xd9'
+
+
+class _MjpegHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        self.end_headers()
+        try:
+            while True:
+                self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + FRAME + b'\r\n')
+                self.wfile.flush()
+                time.sleep(0.01)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def camera_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _MjpegHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}/stream'
+    server.shutdown()
+    server.server_close()
+
+
+def _receives_frame(feed, timeout=5):
+    received = threading.Event()
+    listener = lambda timestamp, jpeg: received.set()
+    feed.add_listener(listener)
+    try:
+        return received.wait(timeout)
+    finally:
+        feed.remove_listener(listener)
+
+
+def test_iter_jpeg_frames_splits_stream():
+    class Stream:
+        chunks = [b'--frame\r\n' + FRAME[:5], FRAME[5:] + b'\r\n--frame\r\n' + FRAME, b'']
+
+        def read(self, size):
+            return self.chunks.pop(0)
+
+    assert list(iter_jpeg_frames(Stream())) == [FRAME, FRAME]
+
+
+def test_reader_stops_without_listeners_and_restarts(camera_url):
+    feed = CameraFeed(1, camera_url, timeout=2)
+    assert _receives_frame(feed)
+
+    deadline = time.time() + 5
+    while feed._thread is not None and time.time() < deadline:
+        time.sleep(0.01)
+    assert feed._thread is None
+
+    assert _receives_frame(feed)
+
+
+def test_rejoining_while_reader_exits_gets_frames(camera_url):
+    feed = CameraFeed(1, camera_url, timeout=2)
+    # Alta inmediatamente después de la baja: la salida del hilo compite
+    # con la nueva suscripción y ningún espectador debe quedarse sin cuadros
+    for _ in range(20):
+        assert _receives_frame(feed)
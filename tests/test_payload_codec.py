@@ -0,0 +1,33 @@
+# proyojo/tests/test_payload_codec.py
+
+import json
+from datetime import datetime
+
+import pytest
+
+from app.payload_codec import CodecError, decode_json_batch
+
+
+def test_decode_json_batch():
+    text = json.dumps({'t0': 0, 'dt': 500, 'sensors': ['bateria', 'temperatura'],
+                       'samples': [[87.5, 21.0], [87.0, None]]})
+    sensors, times, samples = decode_json_batch(text)
+    assert sensors == ['bateria', 'temperatura']
+    assert times == [datetime(1970, 1, 1), datetime(1970, 1, 1, 0, 0, 0, 500000)]
+    assert samples == [[87.5, 21.0], [87.0, None]]
+
+
+@pytest.mark.parametrize('batch', [
+    {'t0': 1e300, 'sensors': ['bateria'], 'samples': [[1]]},
+    {'t0': 0, 'dt': 1e300, 'sensors': ['bateria'], 'samples': [[1], [2]]},
+    {'t0': 'inf', 'sensors': ['bateria'], 'samples': [[1]]},
+    {'t0': 'nan', 'sensors': ['bateria'], 'samples': [[1]]},
+    {'t0': 0, 'sensors': ['bateria'], 'samples': 5},
+    {'t0': 0, 'sensors': ['bateria'], 'samples': [1, 2]},
+    {'t0': 0, 'sensors': 'bateria', 'samples': [[1]]},
+    {'sensors': ['bateria'], 'samples': [[1]]},
+    [1, 2],
+])
+def test_invalid_json_batches_raise_codec_error(batch):
+    with pytest.raises(CodecError):
+        decode_json_batch(json.dumps(batch))
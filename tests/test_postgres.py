@@ -0,0 +1,114 @@
+# proyojo/tests/test_postgres.py
+#
+# Pruebas del perfil de producción contra un PostgreSQL local.
+# Se omiten si TEST_DATABASE_URL (ver conftest.py) no responde.
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+
+def _setting(connection, name):
+    """Valor de un parámetro de la sesión en sus unidades base (ms para los tiempos)."""
+    return connection.execute(text('SELECT setting FROM pg_settings WHERE name = :name'),
+                              {'name': name}).scalar()
+
+
+def test_engine_options(app):
+    from app import db
+    from config import ProductionConfig
+
+    with app.app_context():
+        engine = db.engine
+        assert engine.dialect.name == 'postgresql'
+        assert engine.pool.size() == ProductionConfig.DB_POOL_SIZE
+        assert engine.pool._max_overflow == ProductionConfig.DB_MAX_OVERFLOW
+        assert engine.pool._timeout == ProductionConfig.DB_POOL_TIMEOUT
+        assert engine.pool._recycle == ProductionConfig.DB_POOL_RECYCLE
+        assert engine.pool._pre_ping is True
+
+        with engine.connect() as connection:
+            assert _setting(connection, 'application_name') == 'jojo_web_app'
+            assert int(_setting(connection, 'statement_timeout')) == ProductionConfig.DB_STATEMENT_TIMEOUT
+            assert int(_setting(connection, 'idle_in_transaction_session_timeout')) == \
+                ProductionConfig.DB_IDLE_TX_TIMEOUT
+
+
+def test_statement_timeout_cancels_slow_queries(make_config):
+    from app import create_app, db
+    from config import ProductionConfig
+
+    options = dict(ProductionConfig.SQLALCHEMY_ENGINE_OPTIONS)
+    options['connect_args'] = dict(options['connect_args'], options='-c statement_timeout=100')
+    app = create_app(make_config(SQLALCHEMY_ENGINE_OPTIONS=options))
+
+    with app.app_context():
+        try:
+            with db.engine.connect() as connection:
+                with pytest.raises(OperationalError, match='statement timeout'):
+                    connection.execute(text('SELECT pg_sleep(1)'))
+        finally:
+            db.engine.dispose()
+
+
+def test_missing_database_url_fails_fast(monkeypatch):
+    from app import create_app
+    from config import ProductionConfig
+
+    monkeypatch.setattr(ProductionConfig, 'SQLALCHEMY_DATABASE_URI', None)
+    with pytest.raises(RuntimeError, match='DATABASE_URL'):
+        create_app(ProductionConfig)
+
+
+def test_bulk_insert_uses_copy(app, robot_id):
+    from app import db
+    from app.database import bulk_insert
+    from app.models import Telemetry
+
+    rows = [{'robot_id': robot_id, 'sensor': sensor, 'value': value,
+             'recorded_at': datetime(2026, 1, 1, 12, 0, i)}
+            for i, (sensor, value) in enumerate([('bateria', 87.5), ('temp,"sala"', None), ('ultrasonico', 0.0)])]
+
+    with app.app_context():
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            assert bulk_insert(db.session, Telemetry.__table__, rows) == len(rows)
+            db.session.commit()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+
+        # COPY va directo al cursor: SQLAlchemy no llega a emitir ningún INSERT
+        assert not [s for s in statements if s.lstrip().upper().startswith('INSERT')]
+
+        stored = Telemetry.query.order_by(Telemetry.recorded_at).all()
+        assert [(t.sensor, t.value) for t in stored] == [(r['sensor'], r['value']) for r in rows]
+        assert stored[0].recorded_at == rows[0]['recorded_at']
+
+
+def test_database_writer_commits_and_rolls_back(app, robot_id):
+    from app import db
+    from app.database import db_writer
+    from app.models import Telemetry
+
+    def write(value):
+        db.session.add(Telemetry(robot_id=robot_id, sensor='bateria', value=value))
+        return value
+
+    def fail():
+        db.session.add(Telemetry(robot_id=robot_id, sensor='bateria', value=-1))
+        db.session.flush()
+        raise ValueError('fallo de escritura')
+
+    assert db_writer.submit(write, 42.0).result(timeout=10) == 42.0
+    with pytest.raises(ValueError):
+        db_writer.submit(fail).result(timeout=10)
+    # El escritor sigue funcionando tras un error
+    assert db_writer.submit(write, 43.0).result(timeout=10) == 43.0
+
+    with app.app_context():
+        values = sorted(t.value for t in Telemetry.query.all())
+        assert values == [42.0, 43.0]
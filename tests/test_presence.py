@@ -0,0 +1,49 @@
+# proyojo/tests/test_presence.py
+
+from app.presence import PresenceTracker
+
+
+def _robots_version(app):
+    from app.response_cache import response_cache, GLOBAL
+
+    with app.app_context():
+        return response_cache.versions([('robots', GLOBAL)])[0]
+
+
+def test_heartbeat_only_bumps_robots_version_on_visible_changes(sqlite_app):
+    from app import db
+    from app.models import Robot
+
+    with sqlite_app.app_context():
+        db.session.add(Robot(name='Carl', serial_number='CARL-001', mqtt_topic='jojo/carl-001'))
+        db.session.commit()
+
+    tracker = PresenceTracker()
+    tracker.app = sqlite_app
+
+    tracker.heartbeat('jojo/carl-001', battery_level=80)
+    tracker._flush().result(timeout=10)
+    version = _robots_version(sqlite_app)
+
+    # Latidos sin cambios: se guarda last_seen, pero la caché sigue válida
+    for _ in range(3):
+        tracker.heartbeat('jojo/carl-001')
+        tracker._flush().result(timeout=10)
+        tracker.heartbeat('jojo/carl-001', battery_level=80)
+        tracker._flush().result(timeout=10)
+    assert _robots_version(sqlite_app) == version
+
+    tracker.heartbeat('jojo/carl-001', battery_level=79)
+    tracker._flush().result(timeout=10)
+    assert _robots_version(sqlite_app) > version
+    version = _robots_version(sqlite_app)
+
+    tracker.set_offline('jojo/carl-001')
+    tracker._flush().result(timeout=10)
+    assert _robots_version(sqlite_app) > version
+
+    with sqlite_app.app_context():
+        robot = Robot.query.filter_by(mqtt_topic='jojo/carl-001').one()
+        assert robot.is_online is False
+        assert robot.battery_level == 79
+        assert robot.last_seen is not None
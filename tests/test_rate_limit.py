@@ -0,0 +1,26 @@
+# proyojo/tests/test_rate_limit.py
+
+import pytest
+
+from app.rate_limit import MemoryBackend, RedisBackend, parse_limit
+
+
+def test_memory_backend_bucket():
+    backend = MemoryBackend()
+    rate, burst = parse_limit('1/second burst 2')
+    assert backend.consume('k', rate, burst, now=0.0) == (True, 0.0)
+    assert backend.consume('k', rate, burst, now=0.0) == (True, 0.0)
+    allowed, retry = backend.consume('k', rate, burst, now=0.0)
+    assert not allowed and retry == pytest.approx(1.0)
+    assert backend.consume('k', rate, burst, now=1.0)[0]
+
+
+def test_redis_outage_falls_back_to_memory():
+    pytest.importorskip('redis')
+
+    # Nada escucha en el puerto 1: cada petición iría a un error de conexión
+    backend = RedisBackend('redis://127.0.0.1:1/0', timeout=0.2)
+    rate, burst = parse_limit('1/minute burst 2')
+    results = [backend.consume('api.llamar:u1', rate, burst)[0] for _ in range(3)]
+    # No se lanza la excepción y el límite se sigue aplicando en el proceso
+    assert results == [True, True, False]
@@ -0,0 +1,70 @@
+# proyojo/tests/test_reminders.py
+#
+# Ocurrencias de recordatorios sobre SQLite (sin foreign_keys: el ORM
+# debe borrar las ocurrencias de un recordatorio eliminado).
+
+from datetime import datetime, timedelta
+
+
+def _user(username):
+    from app import db
+    from app.models import User
+
+    user = User(username=username, email=f'{username}@jojo.test')
+    user.set_password('x')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def _daily_reminder(user, reminder_time):
+    from app import db
+    from app.models import Reminder
+    from app.reminder_occurrences import reminder_occurrences
+
+    reminder = Reminder(title='Medicina', reminder_time=reminder_time, repeat='daily', user_id=user.id)
+    db.session.add(reminder)
+    db.session.flush()
+    reminder_occurrences.extend(db.session, reminder_ids=[reminder.id])
+    db.session.commit()
+    return reminder
+
+
+def test_deleted_reminder_id_reuse_starts_clean(sqlite_app):
+    from app import db
+    from app.models import ReminderOccurrence
+
+    start = (datetime.utcnow() + timedelta(hours=1)).replace(second=0, microsecond=0)
+    with sqlite_app.app_context():
+        user = _user('ana')
+        reminder = _daily_reminder(user, start)
+        old_id = reminder.id
+        first = reminder.occurrences.order_by(ReminderOccurrence.occurs_at).first()
+        first.is_completed = True
+        db.session.commit()
+
+        db.session.delete(reminder)
+        db.session.commit()
+        assert ReminderOccurrence.query.filter_by(reminder_id=old_id).count() == 0
+
+        # SQLite reutiliza el id liberado: la serie nueva (misma hora) no
+        # choca con uq_reminder_occurrence ni hereda ocurrencias completadas
+        reminder = _daily_reminder(user, start)
+        assert reminder.id == old_id
+        occurrences = reminder.occurrences.all()
+        assert occurrences
+        assert not any(o.is_completed for o in occurrences)
+
+
+def test_deleted_user_leaves_no_occurrences(sqlite_app):
+    from app import db
+    from app.models import ReminderOccurrence
+
+    with sqlite_app.app_context():
+        user = _user('beto')
+        _daily_reminder(user, datetime.utcnow() + timedelta(hours=1))
+        assert ReminderOccurrence.query.count() > 0
+
+        db.session.delete(user)
+        db.session.commit()
+        assert ReminderOccurrence.query.count() == 0